@@ -63,12 +63,17 @@ class TiledGISLabelSerializer(serializers.ModelSerializer):
     """GIS label serializer"""
     category = CategoryTypeSerializer()
     parent_raster = RasterImageSerializer()
+    geometry = serializers.SerializerMethodField()
     
     class Meta:
         model = TiledGISLabel
         fields = ['id', 'northeast_lat', 'northeast_lng', 'southwest_lat', 
                  'southwest_lng', 'zoom_level', 'category', 'label_json',
-                 'label_type', 'parent_raster', 'pub_date']
+                 'label_type', 'parent_raster', 'pub_date', 'geometry']
+        
+    def get_geometry(self, obj):
+        """GeoJSON geometry decoded from the stored WKB"""
+        return obj.geojson
         
     def validate_label_json(self, value):
         """Validate GeoJSON format"""
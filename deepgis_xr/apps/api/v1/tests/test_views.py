@@ -1,10 +1,17 @@
 import json
+import os
+import tempfile
+import time
+import uuid
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from deepgis_xr.apps.api.v1.views.training import (
+    purge_region_results, record_region_owner, region_owner_path, region_result_path
+)
 from deepgis_xr.apps.core.models import (
     RasterImage, CategoryType, TiledGISLabel, Labeler
 )
@@ -70,6 +77,161 @@ class PredictionAPITests(BaseAPITest):
         )
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_predict_tile_non_numeric_bounds(self):
+        """Test bounds that are not four numbers are rejected before reading the raster"""
+        url = reverse('predict_tile')
+        for bounds in (['a', 'b', 'c', 'd'], 5, '1234', [0, 0, 1, None]):
+            response = self.client.post(
+                url,
+                data=json.dumps({'bounds': bounds, 'raster_id': self.raster.id}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_predict_region_invalid_overlap(self):
+        """Test region prediction with overlap larger than the tile"""
+        url = reverse('predict_region')
+        data = {
+            'bounds': [0, 0, 100, 100],
+            'raster_id': self.raster.id,
+            'tile_size': 256,
+            'overlap': 256
+        }
+        
+        response = self.client.post(
+            url,
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        
+    def test_submit_region_prediction_missing_bounds(self):
+        """Test async region prediction rejects incomplete requests"""
+        url = reverse('submit_region_prediction')
+        data = {'raster_id': self.raster.id}
+        
+        response = self.client.post(
+            url,
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_region_prediction_status_invalid_task(self):
+        """Test status lookup of a malformed task id"""
+        url = reverse('get_region_prediction_status', args=['not-a-task'])
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_region_results_require_recorded_owner(self):
+        """Test region results are only served to the user recorded at submission"""
+        task_id = str(uuid.uuid4())
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            path = region_result_path(task_id)
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('{}\n')
+            url = reverse('download_region_prediction', args=[task_id])
+            
+            # No owner recorded: denied even though results exist
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+            
+            other = User.objects.create_user(username='other', password='otherpass')
+            record_region_owner(task_id, other.id)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+            
+            record_region_owner(task_id, self.user.id)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b''.join(response.streaming_content), b'{}\n')
+            response.close()
+            
+            # Expired results and owner records are purged
+            old = time.time() - 2 * 24 * 3600
+            for stale in (path, region_owner_path(task_id)):
+                os.utime(stale, (old, old))
+            self.assertEqual(purge_region_results(max_age=24 * 3600), 2)
+            self.assertEqual(os.listdir(os.path.dirname(path)), [])
+        
+    def test_save_predictions_reports_feature_errors(self):
+        """Test valid features are saved in bulk and invalid ones reported"""
+        Labeler.objects.create(user=self.user)
+        CategoryType.objects.create(category_name='Buildings')
+        square = [[[10, 20], [11, 20], [11, 21], [10, 21], [10, 20]]]
+        features = [
+            {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': square},
+             'properties': {'category': 'Buildings'}},
+            {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': square},
+             'properties': {'category': 'Unknown'}},
+            {'type': 'Feature', 'properties': {'category': 'Buildings'}},
+        ]
+        
+        response = self.client.post(
+            reverse('save_predictions'),
+            data=json.dumps({
+                'raster_id': self.raster.id,
+                'predictions': {'type': 'FeatureCollection', 'features': features}
+            }),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(len(body['created_labels']), 1)
+        self.assertEqual([error['index'] for error in body['errors']], [1, 2])
+        label = TiledGISLabel.objects.get(id=body['created_labels'][0])
+        self.assertEqual(float(label.southwest_lng), 10)
+        self.assertEqual(float(label.northeast_lat), 21)
+
+class LabelAPITests(BaseAPITest):
+    """Test label query endpoints"""
+    
+    def test_labels_in_bbox(self):
+        """Test viewport query with a category filter"""
+        buildings = CategoryType.objects.create(category_name='Buildings')
+        roads = CategoryType.objects.create(category_name='Roads')
+        for category, offset in ((buildings, 0), (roads, 0), (buildings, 50)):
+            TiledGISLabel.objects.create(
+                category=category,
+                southwest_lng=offset, southwest_lat=offset,
+                northeast_lng=offset + 1, northeast_lat=offset + 1,
+                label_json={'type': 'Feature', 'properties': {}}, geometry=None
+            )
+        
+        response = self.client.get(reverse('labels_in_bbox'), {
+            'bbox': '-1,-1,2,2',
+            'category': 'Buildings'
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        features = response.json()['labels']['features']
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]['properties']['category'], 'Buildings')
+        
+    def test_labels_in_bbox_truncated(self):
+        """Test truncated is only set when more labels match than the limit"""
+        for offset in range(3):
+            TiledGISLabel.objects.create(
+                southwest_lng=offset, southwest_lat=0,
+                northeast_lng=offset + 0.5, northeast_lat=0.5,
+                label_json={'type': 'Feature', 'properties': {}}, geometry=None
+            )
+        
+        for limit, count, truncated in ((3, 3, False), (2, 2, True)):
+            response = self.client.get(reverse('labels_in_bbox'), {'bbox': '-1,-1,5,5', 'limit': limit})
+            body = response.json()
+            self.assertEqual(len(body['labels']['features']), count)
+            self.assertEqual(body['truncated'], truncated)
+        
+    def test_labels_in_bbox_invalid_bbox(self):
+        """Test malformed viewports are rejected"""
+        response = self.client.get(reverse('labels_in_bbox'), {'bbox': '2,2,1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 class TrainingAPITests(BaseAPITest):
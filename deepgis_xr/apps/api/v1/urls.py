@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import prediction, training
+from .views import labels, prediction, training
 
 urlpatterns = [
     # Prediction endpoints
@@ -8,10 +8,31 @@ urlpatterns = [
          prediction.predict_tile, 
          name='predict_tile'),
     
+    path('predict/region/',
+         prediction.predict_region,
+         name='predict_region'),
+    
+    path('predict/region/submit/',
+         prediction.submit_region_prediction,
+         name='submit_region_prediction'),
+    
+    path('predict/region/status/<str:task_id>/',
+         prediction.get_region_prediction_status,
+         name='get_region_prediction_status'),
+    
+    path('predict/region/result/<str:task_id>/',
+         prediction.download_region_prediction,
+         name='download_region_prediction'),
+    
     path('predict/save/', 
          prediction.save_predictions, 
          name='save_predictions'),
     
+    # Label endpoints
+    path('labels/in-bbox/',
+         labels.labels_in_bbox,
+         name='labels_in_bbox'),
+    
     # Training endpoints  
     path('train/start/',
          training.start_training,
@@ -0,0 +1,87 @@
+import itertools
+from typing import List
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from deepgis_xr.apps.core.models import TiledGISLabel
+from deepgis_xr.apps.core.utils.spatial import iter_labels_in_bounds
+
+
+def parse_bbox(value: str) -> List[float]:
+    """'minx,miny,maxx,maxy' to floats, raising ValueError on bad input"""
+    bbox = [float(v) for v in value.split(',')]
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError("bbox must be minx,miny,maxx,maxy")
+    return bbox
+
+
+@require_GET
+@login_required
+def labels_in_bbox(request) -> JsonResponse:
+    """TiledGISLabels whose bbox intersects a viewport
+
+    Query parameters: bbox=minx,miny,maxx,maxy (required), category (name),
+    raster_id and limit. Candidates come from the in-memory R-tree and are
+    confirmed against the bbox columns in the database.
+    """
+    try:
+        bbox = parse_bbox(request.GET.get('bbox', ''))
+        max_limit = getattr(settings, 'LABEL_QUERY_MAX_LIMIT', 10000)
+        limit = min(int(request.GET.get('limit', max_limit)), max_limit)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        raster_id = request.GET.get('raster_id')
+        raster_id = int(raster_id) if raster_id else None
+    except ValueError as e:
+        return JsonResponse({
+            "status": "failure",
+            "message": str(e)
+        }, status=400)
+
+    try:
+        queryset = TiledGISLabel.objects.select_related('category')
+        if raster_id is not None:
+            queryset = queryset.filter(parent_raster_id=raster_id)
+        if request.GET.get('category'):
+            queryset = queryset.filter(category__category_name=request.GET['category'])
+
+        # One match past the limit tells whether the result was truncated
+        labels = list(itertools.islice(iter_labels_in_bounds(bbox, queryset), limit + 1))
+        features = []
+        for label in labels[:limit]:
+            feature = dict(label.label_json) if isinstance(label.label_json, dict) else {}
+            feature.update({
+                "type": "Feature",
+                "id": label.id,
+                "geometry": feature.get("geometry") or label.geojson,
+                "bbox": [
+                    float(label.southwest_lng), float(label.southwest_lat),
+                    float(label.northeast_lng), float(label.northeast_lat)
+                ]
+            })
+            properties = dict(feature.get("properties") or {})
+            properties.update({
+                "category": label.category.category_name if label.category else None,
+                "raster_id": label.parent_raster_id,
+            })
+            feature["properties"] = properties
+            features.append(feature)
+
+        return JsonResponse({
+            "status": "success",
+            # More labels match than were returned
+            "truncated": len(labels) > limit,
+            "labels": {
+                "type": "FeatureCollection",
+                "features": features
+            }
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            "status": "failure",
+            "message": str(e)
+        }, status=500)
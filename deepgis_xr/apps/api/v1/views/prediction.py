@@ -1,16 +1,27 @@
 from typing import Dict, Any
 import json
+import os
+import uuid
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth.decorators import login_required
 import rasterio
 from rasterio.windows import Window
-from rasterio.transform import from_bounds
 
 from deepgis_xr.apps.core.models import RasterImage, CategoryType, TiledGISLabel, Labeler
-from deepgis_xr.apps.ml.services.predictor import MaskRCNNPredictor
+from deepgis_xr.apps.core.utils.utils import plan_grid, plan_read, read_tile, read_window
+from deepgis_xr.apps.ml.services.cache import filter_predictions, prediction_cache
+from deepgis_xr.apps.ml.services.ingest import save_tiled_labels
+from deepgis_xr.apps.ml.services.profiling import stage
+from deepgis_xr.apps.ml.services.region import iter_region_features, merge_grid_features
+from deepgis_xr.apps.ml.services.registry import get_executor, weights_digest
+from deepgis_xr.apps.api.v1.views.training import (
+    predict_region_task, purge_region_results, record_region_owner, region_owner, region_result_path
+)
 
 
 @csrf_exempt
@@ -23,7 +34,6 @@ def predict_tile(request) -> JsonResponse:
         bounds = data.get('bounds')  # [minx, miny, maxx, maxy]
         raster_id = data.get('raster_id')
         model_path = data.get('model_path')
-        confidence_threshold = float(data.get('confidence_threshold', 0.5))
         
         if not all([bounds, raster_id]):
             return JsonResponse({
@@ -31,42 +41,268 @@ def predict_tile(request) -> JsonResponse:
                 "message": "Missing required parameters"
             }, status=400)
         
+        try:
+            if not isinstance(bounds, list):
+                raise ValueError("bounds must be four numbers")
+            bounds = [float(b) for b in bounds]
+            if len(bounds) != 4:
+                raise ValueError("bounds must be four numbers")
+            confidence_threshold = float(data.get('confidence_threshold', 0.5))
+        except (TypeError, ValueError) as e:
+            return JsonResponse({
+                "status": "failure",
+                "message": f"Invalid parameters: {e}"
+            }, status=400)
+        
         # Get raster image
         raster = RasterImage.objects.get(id=raster_id)
+        executor = get_executor(model_path)
+        predictor = executor.predictor
+        cell_size = settings.PREDICTION_GRID_CELL_SIZE
+        overlap = settings.PREDICTION_GRID_OVERLAP
         
         with rasterio.open(raster.path) as src:
-            # Calculate window from bounds
-            window = src.window(*bounds)
-            transform = from_bounds(*bounds, window.width, window.height)
+            # Fixed grid cells at no more than the model's input resolution
+            level, area, cells = plan_grid(
+                src,
+                bounds,
+                cell_size,
+                overlap,
+                max_size=settings.PREDICTION_MAX_INPUT_SIZE,
+                pixel_budget=settings.PREDICTION_READ_PIXEL_BUDGET
+            )
             
-            # Read image data
-            image = src.read(window=window)
+            # Raw outputs are cached per grid cell, model weights and backend
+            digest = weights_digest(model_path)
+            cell_keys = [
+                prediction_cache.make_key(
+                    raster.id, raster.path, level, cell_size, overlap, column, row,
+                    digest, predictor.backend, predictor.num_classes
+                )
+                for column, row, _, _, _ in cells
+            ]
+            with stage('cache'):
+                raw_predictions = [prediction_cache.get(key) for key in cell_keys]
             
-            # Initialize predictor and run inference
-            predictor = MaskRCNNPredictor(
-                model_path=model_path,
-                confidence_threshold=confidence_threshold
+            # Missing cells go to the batching executor together
+            pending = {}
+            for index, (_, _, window, out_shape, _) in enumerate(cells):
+                if raw_predictions[index] is None:
+                    with stage('raster_read'):
+                        image = read_window(src, window, out_shape)
+                    # Keep every detection so any threshold can reuse the entry
+                    pending[index] = executor.submit(image, 0.0)
+            for index, future in pending.items():
+                raw_predictions[index] = future.result()
+                with stage('cache'):
+                    prediction_cache.put(cell_keys[index], raw_predictions[index])
+        
+        stride = cell_size - overlap
+        categories = list(CategoryType.objects.all())
+        with stage('geojson'):
+            features = merge_grid_features(
+                predictor,
+                [
+                    (filter_predictions(predictions, confidence_threshold), column * stride, row * stride, transform)
+                    for predictions, (column, row, _, _, transform) in zip(raw_predictions, cells)
+                ],
+                categories,
+                area,
+                cell_size=cell_size
             )
-            predictions = predictor.predict(image)
+        geojson = {"type": "FeatureCollection", "features": features}
+        
+        return JsonResponse({
+            "status": "success",
+            "predictions": geojson
+        })
             
-            # Convert predictions to GeoJSON
-            categories = CategoryType.objects.all()
-            geojson = predictor.predictions_to_geojson(
-                predictions, 
-                transform,
-                categories
+    except Exception as e:
+        return JsonResponse({
+            "status": "failure",
+            "message": str(e)
+        }, status=500)
+
+
+def _parse_region_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate region prediction parameters, raising ValueError on bad input"""
+    bounds = data.get('bounds')  # [minx, miny, maxx, maxy]
+    raster_id = data.get('raster_id')
+    
+    if not all([bounds, raster_id]):
+        raise ValueError("Missing required parameters")
+    try:
+        bounds = [float(b) for b in bounds] if isinstance(bounds, list) else None
+    except TypeError:
+        bounds = None
+    if bounds is None or len(bounds) != 4:
+        raise ValueError("bounds must be four numbers")
+    
+    params = {
+        'raster_id': raster_id,
+        'bounds': bounds,
+        'model_path': data.get('model_path'),
+        'confidence_threshold': float(data.get('confidence_threshold', 0.5)),
+        'tile_size': int(data.get('tile_size', 512)),
+        'overlap': int(data.get('overlap', 64)),
+        'iou_threshold': float(data.get('iou_threshold', 0.5)),
+    }
+    
+    if not 0 <= params['overlap'] < params['tile_size']:
+        raise ValueError("overlap must be smaller than tile_size")
+    
+    return params
+
+
+@csrf_exempt
+@require_POST
+@login_required
+def predict_region(request):
+    """Run sliding-window AI prediction over a large region
+
+    Features are streamed back as newline-delimited GeoJSON while tiles
+    finish. A failure after streaming has started is reported as a final
+    {"status": "failure"} line.
+    """
+    try:
+        params = _parse_region_request(json.loads(request.body))
+    except ValueError as e:
+        return JsonResponse({
+            "status": "failure",
+            "message": str(e)
+        }, status=400)
+    
+    try:
+        raster = RasterImage.objects.get(id=params['raster_id'])
+        
+        with rasterio.open(raster.path) as src:
+            window, out_shape, transform = plan_read(
+                src,
+                params['bounds'],
+                pixel_budget=settings.PREDICTION_READ_PIXEL_BUDGET
             )
-            
-            return JsonResponse({
-                "status": "success",
-                "predictions": geojson
-            })
-            
+        
+        predictor = get_executor(params['model_path']).predictor
+        categories = list(CategoryType.objects.all())
+        
     except Exception as e:
         return JsonResponse({
             "status": "failure",
             "message": str(e)
         }, status=500)
+    
+    def stream():
+        try:
+            # Tiles are read as they are predicted, never the whole region at once
+            with rasterio.open(raster.path) as src:
+                for _, _, features in iter_region_features(
+                        predictor,
+                        lambda x, y, width, height: read_tile(src, window, out_shape, x, y, width, height),
+                        out_shape,
+                        transform,
+                        categories,
+                        confidence_threshold=params['confidence_threshold'],
+                        tile_size=params['tile_size'],
+                        overlap=params['overlap'],
+                        batch_size=settings.PREDICTION_BATCH_MAX_SIZE,
+                        iou_threshold=params['iou_threshold']):
+                    for feature in features:
+                        yield json.dumps(feature) + '\n'
+        except Exception as e:
+            yield json.dumps({"status": "failure", "message": str(e)}) + '\n'
+    
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+@csrf_exempt
+@require_POST
+@login_required
+def submit_region_prediction(request) -> JsonResponse:
+    """Queue a region prediction on the Celery workers"""
+    try:
+        params = _parse_region_request(json.loads(request.body))
+    except ValueError as e:
+        return JsonResponse({
+            "status": "failure",
+            "message": str(e)
+        }, status=400)
+    
+    purge_region_results()
+    
+    # Owner is recorded before queueing so status and results are never served unchecked
+    task_id = str(uuid.uuid4())
+    record_region_owner(task_id, request.user.id)
+    predict_region_task.apply_async(args=[request.user.id], kwargs=params, task_id=task_id)
+    
+    return JsonResponse({
+        "status": "success",
+        "message": "Prediction started",
+        "task_id": task_id
+    })
+
+
+def _get_region_task(request, task_id: str):
+    """Region prediction task visible to the requesting user, or None"""
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        return None
+    
+    owner = region_owner(task_id)
+    if owner is None or (owner != request.user.id and not request.user.is_staff):
+        return None
+    return predict_region_task.AsyncResult(task_id)
+
+
+@csrf_exempt
+@require_GET
+@login_required
+def get_region_prediction_status(request, task_id: str) -> JsonResponse:
+    """Get progress of a region prediction task"""
+    task = _get_region_task(request, task_id)
+    if task is None:
+        return JsonResponse({
+            "status": "failure",
+            "message": "Task not found"
+        }, status=404)
+    
+    if task.state == 'PENDING':
+        response = {
+            'state': task.state,
+            'status': 'Prediction pending...'
+        }
+    elif task.state in ('PROGRESS', 'SUCCESS'):
+        response = {'state': task.state}
+        response.update({k: v for k, v in task.info.items() if k != 'user_id'})
+        response['result_url'] = reverse('download_region_prediction', args=[task_id])
+    else:
+        response = {
+            'state': task.state,
+            'status': str(task.info)
+        }
+    
+    return JsonResponse(response)
+
+
+@csrf_exempt
+@require_GET
+@login_required
+def download_region_prediction(request, task_id: str):
+    """Download the features predicted so far as newline-delimited GeoJSON"""
+    task = _get_region_task(request, task_id)
+    path = region_result_path(task_id) if task is not None else None
+    if path is None or not os.path.exists(path):
+        return JsonResponse({
+            "status": "failure",
+            "message": "No results available"
+        }, status=404)
+    
+    return FileResponse(
+        open(path, 'rb'),
+        content_type='application/x-ndjson',
+        as_attachment=True,
+        filename=f'{task_id}.ndjson'
+    )
 
 
 @csrf_exempt
@@ -88,28 +324,13 @@ def save_predictions(request) -> JsonResponse:
         raster = RasterImage.objects.get(id=raster_id)
         labeler = Labeler.objects.get(user=request.user)
         
-        # Create TiledGISLabel objects from predictions
-        created_labels = []
-        for feature in predictions['features']:
-            category_name = feature['properties']['category']
-            category = CategoryType.objects.get(category_name=category_name)
-            
-            label = TiledGISLabel.objects.create(
-                parent_raster=raster,
-                labeler=labeler,
-                category=category,
-                label_json=feature,
-                geometry=GEOSGeometry(json.dumps(feature['geometry'])),
-                northeast_lat=feature['bbox'][3],
-                northeast_lng=feature['bbox'][2],
-                southwest_lat=feature['bbox'][1],
-                southwest_lng=feature['bbox'][0]
-            )
-            created_labels.append(label.id)
+        # Create TiledGISLabel objects from predictions in one transaction
+        created_labels, errors = save_tiled_labels(predictions['features'], raster, labeler)
         
         return JsonResponse({
             "status": "success",
-            "created_labels": created_labels
+            "created_labels": created_labels,
+            "errors": errors
         })
         
     except Exception as e:
@@ -1,12 +1,21 @@
 import os
+import json
+import time
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from celery import shared_task
+import rasterio
 
+from deepgis_xr.apps.core.models import RasterImage, CategoryType
+from deepgis_xr.apps.core.utils.utils import plan_read, read_tile
+from deepgis_xr.apps.ml.services.cache import prediction_cache
+from deepgis_xr.apps.ml.services.region import iter_region_features
+from deepgis_xr.apps.ml.services.registry import registry
 from deepgis_xr.apps.ml.services.trainer import DeepGISTrainer
 
 
@@ -14,7 +23,128 @@ from deepgis_xr.apps.ml.services.trainer import DeepGISTrainer
 def train_model_task(output_dir: str) -> str:
     """Celery task for training the model"""
     trainer = DeepGISTrainer(output_dir=output_dir)
-    return trainer.train()
+    result = trainer.train()
+    
+    # Predictions made with earlier weights or categories are stale
+    registry.invalidate()
+    prediction_cache.clear()
+    return result
+
+
+def region_result_path(task_id: str) -> str:
+    """NDJSON file a region prediction task writes its features to"""
+    return os.path.join(settings.MEDIA_ROOT, 'predictions', 'regions', f'{task_id}.ndjson')
+
+
+def region_owner_path(task_id: str) -> str:
+    """JSON file recording who submitted a region prediction task"""
+    return os.path.join(settings.MEDIA_ROOT, 'predictions', 'regions', f'{task_id}.owner.json')
+
+
+def record_region_owner(task_id: str, user_id: int):
+    """Record the submitting user before the task is queued"""
+    path = region_owner_path(task_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'user_id': user_id}, f)
+
+
+def region_owner(task_id: str) -> Optional[int]:
+    """User who submitted a region prediction task, None if unknown or expired"""
+    path = region_owner_path(task_id)
+    try:
+        if time.time() - os.path.getmtime(path) > settings.REGION_PREDICTION_RETENTION_SECONDS:
+            return None
+        with open(path) as f:
+            return json.load(f).get('user_id')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def purge_region_results(max_age: Optional[float] = None) -> int:
+    """Delete region prediction results and owner records older than max_age seconds"""
+    if max_age is None:
+        max_age = settings.REGION_PREDICTION_RETENTION_SECONDS
+    directory = os.path.dirname(region_result_path('x'))
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            # Removed by a concurrent purge
+            continue
+    return removed
+
+
+@shared_task(bind=True)
+def predict_region_task(self,
+                        user_id: int,
+                        raster_id: int,
+                        bounds: List[float],
+                        model_path: Optional[str] = None,
+                        confidence_threshold: float = 0.5,
+                        tile_size: int = 512,
+                        overlap: int = 64,
+                        iou_threshold: float = 0.5) -> Dict[str, Any]:
+    """Celery task for sliding-window prediction over a large region
+    
+    Features are appended to region_result_path() as each batch of tiles
+    finishes, and PROGRESS state reports tiles done/total and throughput so
+    partial results can be polled and downloaded.
+    """
+    raster = RasterImage.objects.get(id=raster_id)
+    predictor = registry.get(model_path)
+    categories = list(CategoryType.objects.all())
+    
+    output_path = region_result_path(self.request.id)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    progress = {
+        'user_id': user_id,
+        'tiles_done': 0,
+        'tiles_total': 0,
+        'features': 0,
+        'tiles_per_second': 0.0
+    }
+    started = time.monotonic()
+    
+    with rasterio.open(raster.path) as src, open(output_path, 'w') as f:
+        window, out_shape, transform = plan_read(
+            src,
+            bounds,
+            pixel_budget=settings.PREDICTION_READ_PIXEL_BUDGET
+        )
+        # Tiles are read as they are predicted, never the whole region at once
+        for tiles_done, tiles_total, features in iter_region_features(
+                predictor,
+                lambda x, y, width, height: read_tile(src, window, out_shape, x, y, width, height),
+                out_shape,
+                transform,
+                categories,
+                confidence_threshold=confidence_threshold,
+                tile_size=tile_size,
+                overlap=overlap,
+                batch_size=settings.PREDICTION_BATCH_MAX_SIZE,
+                iou_threshold=iou_threshold):
+            for feature in features:
+                f.write(json.dumps(feature) + '\n')
+            f.flush()
+            
+            elapsed = time.monotonic() - started
+            progress.update(
+                tiles_done=tiles_done,
+                tiles_total=tiles_total,
+                features=progress['features'] + len(features),
+                tiles_per_second=tiles_done / elapsed if elapsed else 0.0
+            )
+            self.update_state(state='PROGRESS', meta=progress)
+    
+    return progress
 
 
 @csrf_exempt
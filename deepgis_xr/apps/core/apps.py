@@ -6,3 +6,6 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     name = 'deepgis_xr.apps.core'
     verbose_name = 'Core'
+
+    def ready(self):
+        import deepgis_xr.apps.core.signals  # noqa
@@ -5,7 +5,6 @@ import random
 import re
 import shutil
 import string
-import imageio
 import numpy
 from PIL import Image as PILImage
 from bs4 import BeautifulSoup
@@ -15,6 +14,9 @@ import wand.exceptions
 from wand.color import Color as WandColor
 from wand.image import Image as WandImage
 import SVGRegex
+from deepgis_xr.apps.core.utils.masks import save_instance_masks
+from deepgis_xr.apps.core.utils.rasterize import iter_instance_masks
+from deepgis_xr.apps.core.utils.shapes import SHAPE_CIRCLE, category_shape_table_cache, parse_shapes
 from webclient.image_ops import crop_images
 from webclient.models import User, Labeler, Image, ImageLabel, CategoryLabel, CategoryType
 
@@ -352,15 +354,12 @@ def get_annotation_count_per_user(username: string):
         minimum_time = (int(label.timeTaken) / 1000.0) / 60.0
 
         for cat_id, category_label in enumerate(label.categorylabel_set.all()):
-            svg = category_label.labelShapes
-            paths = re.findall(SVGRegex.rePath, svg)
-            poly = re.findall(SVGRegex.rePolygon, svg)
-            circles = re.findall(SVGRegex.reCircle, svg)
-            total = len(paths) + len(poly) + len(circles)
+            table = category_shape_table_cache.get(category_label.id, category_label.labelShapes)
+            total = len(table)
+            circles = int(numpy.count_nonzero(table.types == SHAPE_CIRCLE))
             ctr_total += total
             print(f"filename={label.parentImage.name}, category_enum={cat_id}, "
-                  f"paths={len(paths)}, polygon={len(poly)}, "
-                  f"circles={len(circles)}, count={total}, "
+                  f"polygons={total - circles}, circles={circles}, count={total}, "
                   f"time_taken={minimum_time}, cumulative count={ctr_total}")
 
 
@@ -387,6 +386,10 @@ def convert_image_labels_to_numpy_masks(user_name: string,
     settings.MEDIA_ROOT + settings.LABEL_FOLDER_NAME + user +
     '/' + get_random_string() + '/dataset.zip
 
+    Each window's masks are saved as labels/<image>_<x>_<y>.npz with one
+    run-length encoded plane per shape and its category id, see
+    masks.save_instance_masks(). Read them with masks.load_instance_masks().
+
     Args:
         user_name: user who requested for creation of numpy masks
         labels: a list of ImageLabel objects
@@ -418,15 +421,12 @@ def convert_image_labels_to_numpy_masks(user_name: string,
         width = label.imageWindow.width
         padding_x = label.imageWindow.x
         padding_y = label.imageWindow.y
-        total_paths = 300
-        masks_array = numpy.zeros((total_paths, height, width), dtype=numpy.int8)
-        ctr = 0
-        output_filename_npy = (base_folder +
+        output_filename_npz = (base_folder +
                                folder_name + '/' +
                                filename + '_' +
                                str(padding_x) +
                                '_' + str(padding_y) +
-                               '.npy')
+                               '.npz')
 
         # create cropped images
         soup = BeautifulSoup(label.combined_labelShapes)
@@ -446,54 +446,22 @@ def convert_image_labels_to_numpy_masks(user_name: string,
 
         im_crop.save(output_image_filename, quality=95)
 
-        # Create masks
+        # Create masks, one run-length encoded plane per shape
+        shapes = []
+        class_ids = []
         for cat_id, category_label in enumerate(category_labels):
-            svg = category_label.labelShapes
-            paths = re.findall(SVGRegex.rePath, svg)
-            poly = re.findall(SVGRegex.rePolygon, svg)
-            circles = re.findall(SVGRegex.reCircle, svg)
-            shapes = paths + poly + circles
-            if len(paths) + len(poly) + len(circles) > 0:
-                for idx, path in enumerate(shapes):
-                    print("logging image info:----", filename, ctr, cat_id, idx, path)
-                    img = WandImage(
-                        blob=convert_svg_to_text_stream(
-                            convert_image_label_string_to_svg_string(
-                                path,
-                                height,
-                                width)))
-
-                    img.resize(width, height)
-                    img.background_color = WandColor('white')
-                    img.alpha_channel = 'remove'
-                    img.negate()
-                    img.threshold(0)
-                    img.format = 'png'
-                    if not os.path.exists(base_folder + folder_name):
-                        os.makedirs(base_folder + folder_name)
-                    output_filename = (
-                            base_folder + folder_name +
-                            '/' + filename + '_' +
-                            str(padding_x) + '_' +
-                            str(padding_y) + '_' +
-                            str(padding_x) + '_' +
-                            str(padding_y) + '_' +
-                            str(idx) + '_' + str(ctr) +
-                            IMAGE_FILE_EXTENSION)
-                    img.save(filename=output_filename)
-                    masks = numpy.array(imageio.imread(output_filename))
-                    category_id = category_label.categoryType_id
-                    cat_mask = numpy.where(masks == 255, category_id, masks)
-                    masks_array[ctr, :, :] = cat_mask
-                    ctr = ctr + 1
-            else:
-                print(filename, ctr, cat_id, 0, 'EMPTY')
-        numpy.resize(masks_array, (ctr, height, width))
-        numpy.save(output_filename_npy, masks_array)
-
-        for png_file in os.listdir(base_folder + folder_name):
-            if png_file.endswith('.png'):
-                os.remove(base_folder + folder_name + '/' + png_file)
+            table = category_shape_table_cache.get(category_label.id, category_label.labelShapes)
+            indices = table.overlapping((0, 0, width, height))
+            if not len(table):
+                print(filename, len(shapes), cat_id, 0, 'EMPTY')
+            shapes.extend(table.rings(i) for i in indices)
+            class_ids.extend([category_label.categoryType_id] * len(indices))
+        if not os.path.exists(base_folder + folder_name):
+            os.makedirs(base_folder + folder_name)
+        save_instance_masks(output_filename_npz,
+                            iter_instance_masks(shapes, (height, width)),
+                            class_ids,
+                            (height, width))
     base_folder_without_dataset = base_folder[:-8]
 
     # create a zip file of the dataset
@@ -739,16 +707,12 @@ def convert_svg_string_to_numpy_masks(svg_string: string) -> numpy:
     Returns:
         numpy array
     """
-    converted_images = convert_svg_to_array_of_vector_images(svg_string)
     height, width = get_svg_dimensions(svg_string)[1:]
     if not height or not width:
         return None
     image = numpy.zeros((height, width), numpy.uint8)
-    for converted_image in converted_images:
-        img = PILImage.open(io.StringIO(converted_image)).convert("L")
-        img_arr = numpy.array(img, copy=True)
-        img_arr[img_arr == 255] = 1
-        image += img_arr
+    for shape_mask in parse_shapes(svg_string).iter_masks((height, width)):
+        image += shape_mask
 
     return image
 
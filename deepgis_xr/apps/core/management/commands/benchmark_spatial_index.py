@@ -0,0 +1,129 @@
+import json
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+
+from deepgis_xr.apps.core.models import TiledGISLabel
+from deepgis_xr.apps.core.utils.spatial import SpatialIndex, tiled_label_index
+
+
+def synthetic_boxes(count: int, rng: np.random.Generator, extent=(-10.0, -10.0, 10.0, 10.0),
+                    max_size: float = 0.001) -> np.ndarray:
+    """(count, 4) small boxes scattered uniformly over extent"""
+    minx, miny, maxx, maxy = extent
+    origins = rng.uniform((minx, miny), (maxx, maxy), size=(count, 2))
+    sizes = rng.uniform(max_size / 10, max_size, size=(count, 2))
+    return np.hstack([origins, origins + sizes])
+
+
+def latency_stats(seconds) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark viewport queries against the label R-tree with synthetic labels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labels', type=int, default=1000000, help='Number of synthetic labels')
+        parser.add_argument('--queries', type=int, default=1000, help='Number of viewport queries')
+        parser.add_argument('--viewport', type=float, default=0.05,
+                            help='Viewport side length, in the units of the label extent (20 x 20)')
+        parser.add_argument('--database', action='store_true',
+                            help='Also insert the labels (rolled back afterwards) and time labels/in-bbox/')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this path')
+
+    def handle(self, *args, **options):
+        if options['labels'] < 1 or options['queries'] < 1:
+            raise CommandError('--labels and --queries must be positive')
+        rng = np.random.default_rng(options['seed'])
+        boxes = synthetic_boxes(options['labels'], rng)
+
+        start = time.perf_counter()
+        spatial_index = SpatialIndex((i + 1, tuple(box)) for i, box in enumerate(boxes.tolist()))
+        build_seconds = time.perf_counter() - start
+
+        side = options['viewport']
+        origins = rng.uniform(-10, 10 - side, size=(options['queries'], 2))
+        viewports = [(x, y, x + side, y + side) for x, y in origins.tolist()]
+
+        timings, hits = [], []
+        for viewport in viewports:
+            start = time.perf_counter()
+            hits.append(len(spatial_index.intersection(viewport)))
+            timings.append(time.perf_counter() - start)
+
+        results = {
+            "labels": options['labels'],
+            "queries": options['queries'],
+            "viewport": side,
+            "build_seconds": build_seconds,
+            "mean_hits": float(np.mean(hits)),
+            "index": latency_stats(timings),
+        }
+        self._report('R-tree', results['index'], results['mean_hits'])
+        self.stdout.write(f'  built in {build_seconds:.1f} s')
+
+        if options['database']:
+            results["endpoint"] = self._benchmark_endpoint(boxes, viewports)
+            self._report('labels/in-bbox/', results['endpoint'], results['mean_hits'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def _benchmark_endpoint(self, boxes, viewports):
+        from deepgis_xr.apps.api.v1.views.labels import labels_in_bbox
+
+        factory = RequestFactory()
+        user = User(username='benchmark')
+        with transaction.atomic():
+            try:
+                self.stdout.write(f'Inserting {len(boxes)} labels')
+                rounded = np.round(boxes, 10).tolist()
+                for start in range(0, len(rounded), 50000):
+                    TiledGISLabel.objects.bulk_create([
+                        TiledGISLabel(
+                            southwest_lng=minx, southwest_lat=miny,
+                            northeast_lng=maxx, northeast_lat=maxy,
+                            label_json={}, geometry=None
+                        )
+                        for minx, miny, maxx, maxy in rounded[start:start + 50000]
+                    ], batch_size=5000)
+                # What a process pays when another one moved or deleted a label
+                tiled_label_index.reset()
+                start = time.perf_counter()
+                tiled_label_index.ensure_current()
+                rebuild_seconds = time.perf_counter() - start
+                self.stdout.write(f'  label index rebuilt from the database in {rebuild_seconds:.1f} s')
+
+                timings = []
+                for viewport in viewports:
+                    request = factory.get('/api/v1/labels/in-bbox/', {'bbox': ','.join(map(str, viewport))})
+                    request.user = user
+                    start = time.perf_counter()
+                    response = labels_in_bbox(request)
+                    timings.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        raise CommandError(json.loads(response.content).get('message'))
+                return dict(latency_stats(timings), rebuild_seconds=rebuild_seconds)
+            finally:
+                transaction.set_rollback(True)
+                tiled_label_index.reset()
+
+    def _report(self, name, stats, mean_hits):
+        self.stdout.write(
+            f'{name}: p50 {stats["p50_ms"]:.3f} ms, p95 {stats["p95_ms"]:.3f} ms, '
+            f'p99 {stats["p99_ms"]:.3f} ms ({mean_hits:.1f} labels per viewport)'
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from deepgis_xr.apps.core.models import ImageLabel
+from deepgis_xr.apps.core.utils.coco import export_coco
+
+
+class Command(BaseCommand):
+    help = 'Export labels as a COCO dataset, rendering only labels added or changed since the last export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', type=str, default='default',
+                            help='Dataset name, exported to DATASET_COCO_DIR/<name>/')
+        parser.add_argument('--labeler', type=str, help='Only export labels of this username')
+        parser.add_argument('--latest', action='store_true',
+                            help='Only export the latest label of each image')
+        parser.add_argument('--processes', type=int, help='Worker processes (default: DATASET_EXPORT_PROCESSES)')
+
+    def handle(self, *args, **options):
+        labels = ImageLabel.objects.all()
+        if options['labeler']:
+            labels = labels.filter(labeler__user__username=options['labeler'])
+        if options['latest']:
+            labels = labels.filter(image__latest_label=F('id'))
+
+        try:
+            stats = export_coco(labels, name=options['name'], processes=options['processes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported to {stats['path']}: "
+            f"{stats['annotations_rendered']} labels rendered, {stats['annotations_reused']} reused, "
+            f"{stats['crops_rendered']} crops rendered, {stats['crops_reused']} reused, "
+            f"{stats['images_removed']} images removed, {stats['images_skipped']} unreadable images skipped"
+        ))
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tiledgislabel',
+            name='northeast_lat',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='tiledgislabel',
+            name='northeast_lng',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='tiledgislabel',
+            name='southwest_lat',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='tiledgislabel',
+            name='southwest_lng',
+            field=models.FloatField(),
+        ),
+        migrations.AddField(
+            model_name='tiledgislabel',
+            name='geometry_wkb',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,85 @@
+import json
+
+from django.db import migrations, transaction
+from shapely import wkb, wkt
+from shapely.geometry import mapping, shape
+
+BATCH_SIZE = 1000
+
+
+def _parse(text, feature):
+    """Shapely geometry from the geometry text column or the GeoJSON copy"""
+    text = (text or '').strip()
+    if text.startswith('{'):
+        return shape(json.loads(text))
+    if text.upper().startswith('SRID='):
+        return wkt.loads(text.split(';', 1)[1])
+    if text:
+        return wkt.loads(text)
+    if isinstance(feature, dict) and feature.get('geometry'):
+        return shape(feature['geometry'])
+    return None
+
+
+def _batches(queryset):
+    """Rows in id order, BATCH_SIZE at a time, each batch in its own transaction"""
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(queryset.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+            if not batch:
+                return
+            yield batch
+        last_id = batch[-1].id
+
+
+def geometry_to_wkb(apps, schema_editor):
+    TiledGISLabel = apps.get_model('core', 'TiledGISLabel')
+    for batch in _batches(TiledGISLabel.objects.all()):
+        changed = []
+        for label in batch:
+            try:
+                geometry = _parse(label.geometry, label.label_json)
+            except Exception:
+                # Unreadable rows keep their label_json geometry
+                continue
+            if geometry is None or geometry.is_empty:
+                continue
+            label.geometry_wkb = geometry.wkb
+            minx, miny, maxx, maxy = geometry.bounds
+            label.southwest_lng, label.southwest_lat = minx, miny
+            label.northeast_lng, label.northeast_lat = maxx, maxy
+            if isinstance(label.label_json, dict):
+                label.label_json = {
+                    key: value for key, value in label.label_json.items() if key not in ('geometry', 'bbox')
+                }
+            changed.append(label)
+        TiledGISLabel.objects.bulk_update(changed, [
+            'geometry_wkb', 'label_json',
+            'southwest_lng', 'southwest_lat', 'northeast_lng', 'northeast_lat'
+        ])
+
+
+def wkb_to_geometry(apps, schema_editor):
+    TiledGISLabel = apps.get_model('core', 'TiledGISLabel')
+    for batch in _batches(TiledGISLabel.objects.exclude(geometry_wkb=None)):
+        for label in batch:
+            geometry = wkb.loads(bytes(label.geometry_wkb))
+            label.geometry = geometry.wkt
+            feature = dict(label.label_json) if isinstance(label.label_json, dict) else {}
+            feature['geometry'] = json.loads(json.dumps(mapping(geometry)))
+            label.label_json = feature
+        TiledGISLabel.objects.bulk_update(batch, ['geometry', 'label_json'])
+
+
+class Migration(migrations.Migration):
+    # Batches commit one at a time so large tables are not converted in one transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_tiledgislabel_geometry_wkb'),
+    ]
+
+    operations = [
+        migrations.RunPython(geometry_to_wkb, wkb_to_geometry),
+    ]
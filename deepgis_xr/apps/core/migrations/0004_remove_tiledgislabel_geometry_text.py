@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_tiledgislabel_geometry_wkb_data'),
+    ]
+
+    operations = [
+        # A default lets the text column be re-added when migrating backwards
+        migrations.AlterField(
+            model_name='tiledgislabel',
+            name='geometry',
+            field=models.TextField(blank=True, default='', max_length=100000),
+        ),
+        migrations.RemoveField(
+            model_name='tiledgislabel',
+            name='geometry',
+        ),
+        migrations.RenameField(
+            model_name='tiledgislabel',
+            old_name='geometry_wkb',
+            new_name='geometry',
+        ),
+    ]
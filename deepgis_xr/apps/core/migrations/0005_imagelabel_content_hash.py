@@ -0,0 +1,35 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_label_contents(apps, schema_editor):
+    """Hash labels saved before content hashes were recorded, so retries of them are recognised"""
+    ImageLabel = apps.get_model('core', 'ImageLabel')
+    labels = ImageLabel.objects.filter(content_hash=None).values_list('id', 'combined_label_shapes')
+    batch = []
+    for label_id, text in labels.iterator(chunk_size=500):
+        digest = hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+        batch.append(ImageLabel(id=label_id, content_hash=digest))
+        if len(batch) >= 500:
+            ImageLabel.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        ImageLabel.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_remove_tiledgislabel_geometry_text'),
+    ]
+
+    operations = [
+        # Not unique: going back to an earlier revision's payload saves it again
+        migrations.AddField(
+            model_name='imagelabel',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_label_contents, migrations.RunPython.noop),
+    ]
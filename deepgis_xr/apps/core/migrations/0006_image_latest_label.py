@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_latest_labels(apps, schema_editor):
+    Image = apps.get_model('core', 'Image')
+    ImageLabel = apps.get_model('core', 'ImageLabel')
+    Image.objects.update(latest_label=models.Subquery(
+        ImageLabel.objects.filter(image=models.OuterRef('pk')).order_by('-pub_date', '-id').values('id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_imagelabel_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imagelabel',
+            index=models.Index(fields=['image', 'pub_date'], name='imagelabel_image_pub_date'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='latest_label',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.imagelabel'),
+        ),
+        migrations.RunPython(set_latest_labels, migrations.RunPython.noop),
+    ]
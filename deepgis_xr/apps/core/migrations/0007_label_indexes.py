@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_image_latest_label'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['source', 'pub_date'], name='image_source_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='imagelabel',
+            index=models.Index(fields=['labeler', 'pub_date'], name='imagelabel_labeler_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='categorylabel',
+            index=models.Index(fields=['parent_label', 'category'], name='categorylabel_parent_category'),
+        ),
+        migrations.AddIndex(
+            model_name='tiledgislabel',
+            index=models.Index(fields=['parent_raster', 'category', 'pub_date'], name='tiledgislabel_raster_cat_date'),
+        ),
+    ]
@@ -8,6 +8,8 @@ import random
 from django.db.models import JSONField
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
+from shapely import wkb
+from shapely.geometry import mapping
 
 
 class Color(models.Model):
@@ -82,9 +84,16 @@ class Image(models.Model):
     width = models.PositiveSmallIntegerField(default=1920)
     height = models.PositiveSmallIntegerField(default=1080)
     categories = models.ManyToManyField(CategoryType)
+    # Newest ImageLabel, kept current when labels are saved
+    latest_label = models.ForeignKey(
+        'ImageLabel', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
 
     class Meta:
         unique_together = ('name', 'path')
+        indexes = [
+            models.Index(fields=['source', 'pub_date'], name='image_source_pub_date')
+        ]
 
     def __str__(self):
         return f'Image: {self.name}'
@@ -137,6 +146,14 @@ class ImageLabel(models.Model):
     labeler = models.ForeignKey(Labeler, on_delete=models.CASCADE, null=True, blank=True)
     window = models.ForeignKey(ImageWindow, on_delete=models.CASCADE, default=get_default_window)
     time_taken = models.PositiveIntegerField(null=True)
+    # SHA-256 of the saved payload text, used to recognise client retries
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['image', 'pub_date'], name='imagelabel_image_pub_date'),
+            models.Index(fields=['labeler', 'pub_date'], name='imagelabel_labeler_pub_date')
+        ]
 
     def __str__(self):
         return f'Label: {self.image.name} by {self.labeler} on {self.pub_date}'
@@ -148,6 +165,11 @@ class CategoryLabel(models.Model):
     label_shapes = models.TextField(max_length=100000)
     parent_label = models.ForeignKey(ImageLabel, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent_label', 'category'], name='categorylabel_parent_category')
+        ]
+
     def __str__(self):
         return f'{self.parent_label} | Category: {self.category}'
 
@@ -173,10 +195,10 @@ class TiledLabel(models.Model):
         ("A", "Any")
     ]
 
-    northeast_lat = models.DecimalField(max_digits=17, decimal_places=14)
-    northeast_lng = models.DecimalField(max_digits=17, decimal_places=14)
-    southwest_lat = models.DecimalField(max_digits=17, decimal_places=14)
-    southwest_lng = models.DecimalField(max_digits=17, decimal_places=14)
+    northeast_lat = models.FloatField()
+    northeast_lng = models.FloatField()
+    southwest_lat = models.FloatField()
+    southwest_lng = models.FloatField()
     zoom_level = models.PositiveSmallIntegerField(default=23)
     category = models.ForeignKey(CategoryType, on_delete=models.CASCADE, null=True, blank=True)
     label_json = JSONField()
@@ -206,7 +228,48 @@ class TiledGISLabel(TiledLabel):
     parent_raster = models.ForeignKey(RasterImage, on_delete=models.CASCADE, null=True, blank=True)
     pub_date = models.DateTimeField(default=datetime.now, blank=True)
     labeler = models.ForeignKey(Labeler, on_delete=models.CASCADE, null=True, blank=True)
-    geometry = models.TextField(max_length=100000)
+    # Canonical lon/lat geometry as WKB; label_json keeps the other feature members
+    geometry = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent_raster', 'category', 'pub_date'], name='tiledgislabel_raster_cat_date')
+        ]
 
     def __str__(self):
-        return f'GIS Label: {self.category} at ({self.northeast_lat},{self.northeast_lng})' 
\ No newline at end of file
+        return f'GIS Label: {self.category} at ({self.northeast_lat},{self.northeast_lng})'
+
+    @property
+    def shape(self):
+        """Shapely geometry decoded from WKB on first use, or None"""
+        if not self.geometry:
+            return None
+        cached = getattr(self, '_shape_cache', None)
+        if cached is None or cached[0] is not self.geometry:
+            cached = (self.geometry, wkb.loads(bytes(self.geometry)))
+            self._shape_cache = cached
+        return cached[1]
+
+    @shape.setter
+    def shape(self, geometry):
+        self.geometry = geometry.wkb if geometry is not None else None
+        self.set_bounds_from_geometry()
+
+    @property
+    def geojson(self):
+        """GeoJSON geometry dict, only built when asked for"""
+        geometry = self.shape
+        return mapping(geometry) if geometry is not None else None
+
+    def set_bounds_from_geometry(self):
+        """Derive the bbox columns from the stored geometry"""
+        geometry = self.shape
+        if geometry is None or geometry.is_empty:
+            return
+        minx, miny, maxx, maxy = geometry.bounds
+        self.southwest_lng, self.southwest_lat = minx, miny
+        self.northeast_lng, self.northeast_lat = maxx, maxy
+
+    def save(self, *args, **kwargs):
+        self.set_bounds_from_geometry()
+        super().save(*args, **kwargs)
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from deepgis_xr.apps.core.models import Image, ImageLabel, TiledGISLabel
+from deepgis_xr.apps.core.utils.labels import label_payload_cache
+from deepgis_xr.apps.core.utils.shapes import shape_table_cache
+from deepgis_xr.apps.core.utils.spatial import label_bounds, tiled_label_index
+from deepgis_xr.apps.core.utils.tiles import label_tile_cache
+
+
+@receiver(pre_save, sender=TiledGISLabel)
+def remember_label_bounds(sender, instance, **kwargs):
+    """Keep the stored bbox of an existing label so it can be replaced"""
+    instance._stored_bounds = None
+    if instance.pk:
+        old = sender.objects.filter(pk=instance.pk).values_list(
+            'southwest_lng', 'southwest_lat', 'northeast_lng', 'northeast_lat'
+        ).first()
+        if old:
+            instance._stored_bounds = tuple(float(v) for v in old)
+
+
+@receiver(post_save, sender=TiledGISLabel)
+def index_label(sender, instance, **kwargs):
+    old_bounds = getattr(instance, '_stored_bounds', None)
+    new_bounds = label_bounds(instance)
+    if tiled_label_index.built:
+        if old_bounds:
+            tiled_label_index.delete(instance.pk, old_bounds)
+        tiled_label_index.insert(instance.pk, new_bounds)
+
+    # Clear tiles once committed so they are not re-rendered from old rows
+    touched = [b for b in (old_bounds, new_bounds) if b]
+    transaction.on_commit(lambda: label_tile_cache.invalidate_bounds(touched))
+    # New rows are found by id elsewhere, moved ones need a rebuild
+    if old_bounds and old_bounds != new_bounds:
+        transaction.on_commit(tiled_label_index.bump_version)
+
+
+@receiver(post_delete, sender=TiledGISLabel)
+def unindex_label(sender, instance, **kwargs):
+    bounds = label_bounds(instance)
+    if tiled_label_index.built:
+        tiled_label_index.delete(instance.pk, bounds)
+    transaction.on_commit(lambda: label_tile_cache.invalidate_bounds([bounds]))
+    transaction.on_commit(tiled_label_index.bump_version)
+
+
+@receiver(post_save, sender=ImageLabel)
+def update_latest_label(sender, instance, created, **kwargs):
+    """Point the image at its newest label and drop stale parsed payloads and shapes"""
+    if created:
+        Image.objects.filter(id=instance.image_id).filter(
+            Q(latest_label=None) | Q(latest_label__pub_date__lte=instance.pub_date)
+        ).update(latest_label=instance)
+    else:
+        label_payload_cache.discard(instance.pk)
+        shape_table_cache.discard(instance.pk)
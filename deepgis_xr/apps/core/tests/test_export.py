@@ -0,0 +1,244 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from deepgis_xr.apps.core.exceptions import DatasetError
+from deepgis_xr.apps.core.models import CategoryType, Image, ImageLabel, ImageSourceType, ImageWindow
+from deepgis_xr.apps.core.utils.coco import ArtifactStore, export_coco
+from deepgis_xr.apps.core.utils.export import (
+    DatasetExportStore, export_categories, export_jobs, export_key, stream_dataset_zip
+)
+from deepgis_xr.apps.core.utils.labels import save_image_label
+from deepgis_xr.apps.core.utils.masks import load_instance_masks
+
+
+def labeling_session(image_name, offset=0):
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [[[2, 2], [12, 2], [12, 12], [2, 12], [2, 2]]]},
+            'properties': {'category': 'Buildings'}
+        },
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [30 + offset, 20, 5]},
+            'properties': {'category': 'Trees'}
+        },
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [5, 5]]},
+            'properties': {'category': 'Buildings'}
+        }
+    ]
+    return {'features': features, 'metadata': {'image': image_name}}
+
+
+class DatasetExportTests(TestCase):
+    """Test the streamed dataset archive"""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        settings_override = override_settings(STATIC_ROOT=self.static_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(self.static_root, 'images'))
+        source = ImageSourceType.objects.create(description='test')
+        CategoryType.objects.create(category_name='Buildings')
+        CategoryType.objects.create(category_name='Trees')
+        for name in ('a.png', 'b.png'):
+            PILImage.new('RGB', (100, 80), (10, 20, 30)).save(os.path.join(self.static_root, 'images', name))
+            image = Image.objects.create(name=name, path='localhost/static/images/', source=source)
+            save_image_label(image, None, labeling_session(name))
+            save_image_label(image, None, labeling_session(name, offset=10))
+        ImageLabel.objects.update(window=ImageWindow.objects.create(x=0, y=0, width=64, height=48))
+
+    def read_archive(self, processes):
+        data = b''.join(stream_dataset_zip(ImageLabel.objects.all(), processes=processes))
+        return zipfile.ZipFile(io.BytesIO(data))
+
+    def test_archive_contents(self):
+        """Test every window gets a crop and one mask plane per shape with an area"""
+        archive = self.read_archive(processes=1)
+        names = sorted(archive.namelist())
+        self.assertEqual(len([n for n in names if n.startswith('images/')]), 4)
+        self.assertEqual(len([n for n in names if n.startswith('labels/')]), 4)
+
+        categories = json.loads(archive.read('categories.json'))
+        self.assertEqual(sorted(categories.values()), ['Buildings', 'Trees'])
+
+        label = ImageLabel.objects.order_by('id').first()
+        crop = PILImage.open(io.BytesIO(archive.read(f'images/a_0_0_{label.id}.png')))
+        self.assertEqual(crop.size, (64, 48))
+
+        masks = load_instance_masks(io.BytesIO(archive.read(f'labels/a_0_0_{label.id}.npz')))
+        self.assertEqual(len(masks), 2)
+        self.assertEqual([categories[str(c)] for c in masks.class_ids], ['Buildings', 'Trees'])
+        self.assertEqual(masks[0].sum(), 100)
+        self.assertTrue(masks[1][20, 30])
+
+    def test_process_pool_matches_inline(self):
+        """Test rendering in worker processes gives the same entries"""
+        inline = self.read_archive(processes=1)
+        pooled = self.read_archive(processes=2)
+        self.assertEqual(inline.namelist(), pooled.namelist())
+        for name in inline.namelist():
+            self.assertEqual(inline.read(name), pooled.read(name))
+
+    def test_jobs_carry_cached_tables(self):
+        """Test labels are parsed in the calling process and reused by the next export"""
+        labels = ImageLabel.objects.all()
+        first = [window[2] for job in export_jobs(labels, export_categories()) for window in job['windows']]
+        second = [window[2] for job in export_jobs(labels, export_categories()) for window in job['windows']]
+        self.assertEqual(len(first), 4)
+        self.assertTrue(all(a is b for a, b in zip(first, second)))
+
+    def test_store_reuses_unchanged_exports(self):
+        """Test the archive is stored by content and the key follows label changes"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        store = DatasetExportStore(directory)
+        labels = ImageLabel.objects.all()
+
+        key = export_key(labels)
+        self.assertIsNone(store.get(key))
+        streamed = b''.join(store.stream(key, stream_dataset_zip(labels, processes=1)))
+        with open(store.get(key), 'rb') as f:
+            self.assertEqual(f.read(), streamed)
+        self.assertEqual(os.listdir(directory), [f'{key}.zip'])
+
+        self.assertEqual(export_key(labels), key)
+        save_image_label(Image.objects.first(), None, labeling_session('a.png', offset=20))
+        self.assertNotEqual(export_key(labels), key)
+
+    def test_key_follows_image_files(self):
+        """Test replacing an image file changes the key, so stale crops are not served"""
+        labels = ImageLabel.objects.all()
+        key = export_key(labels)
+        path = os.path.join(self.static_root, 'images', 'a.png')
+        PILImage.new('RGB', (100, 80), (255, 0, 0)).save(path)
+        os.utime(path, ns=(0, 1))
+        self.assertNotEqual(export_key(labels), key)
+
+
+    def test_unreadable_image_fails_the_export(self):
+        """Test an image that cannot be opened fails the export instead of storing a partial archive"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        store = DatasetExportStore(directory)
+        os.remove(os.path.join(self.static_root, 'images', 'b.png'))
+        labels = ImageLabel.objects.all()
+
+        with self.assertRaises(DatasetError):
+            store.write(export_key(labels), stream_dataset_zip(labels, processes=1))
+        self.assertIsNone(store.get(export_key(labels)))
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_one_claim_per_export(self):
+        """Test only one task renders a key until it is released or times out"""
+        store = DatasetExportStore(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, store.directory, ignore_errors=True)
+        self.assertTrue(store.claim('k', 'task-1'))
+        self.assertFalse(store.claim('k', 'task-2'))
+        self.assertEqual(store.pending('k'), 'task-1')
+        with self.settings(DATASET_EXPORT_TIMEOUT_SECONDS=-1):
+            self.assertTrue(store.claim('k', 'task-3'))
+        self.assertEqual(store.pending('k'), 'task-3')
+        store.release('k')
+        self.assertIsNone(store.pending('k'))
+
+
+class CocoExportTests(TestCase):
+    """Test the incremental COCO export"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(STATIC_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.store = ArtifactStore(os.path.join(self.root, 'artifacts'))
+
+        os.makedirs(os.path.join(self.root, 'images'))
+        source = ImageSourceType.objects.create(description='test')
+        CategoryType.objects.create(category_name='Buildings')
+        CategoryType.objects.create(category_name='Trees')
+        self.images = []
+        for name in ('a.png', 'b.png'):
+            PILImage.new('RGB', (100, 80)).save(os.path.join(self.root, 'images', name))
+            image = Image.objects.create(name=name, path='localhost/static/images/', source=source)
+            save_image_label(image, None, labeling_session(name))
+            self.images.append(image)
+        self.window = ImageWindow.objects.create(x=0, y=0, width=64, height=48)
+        ImageLabel.objects.update(window=self.window)
+
+    def export(self):
+        return export_coco(ImageLabel.objects.all(), name='nightly', processes=1,
+                           store=self.store, directory=os.path.join(self.root, 'coco'))
+
+    def test_dataset(self):
+        """Test images and RLE annotations are written in COCO layout"""
+        stats = self.export()
+        with open(os.path.join(stats['path'], 'annotations.json')) as f:
+            dataset = json.load(f)
+        self.assertEqual(len(dataset['images']), 2)
+        self.assertEqual(len(dataset['annotations']), 4)
+        self.assertEqual({c['name'] for c in dataset['categories']}, {'Buildings', 'Trees'})
+
+        building = dataset['annotations'][0]
+        self.assertEqual(building['bbox'], [2, 2, 10, 10])
+        self.assertEqual(building['area'], 100)
+        self.assertEqual(sum(building['segmentation']['counts']), 64 * 48)
+        for image in dataset['images']:
+            crop = PILImage.open(os.path.join(stats['path'], 'images', image['file_name']))
+            self.assertEqual(crop.size, (64, 48))
+
+    def test_only_changes_are_rendered(self):
+        """Test a second export renders new labels only and drops replaced ones"""
+        stats = self.export()
+        self.assertEqual((stats['annotations_rendered'], stats['crops_rendered']), (2, 2))
+
+        stats = self.export()
+        self.assertEqual((stats['annotations_rendered'], stats['annotations_reused']), (0, 2))
+        self.assertEqual(stats['crops_rendered'], 0)
+
+        ImageLabel.objects.filter(image=self.images[0]).delete()
+        label, _ = save_image_label(self.images[0], None, labeling_session('a.png', offset=10))
+        ImageLabel.objects.filter(id=label.id).update(window=self.window)
+        stats = self.export()
+        self.assertEqual((stats['annotations_rendered'], stats['annotations_reused']), (1, 1))
+        # Same image and window, so the crop is reused under the new file name
+        self.assertEqual((stats['crops_rendered'], stats['crops_reused']), (0, 2))
+        self.assertEqual(stats['images_removed'], 1)
+        self.assertEqual(len(os.listdir(os.path.join(stats['path'], 'images'))), 2)
+
+    def test_rewritten_image_renders_new_crops(self):
+        """Test replacing an image file invalidates its crops"""
+        self.export()
+        path = os.path.join(self.root, 'images', 'a.png')
+        PILImage.new('RGB', (100, 80), (255, 0, 0)).save(path)
+        os.utime(path, ns=(0, 1))
+        stats = self.export()
+        self.assertEqual((stats['crops_rendered'], stats['crops_reused']), (1, 1))
+        crop = PILImage.open(os.path.join(stats['path'], 'images', f"a_0_0_{ImageLabel.objects.get(image=self.images[0]).id}.png"))
+        self.assertEqual(crop.getpixel((0, 0)), (255, 0, 0))
+
+    def test_unreadable_image_is_skipped_with_its_annotations(self):
+        """Test windows of an image that cannot be read leave no dangling annotations"""
+        os.remove(os.path.join(self.root, 'images', 'b.png'))
+        stats = self.export()
+        self.assertEqual(stats['images_skipped'], 1)
+        with open(os.path.join(stats['path'], 'annotations.json')) as f:
+            dataset = json.load(f)
+        image_ids = {image['id'] for image in dataset['images']}
+        self.assertEqual(len(image_ids), 1)
+        self.assertTrue(dataset['annotations'])
+        self.assertTrue(all(annotation['image_id'] in image_ids for annotation in dataset['annotations']))
+        self.assertEqual(os.listdir(os.path.join(stats['path'], 'images')), [f"a_0_0_{min(image_ids)}.png"])
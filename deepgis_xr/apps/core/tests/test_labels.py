@@ -0,0 +1,123 @@
+import os
+import time
+import unittest
+
+from django.test import TestCase
+
+from deepgis_xr.apps.core.models import (
+    CategoryLabel, CategoryType, Image, ImageLabel, ImageSourceType, ImageWindow
+)
+from deepgis_xr.apps.core.utils.labels import label_payload_cache, latest_label_payloads, save_image_label
+
+
+def session(count, categories=('Buildings', 'Roads')):
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [i, i]},
+            'properties': {'category': categories[i % len(categories)], 'color': '#00FF00'}
+        }
+        for i in range(count)
+    ]
+    return {'features': features, 'metadata': {'image': 'test.jpg', 'timeTaken': 12}}
+
+
+class SaveImageLabelTests(TestCase):
+    """Test the bulk labeling session save"""
+    
+    def setUp(self):
+        source = ImageSourceType.objects.create(description="test")
+        self.image = Image.objects.create(name="test.jpg", path="/test/", source=source)
+        ImageWindow.objects.create(x=0, y=0, width=1920, height=1080)
+        
+    def test_categories_created_in_bulk(self):
+        """Test one CategoryLabel per category, with new categories created"""
+        CategoryType.objects.create(category_name='Buildings')
+        
+        # The query count does not grow with the number of features
+        with self.assertNumQueries(14):
+            image_label, created = save_image_label(self.image, None, session(1000))
+        
+        self.assertTrue(created)
+        self.assertEqual(image_label.time_taken, 12)
+        labels = CategoryLabel.objects.filter(parent_label=image_label)
+        self.assertEqual(sorted(label.category.category_name for label in labels), ['Buildings', 'Roads'])
+        roads = CategoryType.objects.get(category_name='Roads')
+        self.assertEqual((roads.color.red, roads.color.green, roads.color.blue), (0, 255, 0))
+        
+    def test_retry_is_deduplicated(self):
+        """Test an identical payload does not create a second revision"""
+        first, created = save_image_label(self.image, None, session(10))
+        second, created_again = save_image_label(self.image, None, session(10))
+        
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(ImageLabel.objects.count(), 1)
+        
+        changed = session(11)
+        third, created = save_image_label(self.image, None, changed)
+        self.assertTrue(created)
+        self.assertNotEqual(third.id, first.id)
+        
+    def test_reverting_saves_a_new_revision(self):
+        """Test going back to an earlier payload is saved and becomes the latest label"""
+        save_image_label(self.image, None, session(1))
+        save_image_label(self.image, None, session(2))
+        reverted, created = save_image_label(self.image, None, session(1))
+        
+        self.assertTrue(created)
+        self.assertEqual(ImageLabel.objects.count(), 3)
+        self.assertEqual(Image.objects.get(id=self.image.id).latest_label_id, reverted.id)
+        
+        # Only the latest revision is matched for retries
+        retried, created = save_image_label(self.image, None, session(1))
+        self.assertFalse(created)
+        self.assertEqual(retried.id, reverted.id)
+        
+    def test_large_session(self):
+        """Test thousands of features across many categories save in one label"""
+        save_image_label(self.image, None, session(5000, categories=[f'c{i}' for i in range(50)]))
+        self.assertEqual(CategoryLabel.objects.count(), 50)
+
+    @unittest.skipUnless(os.environ.get('LATENCY_TESTS') == '1', 'set LATENCY_TESTS=1 to check timings')
+    def test_large_session_latency(self):
+        """Test thousands of features save well under a second"""
+        start = time.perf_counter()
+        save_image_label(self.image, None, session(5000, categories=[f'c{i}' for i in range(50)]))
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+
+class LatestLabelTests(TestCase):
+    """Test the latest label pointer and payload cache"""
+    
+    def setUp(self):
+        source = ImageSourceType.objects.create(description="test")
+        self.image = Image.objects.create(name="test.jpg", path="/test/", source=source)
+        ImageWindow.objects.create(x=0, y=0, width=1920, height=1080)
+        label_payload_cache.clear()
+        self.addCleanup(label_payload_cache.clear)
+        
+    def test_pointer_follows_saves(self):
+        """Test the newest save is served, parsed once"""
+        save_image_label(self.image, None, session(1))
+        latest, _ = save_image_label(self.image, None, session(2))
+        
+        image = Image.objects.get(id=self.image.id)
+        self.assertEqual(image.latest_label_id, latest.id)
+        with self.assertNumQueries(1):
+            payload = latest_label_payloads([image])[image.id]
+        self.assertEqual(len(payload['features']), 2)
+        with self.assertNumQueries(0):
+            self.assertIs(latest_label_payloads([image])[image.id], payload)
+        
+    def test_pointer_restored_after_delete(self):
+        """Test deleting the latest label falls back to the previous one"""
+        first, _ = save_image_label(self.image, None, session(1))
+        latest, _ = save_image_label(self.image, None, session(2))
+        latest.delete()
+        
+        image = Image.objects.get(id=self.image.id)
+        self.assertIsNone(image.latest_label_id)
+        self.assertEqual(len(latest_label_payloads([image])[image.id]['features']), 1)
+        self.assertEqual(Image.objects.get(id=self.image.id).latest_label_id, first.id)
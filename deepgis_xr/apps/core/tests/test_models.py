@@ -1,10 +1,11 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from shapely.geometry import box
 
 from deepgis_xr.apps.core.models import (
     Color, CategoryType, Image, ImageSourceType,
-    Labeler, ImageWindow, ImageLabel, CategoryLabel
+    Labeler, ImageWindow, ImageLabel, CategoryLabel, TiledGISLabel
 )
 
 User = get_user_model()
@@ -103,4 +104,26 @@ class ImageLabelTests(TestCase):
             time_taken=60
         )
         self.assertIsNotNone(label.pub_date)
-        self.assertEqual(label.time_taken, 60) 
\ No newline at end of file
+        self.assertEqual(label.time_taken, 60) 
+
+
+class TiledGISLabelTests(TestCase):
+    """Test TiledGISLabel geometry storage"""
+    
+    def test_bounds_derived_from_geometry(self):
+        """Test the bbox columns follow the WKB geometry on save"""
+        label = TiledGISLabel(label_json={'type': 'Feature', 'properties': {}})
+        label.shape = box(10, 20, 11, 22)
+        label.save()
+        
+        label = TiledGISLabel.objects.get(id=label.id)
+        self.assertIsInstance(bytes(label.geometry), bytes)
+        self.assertEqual(
+            (label.southwest_lng, label.southwest_lat, label.northeast_lng, label.northeast_lat),
+            (10, 20, 11, 22)
+        )
+        self.assertEqual(label.geojson['type'], 'Polygon')
+        
+        label.shape = box(0, 0, 1, 1)
+        label.save()
+        self.assertEqual(TiledGISLabel.objects.get(id=label.id).northeast_lat, 1)
@@ -0,0 +1,82 @@
+import io
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.core.utils.masks import load_instance_masks, save_instance_masks
+from deepgis_xr.apps.core.utils.rasterize import (
+    iter_instance_masks, parse_svg_shapes, rasterize_instances, rasterize_svg
+)
+
+
+class RasterizeTests(SimpleTestCase):
+    """Test in-memory rasterization of label shapes"""
+
+    def test_instance_ids(self):
+        """Test each shape is burnt with its own id and pixel centers decide coverage"""
+        svg = (
+            '<path d="M0 0 L10 0 L10 10 L0 10 Z"/>'
+            '<polygon points="20,20 30,20 30,30 20,30"/>'
+            '<circle cx="5" cy="5" r="3" transform="translate(40,0)"/>'
+        )
+        mask = rasterize_svg(svg, (50, 50), dtype=np.uint8)
+        self.assertEqual(np.count_nonzero(mask == 1), 100)
+        self.assertEqual(np.count_nonzero(mask == 2), 100)
+        self.assertEqual(mask[5, 45], 3)
+        self.assertEqual(mask[5, 5], 1)
+        self.assertEqual(mask[10, 10], 0)
+        self.assertTrue(set(np.unique(mask)) <= {0, 1, 2, 3})
+
+    def test_circle_matches_analytic_disk(self):
+        """Test circles agree with the exact disk away from its boundary"""
+        mask = rasterize_svg('<circle cx="100.3" cy="99.7" r="60.2"/>', (200, 200)).astype(bool)
+        ys, xs = np.mgrid[:200, :200] + 0.5
+        distance = np.hypot(xs - 100.3, ys - 99.7)
+        away = np.abs(distance - 60.2) > 0.05
+        np.testing.assert_array_equal(mask[away], (distance < 60.2)[away])
+
+    def test_holes_and_curves(self):
+        """Test the nonzero rule keeps holes and curves are flattened"""
+        donut = 'M0 0 L20 0 L20 20 L0 20 Z M5 5 L5 15 L15 15 L15 5 Z'
+        mask = rasterize_svg(f'<path d="{donut}"/>', (20, 20))
+        self.assertEqual(mask.sum(), 300)
+        self.assertEqual(mask[10, 10], 0)
+
+        # Relative cubic curves bulging right of the line x = 0
+        curve = rasterize_svg('<path d="M0 0 c5 0 10 5 10 10 s-5 10 -10 10 z"/>', (20, 20))
+        self.assertTrue(curve[10, 8])
+        self.assertFalse(curve[1, 8])
+
+    def test_shapes_outside_the_window_are_clipped(self):
+        """Test shapes partly or wholly outside the mask do not fail"""
+        shapes = parse_svg_shapes('<rect x="-5" y="-5" width="10" height="10"/><circle cx="500" cy="500" r="4"/>')
+        masks = rasterize_instances(shapes, (8, 8))
+        self.assertEqual(masks.shape, (2, 8, 8))
+        self.assertEqual(masks[0].sum(), 25)
+        self.assertFalse(masks[1].any())
+
+
+class InstanceMaskFileTests(SimpleTestCase):
+    """Test compact instance mask files"""
+
+    def test_round_trip(self):
+        """Test masks are stored one plane per shape and decoded on demand"""
+        shapes = parse_svg_shapes(
+            '<rect x="0" y="0" width="1920" height="540"/><circle cx="960" cy="800" r="200"/>'
+        )
+        buffer = io.BytesIO()
+        save_instance_masks(buffer, iter_instance_masks(shapes, (1080, 1920)), [3, 7], (1080, 1920))
+        self.assertLess(buffer.tell(), 10000)
+
+        buffer.seek(0)
+        masks = load_instance_masks(buffer)
+        self.assertEqual(len(masks), 2)
+        self.assertEqual(masks.class_ids.tolist(), [3, 7])
+        np.testing.assert_array_equal(masks.to_array(), rasterize_instances(shapes, (1080, 1920)))
+        self.assertEqual(masks[-1].shape, (1080, 1920))
+        self.assertTrue(masks[1][800, 960])
+
+    def test_class_ids_must_match(self):
+        """Test a class id is required for every mask"""
+        with self.assertRaises(ValueError):
+            save_instance_masks(io.BytesIO(), np.zeros((2, 4, 4), bool), [1], (4, 4))
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.core.utils.rasterize import rasterize_svg
+from deepgis_xr.apps.core.utils.shapes import (
+    SHAPE_CIRCLE, SHAPE_LINE, SHAPE_POLYGON, ShapeTableCache, parse_shapes
+)
+
+SVG = (
+    '<svg><g id="Trees"><circle cx="5" cy="5" r="2" transform="translate(10,0)"/>'
+    '<path d="M0 0 L4 0 L4 4 Z"/></g>'
+    '<g id="Roads"><polygon points="20,20 30,20 30,30"/></g></svg>'
+)
+
+GEOJSON = {
+    'features': [
+        {'geometry': {'type': 'Point', 'coordinates': [15, 5, 2]}, 'properties': {'category': 'Trees'}},
+        {'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [4, 0], [4, 4], [0, 0]]]},
+         'properties': {'category': 'Trees'}},
+        {'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [9, 9]]}, 'properties': {'category': 'Roads'}},
+    ]
+}
+
+
+class ShapeTableTests(SimpleTestCase):
+    """Test the array-backed shape table shared by counting, masking and export"""
+
+    def test_svg_and_geojson_tables(self):
+        """Test both payload formats give type codes, categories and flat coordinates"""
+        table = parse_shapes(SVG)
+        self.assertEqual(table.types.tolist(), [SHAPE_CIRCLE, SHAPE_POLYGON, SHAPE_POLYGON])
+        self.assertEqual([table.category(i) for i in range(len(table))], ['Trees', 'Trees', 'Roads'])
+        self.assertEqual(table.coords.dtype, np.float32)
+        np.testing.assert_array_equal(table.bounds()[0], [13, 3, 17, 7])
+
+        table = parse_shapes(json.dumps(GEOJSON))
+        self.assertEqual(table.types.tolist(), [SHAPE_CIRCLE, SHAPE_POLYGON, SHAPE_LINE])
+        self.assertEqual(table.counts(), {
+            ('Trees', 'circle'): 1, ('Trees', 'polygon'): 1, ('Roads', 'line'): 1
+        })
+
+    def test_masks_match_rasterizer(self):
+        """Test masks from the table are those of the SVG rasterizer"""
+        table = parse_shapes(SVG)
+        ids = rasterize_svg(SVG, (32, 32))
+        for index, mask in enumerate(table.iter_masks((32, 32))):
+            np.testing.assert_array_equal(mask, ids == index + 1)
+
+    def test_overlapping(self):
+        """Test bbox overlap tests skip shapes away from the window and shapes without area"""
+        table = parse_shapes(GEOJSON)
+        self.assertEqual(table.overlapping((0, 0, 10, 10)).tolist(), [1])
+        self.assertEqual(table.overlapping((0, 0, 10, 10), with_area=False).tolist(), [1, 2])
+
+    def test_cache_follows_content(self):
+        """Test a label is parsed once per content hash"""
+        cache = ShapeTableCache(max_entries=1)
+        table = cache.get(1, SVG, 'a')
+        self.assertIs(cache.get(1, SVG, 'a'), table)
+        self.assertIsNot(cache.get(1, json.dumps(GEOJSON), 'b'), table)
+        cache.get(2, SVG)
+        self.assertEqual(len(cache.get(1, SVG, 'a')), 3)
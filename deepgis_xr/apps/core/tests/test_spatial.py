@@ -0,0 +1,115 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, TransactionTestCase
+
+from deepgis_xr.apps.core.models import TiledGISLabel
+from deepgis_xr.apps.core.utils.spatial import LabelSpatialIndex, tiled_label_index
+
+
+def make_label(minx, miny, maxx, maxy, **kwargs):
+    return TiledGISLabel(
+        southwest_lng=minx, southwest_lat=miny,
+        northeast_lng=maxx, northeast_lat=maxy,
+        label_json={}, geometry=None, **kwargs
+    )
+
+
+class LabelSpatialIndexTests(TestCase):
+    """Test the R-tree sidecar of TiledGISLabel bboxes"""
+    
+    def setUp(self):
+        version_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, version_dir, ignore_errors=True)
+        settings_override = self.settings(SPATIAL_INDEX_VERSION_DIR=version_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tiled_label_index.reset()
+        self.addCleanup(tiled_label_index.reset)
+        
+    def test_candidates_follow_label_changes(self):
+        """Test saves, deletes and bulk inserts are reflected in queries"""
+        first = make_label(0, 0, 1, 1)
+        first.save()
+        self.assertEqual(tiled_label_index.candidates([0.5, 0.5, 2, 2]), [first.id])
+        
+        # Saved through signals once the index is built
+        second = make_label(5, 5, 6, 6)
+        second.save()
+        self.assertEqual(tiled_label_index.candidates([4, 4, 7, 7]), [second.id])
+        
+        # Moved labels leave their old position
+        second.southwest_lng, second.northeast_lng = 10, 11
+        second.save()
+        self.assertEqual(tiled_label_index.candidates([4, 4, 7, 7]), [])
+        self.assertEqual(tiled_label_index.candidates([9, 4, 12, 7]), [second.id])
+        
+        # bulk_create sends no signals and is caught up by id
+        TiledGISLabel.objects.bulk_create([make_label(20, 20, 21, 21)])
+        bulk_id = TiledGISLabel.objects.get(southwest_lng=20).id
+        self.assertEqual(tiled_label_index.candidates([19, 19, 22, 22]), [bulk_id])
+        
+        first.delete()
+        self.assertEqual(tiled_label_index.candidates([0.5, 0.5, 2, 2]), [])
+
+    def test_late_commit_below_indexed_id(self):
+        """Test a row committed after a higher id was indexed is still picked up"""
+        low, high = make_label(0, 0, 1, 1), make_label(5, 5, 6, 6)
+        low.save()
+        high.save()
+        tiled_label_index.ensure_current()
+        # Stands in for a slower transaction committing the lower id afterwards
+        pk = low.pk
+        TiledGISLabel.objects.filter(pk=pk).delete()
+        tiled_label_index.reset()
+        tiled_label_index.ensure_current()
+        self.assertEqual(tiled_label_index.candidates([0.5, 0.5, 2, 2]), [])
+
+        TiledGISLabel.objects.bulk_create([make_label(0, 0, 1, 1, id=pk)])
+        self.assertEqual(tiled_label_index.candidates([0.5, 0.5, 2, 2]), [pk])
+
+
+class SharedVersionTests(TransactionTestCase):
+    """Test indexes in other processes rebuild after labels are moved or deleted"""
+
+    def setUp(self):
+        self.version_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.version_dir, ignore_errors=True)
+        settings_override = self.settings(SPATIAL_INDEX_VERSION_DIR=self.version_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tiled_label_index.reset()
+        self.addCleanup(tiled_label_index.reset)
+
+    def test_moves_elsewhere_trigger_a_rebuild(self):
+        """Test an index built in another process sees moves and deletes made here"""
+        # Stands in for the index of another process, which gets no signals from this one
+        other = LabelSpatialIndex(TiledGISLabel)
+        label = make_label(0, 0, 1, 1)
+        label.save()
+        kept = make_label(5, 5, 6, 6)
+        kept.save()
+        self.assertEqual(other.candidates([0.5, 0.5, 2, 2]), [label.id])
+        self.assertEqual(tiled_label_index.candidates([0.5, 0.5, 2, 2]), [label.id])
+
+        label.southwest_lng, label.northeast_lng = 10, 11
+        label.save()
+        self.assertEqual(other.candidates([9, 0, 12, 2]), [label.id])
+        self.assertEqual(other.candidates([0.5, 0.5, 2, 2]), [])
+
+        label.delete()
+        self.assertEqual(other.candidates([9, 0, 12, 2]), [])
+        self.assertEqual(other.candidates([4, 4, 7, 7]), [kept.id])
+
+    def test_own_changes_do_not_rebuild(self):
+        """Test the saving process keeps its index when nobody else bumped the counter"""
+        label = make_label(0, 0, 1, 1)
+        label.save()
+        tiled_label_index.ensure_current()
+        label.southwest_lng, label.northeast_lng = 10, 11
+        label.save()
+        self.assertEqual(tiled_label_index.shared_version(), 1)
+        self.assertEqual(tiled_label_index._version, 1)
+
+        LabelSpatialIndex(TiledGISLabel).bump_version()
+        self.assertNotEqual(tiled_label_index._version, tiled_label_index.shared_version())
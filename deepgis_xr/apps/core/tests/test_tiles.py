@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+from shapely.geometry import Point, box
+
+from deepgis_xr.apps.core.utils.mvt import (
+    CMD_CLOSE_PATH, CMD_LINE_TO, CMD_MOVE_TO, GEOM_POINT, GEOM_POLYGON, encode_geometry
+)
+from deepgis_xr.apps.core.utils.tiles import LabelTileCache, tile_bounds, tiles_for_bounds
+
+
+def decode_commands(commands):
+    """Split command integers into (command id, count, parameters)"""
+    result, i = [], 0
+    while i < len(commands):
+        command, count = commands[i] & 0x7, commands[i] >> 3
+        size = 0 if command == CMD_CLOSE_PATH else 2 * count
+        result.append((command, count, commands[i + 1:i + 1 + size]))
+        i += 1 + size
+    return result
+
+
+class MVTEncodingTests(SimpleTestCase):
+    """Test vector tile geometry encoding"""
+
+    def test_polygon_rings(self):
+        """Test exterior rings are closed, y-flipped and wound clockwise"""
+        geom_type, commands = encode_geometry(box(0, 0, 16, 16), (0, 0, 4096, 4096), 256)
+        self.assertEqual(geom_type, GEOM_POLYGON)
+        steps = decode_commands(commands)
+        self.assertEqual([(c, n) for c, n, _ in steps], [(CMD_MOVE_TO, 1), (CMD_LINE_TO, 3), (CMD_CLOSE_PATH, 1)])
+        # Zigzag decode and accumulate deltas into absolute positions
+        values = [(v >> 1) ^ -(v & 1) for v in steps[0][2] + steps[1][2]]
+        x = y = 0
+        points = []
+        for dx, dy in zip(values[::2], values[1::2]):
+            x, y = x + dx, y + dy
+            points.append((x, y))
+        self.assertEqual(set(points), {(0, 256), (1, 256), (1, 255), (0, 255)})
+        area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+        self.assertGreater(area, 0)
+
+    def test_sub_pixel_polygon_is_dropped(self):
+        """Test polygons collapsing below one grid cell produce no geometry"""
+        self.assertEqual(encode_geometry(box(0, 0, 1, 1), (0, 0, 4096, 4096), 256), (None, []))
+        geom_type, _ = encode_geometry(Point(5, 5), (0, 0, 4096, 4096), 256)
+        self.assertEqual(geom_type, GEOM_POINT)
+
+
+class LabelTileCacheTests(SimpleTestCase):
+    """Test tile math and targeted cache invalidation"""
+
+    def test_tiles_for_bounds(self):
+        """Test a point maps to the tile containing it"""
+        xs, ys = tiles_for_bounds([-111.2655, 33.782, -111.2655, 33.782], 10, buffer=0)
+        self.assertEqual((list(xs), list(ys)), ([195], [409]))
+        minx, miny, maxx, maxy = tile_bounds(0, 0, 0)
+        self.assertAlmostEqual(maxx, -minx)
+        self.assertAlmostEqual(maxy, -miny)
+
+    def test_invalidation_only_touches_covering_tiles(self):
+        """Test saving a label removes its tiles and keeps the others"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LabelTileCache(directory)
+            bounds = [-111.2655, 33.782, -111.2652, 33.7822]
+            xs, ys = tiles_for_bounds(bounds, 16)
+            cache.put(16, xs[0], ys[0], b'touched')
+            cache.put(16, xs[0] + 10, ys[0], b'elsewhere')
+
+            cache.invalidate_bounds([bounds])
+
+            self.assertIsNone(cache.get(16, xs[0], ys[0]))
+            self.assertEqual(cache.get(16, xs[0] + 10, ys[0]), b'elsewhere')
+            self.assertTrue(os.path.isdir(os.path.join(directory, '16')))
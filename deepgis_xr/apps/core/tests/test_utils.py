@@ -0,0 +1,95 @@
+import numpy as np
+from django.test import SimpleTestCase
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from deepgis_xr.apps.core.utils.utils import (
+    create_tiles, decimated_shape, plan_grid, plan_read, read_tile, read_window
+)
+
+
+class CreateTilesTests(SimpleTestCase):
+    """Test overlapping tile generation"""
+
+    def test_edge_tiles_are_not_repeated(self):
+        """Test tiles shifted back inside the image are emitted once"""
+        image = np.zeros((3, 256, 300), dtype=np.uint8)
+        tiles, positions = create_tiles(image, tile_size=256, overlap=32)
+        self.assertEqual(positions, [(0, 0), (44, 0)])
+        self.assertTrue(all(tile.shape == (3, 256, 256) for tile in tiles))
+
+
+class DecimatedShapeTests(SimpleTestCase):
+    """Test read resolution selection for large bounds"""
+
+    def test_small_window_is_read_at_full_resolution(self):
+        """Test windows within limits are not decimated"""
+        self.assertEqual(decimated_shape(800, 600, max_size=1333), (600, 800))
+
+    def test_long_side_matches_model_input(self):
+        """Test wide windows are scaled to the model input size"""
+        self.assertEqual(decimated_shape(40000, 20000, max_size=1000), (500, 1000))
+
+    def test_pixel_budget_caps_decode(self):
+        """Test the pixel budget wins when it is the tighter limit"""
+        height, width = decimated_shape(40000, 40000, max_size=20000, pixel_budget=100 * 100)
+        self.assertEqual((height, width), (100, 100))
+
+
+class ReadTileTests(SimpleTestCase):
+    """Test reading a planned window tile by tile"""
+
+    def test_tiles_match_whole_read(self):
+        """Test a tile has the pixels of the same block of the whole planned read"""
+        data = np.arange(3 * 64 * 96, dtype=np.float32).reshape(3, 64, 96)
+        with MemoryFile() as memfile:
+            with memfile.open(driver='GTiff', width=96, height=64, count=3, dtype='float32',
+                              transform=from_origin(0, 64, 1, 1)) as dataset:
+                dataset.write(data)
+            with memfile.open() as src:
+                for max_size in (None, 48):
+                    window, out_shape, _ = plan_read(src, [8, 8, 88, 56], max_size=max_size)
+                    whole = read_window(src, window, out_shape)
+                    tile = read_tile(src, window, out_shape, 4, 2, 16, 8)
+                    np.testing.assert_allclose(tile, whole[:, 2:10, 4:20])
+
+
+class PlanGridTests(SimpleTestCase):
+    """Test prediction reads are snapped to a fixed grid"""
+
+    def setUp(self):
+        self.memfile = MemoryFile()
+        with self.memfile.open(driver='GTiff', width=1000, height=800, count=3, dtype='uint8',
+                               transform=from_origin(0, 800, 1, 1)) as dataset:
+            dataset.write(np.zeros((3, 800, 1000), dtype=np.uint8))
+        self.src = self.memfile.open()
+
+    def tearDown(self):
+        self.src.close()
+        self.memfile.close()
+
+    def test_pans_share_cells(self):
+        """Test nearby bounds at the same zoom resolve to the same cells"""
+        level, _, first = plan_grid(self.src, [10, 410, 300, 790], 256, 32)
+        _, _, second = plan_grid(self.src, [15.5, 405.25, 305.5, 785.25], 256, 32)
+        self.assertEqual(level, 0)
+        self.assertEqual([cell[:2] for cell in first], [cell[:2] for cell in second])
+        self.assertEqual([cell[2] for cell in first], [cell[2] for cell in second])
+
+    def test_cells_cover_area_and_clip_to_raster(self):
+        """Test cells step by the stride, cover the request and stop at the raster edge"""
+        _, area, cells = plan_grid(self.src, [900, 0, 1000, 300], 256, 32)
+        self.assertEqual(area, (900.0, 500.0, 1000.0, 800.0))
+        self.assertEqual([cell[:2] for cell in cells], [(4, 2), (4, 3)])
+        column, row, window, out_shape, transform = cells[-1]
+        self.assertEqual((window.col_off, window.row_off, window.width, window.height), (896, 672, 104, 128))
+        self.assertEqual(out_shape, (128, 104))
+        self.assertEqual(transform * (0, 0), (896.0, 128.0))
+
+    def test_zoomed_out_reads_are_decimated(self):
+        """Test wide bounds pick a power-of-two level within max_size"""
+        level, area, cells = plan_grid(self.src, [0, 0, 1000, 800], 256, 0, max_size=300)
+        self.assertEqual(level, 2)
+        self.assertEqual(area, (0.0, 0.0, 250.0, 200.0))
+        self.assertEqual(len(cells), 1)
+        self.assertEqual(cells[0][3], (200, 250))
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from deepgis_xr.apps.core.models import ImageLabel
+from deepgis_xr.apps.core.utils.export import (
+    LABEL_FIELDS, crop_png, export_categories, image_location, image_version, open_image, parallel_map,
+    window_instances
+)
+from deepgis_xr.apps.core.utils.masks import encode_rle
+from deepgis_xr.apps.core.utils.rasterize import iter_instance_masks
+from deepgis_xr.apps.core.utils.shapes import ShapeTable, shape_table_cache
+
+# Bump when annotation fragments change so stored ones are not reused
+COCO_FORMAT_VERSION = 1
+
+EXPORT_NAME_PATTERN = re.compile(r'^[\w-]+$')
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class ArtifactStore:
+    """Export artifacts on disk addressed by the hash of their inputs
+
+    Files are laid out as <key[:2]>/<key><extension> and written through a
+    temporary file, so a stored artifact is always complete.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'DATASET_ARTIFACT_DIR',
+                       os.path.join(settings.MEDIA_ROOT, 'exports', 'artifacts'))
+
+    def path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}{extension}')
+
+    def exists(self, key: str, extension: str) -> bool:
+        return os.path.exists(self.path(key, extension))
+
+    def get(self, key: str, extension: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key, extension), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: str, extension: str, data: bytes):
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+artifact_store = ArtifactStore()
+
+
+def window_annotations(table: ShapeTable,
+                       categories: Dict[str, int],
+                       shape: Tuple[int, int]) -> List[Dict[str, Any]]:
+    """COCO annotations of one label window, without image or annotation ids
+
+    Segmentations are uncompressed RLE, shapes entirely outside the
+    window are dropped.
+    """
+    shapes, class_ids = window_instances(table, categories, shape)
+    annotations = []
+    for category_id, mask in zip(class_ids, iter_instance_masks(shapes, shape)):
+        rows = np.flatnonzero(mask.any(axis=1))
+        if len(rows) == 0:
+            continue
+        columns = np.flatnonzero(mask.any(axis=0))
+        counts, _ = encode_rle(mask[None])
+        annotations.append({
+            'category_id': category_id,
+            'segmentation': {'counts': counts.tolist(), 'size': list(shape)},
+            'area': int(mask.sum()),
+            'bbox': [int(columns[0]), int(rows[0]),
+                     int(columns[-1] - columns[0] + 1), int(rows[-1] - rows[0] + 1)],
+            'iscrowd': 0
+        })
+    return annotations
+
+
+def render_coco_windows(job: Dict[str, Any]) -> List[Tuple[int, Optional[bytes], Optional[bytes]]]:
+    """(label id, PNG crop, annotations JSON) of the windows of one image that need them
+
+    Runs in a worker process. The image is only opened when a crop is
+    missing, and then once for all windows.
+    """
+    image = None
+    if any(window['crop'] for window in job['windows']):
+        image = open_image(job['location'])
+
+    results = []
+    for window in job['windows']:
+        crop = None
+        if window['crop'] and image is not None:
+            crop = crop_png(image, window['window'])
+        annotations = None
+        if window['annotations']:
+            _, _, width, height = window['window']
+            annotations = json.dumps(
+                window_annotations(window['table'], job['categories'], (height, width))
+            ).encode()
+        results.append((window['id'], crop, annotations))
+    return results
+
+
+def _label_texts(label_ids: List[int], batch_size: int = 500) -> Dict[int, str]:
+    texts = {}
+    for start in range(0, len(label_ids), batch_size):
+        texts.update(
+            ImageLabel.objects.filter(id__in=label_ids[start:start + batch_size])
+            .values_list('id', 'combined_label_shapes')
+        )
+    return texts
+
+
+def export_coco(labels,
+                name: str = 'default',
+                processes: Optional[int] = None,
+                store: Optional[ArtifactStore] = None,
+                directory: Optional[str] = None) -> Dict[str, Any]:
+    """Write a COCO dataset of an ImageLabel queryset, rendering only what changed
+
+    Crops are addressed by image location, image_version() and window,
+    annotation fragments by label content, window and category ids.
+    Artifacts already in the store are reused, the rest are rendered in a
+    process pool. The dataset is written to <directory>/<name>/ as
+    annotations.json, manifest.json (label id to artifact keys) and images/
+    linked to the stored crops. COCO image ids are label ids. Windows whose
+    image could not be read are left out with their annotations.
+
+    Returns counts of rendered and reused crops and annotation fragments,
+    of images removed since the last export and skipped in this one, and
+    the dataset path.
+    """
+    if not EXPORT_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid export name: {name}")
+    if processes is None:
+        processes = getattr(settings, 'DATASET_EXPORT_PROCESSES', os.cpu_count() or 1)
+    store = store or artifact_store
+    directory = directory or getattr(settings, 'DATASET_COCO_DIR',
+                                     os.path.join(settings.MEDIA_ROOT, 'exports', 'coco'))
+    output = os.path.join(directory, name)
+    categories = export_categories()
+    categories_key = sorted(categories.items())
+
+    rows = list(labels.order_by('image_id', 'id').values_list(*LABEL_FIELDS, 'content_hash'))
+    # Labels saved before content hashes were recorded are hashed from their payload
+    texts = _label_texts([row[0] for row in rows if not row[8]])
+
+    manifest = {}
+    jobs = {}
+    versions = {}
+    stats = {'crops_rendered': 0, 'crops_reused': 0, 'annotations_rendered': 0, 'annotations_reused': 0}
+    for label_id, image_id, path, image_name, x, y, width, height, content_hash in rows:
+        window = (x, y, width, height)
+        location = image_location(path, image_name)
+        if image_id not in versions:
+            versions[image_id] = image_version(location)
+        content_hash = content_hash or hashlib.sha256((texts.get(label_id) or '').encode()).hexdigest()
+        entry = {
+            'content_hash': content_hash,
+            'crop': _digest('crop', location, versions[image_id], window),
+            'annotations': _digest('annotations', COCO_FORMAT_VERSION, content_hash, window, categories_key),
+            'file_name': f"{os.path.splitext(image_name)[0]}_{x}_{y}_{label_id}.png",
+            'width': width,
+            'height': height
+        }
+        manifest[label_id] = entry
+
+        need_crop = not store.exists(entry['crop'], '.png')
+        need_annotations = not store.exists(entry['annotations'], '.json')
+        stats['crops_rendered' if need_crop else 'crops_reused'] += 1
+        stats['annotations_rendered' if need_annotations else 'annotations_reused'] += 1
+        if need_crop or need_annotations:
+            job = jobs.setdefault(image_id, {'location': location, 'categories': categories, 'windows': []})
+            job['windows'].append({
+                'id': label_id, 'window': window, 'crop': need_crop,
+                'annotations': need_annotations, 'content_hash': content_hash, 'table': None
+            })
+
+    changed = [window['id'] for job in jobs.values() for window in job['windows'] if window['annotations']]
+    texts.update(_label_texts([label_id for label_id in changed if label_id not in texts]))
+    # Parsed here so the tables stay in this process' cache for the next export
+    for job in jobs.values():
+        for window in job['windows']:
+            if window['annotations']:
+                window['table'] = shape_table_cache.get(window['id'], texts.get(window['id']), window['content_hash'])
+
+    for results in parallel_map(render_coco_windows, jobs.values(), processes):
+        for label_id, crop, annotations in results:
+            if crop is not None:
+                store.put(manifest[label_id]['crop'], '.png', crop)
+            if annotations is not None:
+                store.put(manifest[label_id]['annotations'], '.json', annotations)
+
+    stats['images_removed'], stats['images_skipped'] = _write_dataset(output, manifest, categories, store)
+    stats['path'] = output
+    return stats
+
+
+def _link(source: str, destination: str):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _write_dataset(output: str, manifest: Dict[int, Dict[str, Any]], categories: Dict[str, int],
+                   store: ArtifactStore) -> Tuple[int, int]:
+    """Assemble annotations.json from stored fragments and sync images/
+
+    Windows without a stored crop are left out, annotations included.
+    Returns the number of images removed and of windows skipped.
+    """
+    images_dir = os.path.join(output, 'images')
+    os.makedirs(images_dir, exist_ok=True)
+    try:
+        with open(os.path.join(output, 'manifest.json')) as f:
+            previous = {entry['file_name']: entry for entry in json.load(f).values()}
+    except (OSError, ValueError, KeyError, AttributeError):
+        previous = {}
+
+    # An image that could not be read has no crop, its annotations would point at nothing
+    exported = {label_id: entry for label_id, entry in manifest.items() if store.exists(entry['crop'], '.png')}
+    for label_id in manifest.keys() - exported.keys():
+        print(f"Skipping label {label_id}: no crop of {manifest[label_id]['file_name']}")
+
+    # Drop images of labels no longer exported and crops that changed
+    wanted = {entry['file_name']: entry for entry in exported.values()}
+    removed = 0
+    for file_name in os.listdir(images_dir):
+        entry = wanted.get(file_name)
+        old = previous.get(file_name)
+        if entry is None or old is None or old.get('crop') != entry['crop']:
+            os.remove(os.path.join(images_dir, file_name))
+            removed += entry is None
+
+    images, annotations = [], []
+    for label_id, entry in exported.items():
+        image_path = os.path.join(images_dir, entry['file_name'])
+        if not os.path.exists(image_path):
+            _link(store.path(entry['crop'], '.png'), image_path)
+        images.append({
+            'id': label_id, 'file_name': entry['file_name'],
+            'width': entry['width'], 'height': entry['height']
+        })
+        for annotation in json.loads(store.get(entry['annotations'], '.json') or b'[]'):
+            annotation.update(id=len(annotations) + 1, image_id=label_id)
+            annotations.append(annotation)
+
+    dataset = {
+        'images': images,
+        'annotations': annotations,
+        'categories': [{'id': category_id, 'name': name} for name, category_id in sorted(categories.items())]
+    }
+    _write_json(os.path.join(output, 'annotations.json'), dataset)
+    _write_json(os.path.join(output, 'manifest.json'), {str(k): v for k, v in exported.items()})
+    return removed, len(manifest) - len(exported)
+
+
+def _write_json(path: str, data: Any):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
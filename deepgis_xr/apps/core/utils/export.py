@@ -0,0 +1,342 @@
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from django.conf import settings
+from PIL import Image as PILImage
+
+from deepgis_xr.apps.core.exceptions import DatasetError
+from deepgis_xr.apps.core.models import CategoryType
+from deepgis_xr.apps.core.utils.masks import save_instance_masks
+from deepgis_xr.apps.core.utils.rasterize import iter_instance_masks
+from deepgis_xr.apps.core.utils.shapes import ShapeTable, shape_table_cache
+
+# Bump when the archive layout changes so stored exports are not reused
+EXPORT_FORMAT_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp')
+
+LABEL_FIELDS = (
+    'id', 'image_id', 'image__path', 'image__name',
+    'window__x', 'window__y', 'window__width', 'window__height'
+)
+
+
+def image_location(path: str, name: str) -> str:
+    """Local file of an Image under STATIC_ROOT when there is one, else its URL"""
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        path = f"{path.rstrip('/')}/{name}"
+    if 'static/' in path:
+        local = os.path.join(settings.STATIC_ROOT, path.split('static/', 1)[1])
+        if os.path.exists(local):
+            return local
+    if os.path.isabs(path) and os.path.exists(path):
+        return path
+    if not path.startswith(('http://', 'https://')):
+        path = f"https:{path}" if path.startswith('//') else f"https://{path}"
+    return path
+
+
+def image_version(location: str) -> Optional[Tuple]:
+    """What identifies the current content of an image_location() without reading it
+
+    File size and modification time for local files, the ETag (else
+    Last-Modified, else Content-Length) from a HEAD request for URLs, or
+    None when neither is available.
+    """
+    if not location.startswith(('http://', 'https://')):
+        try:
+            stat = os.stat(location)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+    try:
+        response = requests.head(location, timeout=30, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    for header in ('ETag', 'Last-Modified', 'Content-Length'):
+        if response.headers.get(header):
+            return header, response.headers[header]
+    return None
+
+
+def open_image(location: str) -> Optional[PILImage.Image]:
+    """Decoded image at an image_location(), or None if it cannot be read"""
+    try:
+        if location.startswith(('http://', 'https://')):
+            response = requests.get(location, timeout=30)
+            response.raise_for_status()
+            image = PILImage.open(io.BytesIO(response.content))
+        else:
+            image = PILImage.open(location)
+        image.load()
+    except Exception as e:
+        print(f"Error opening image {location}: {e}")
+        return None
+    return image
+
+
+def crop_png(image: PILImage.Image, window: Tuple[int, int, int, int]) -> bytes:
+    """PNG of the (x, y, width, height) window of an image"""
+    x, y, width, height = window
+    buffer = io.BytesIO()
+    image.crop((x, y, x + width, y + height)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def window_instances(table: ShapeTable,
+                     categories: Dict[str, int],
+                     shape: Tuple[int, int]) -> Tuple[list, List[int]]:
+    """(shape rings, category ids) of the shapes with an area that meet an (H, W) window"""
+    height, width = shape
+    shapes, class_ids = [], []
+    for index in table.overlapping((0, 0, width, height)):
+        category_id = categories.get(table.category(index))
+        if category_id is not None:
+            shapes.append(table.rings(index))
+            class_ids.append(category_id)
+    return shapes, class_ids
+
+
+def render_image_windows(job: Dict[str, Any]) -> List[Tuple[str, bytes]]:
+    """Archive entries of every labeled window of one image
+
+    Runs in a worker process, so it only uses what the job carries. The
+    image is opened once for all its windows. Each window gives a PNG crop
+    in images/ and an instance mask file in labels/, both named
+    <image>_<x>_<y>_<label id>. Raises DatasetError when the image cannot
+    be read.
+    """
+    stem = os.path.splitext(job['name'])[0]
+    image = open_image(job['location'])
+    if image is None:
+        # Fail the export rather than store an archive missing this image's crops
+        raise DatasetError(f"Could not open image {job['location']}")
+
+    entries = []
+    for label_id, window, table in job['windows']:
+        x, y, width, height = window
+        basename = f"{stem}_{x}_{y}_{label_id}"
+        entries.append((f"images/{basename}.png", crop_png(image, window)))
+
+        shapes, class_ids = window_instances(table, job['categories'], (height, width))
+        buffer = io.BytesIO()
+        save_instance_masks(buffer, iter_instance_masks(shapes, (height, width)), class_ids, (height, width))
+        entries.append((f"labels/{basename}.npz", buffer.getvalue()))
+    return entries
+
+
+def export_jobs(labels, categories: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """One render_image_windows() job per image of an ImageLabel queryset, streamed
+
+    Labels are parsed here through shape_table_cache rather than in the
+    workers, whose caches would not outlive the export, so repeated
+    exports from a long-running process reuse the parsed tables.
+    """
+    rows = labels.order_by('image_id', 'id').values_list(*LABEL_FIELDS, 'combined_label_shapes', 'content_hash')
+    for _, group in itertools.groupby(rows.iterator(), key=lambda row: row[1]):
+        group = list(group)
+        _, _, path, name = group[0][:4]
+        yield {
+            'location': image_location(path, name),
+            'name': name,
+            'categories': categories,
+            'windows': [
+                (row[0], tuple(row[4:8]), shape_table_cache.get(row[0], row[8], row[9]))
+                for row in group
+            ]
+        }
+
+
+def parallel_map(function: Callable, items: Iterable, processes: int) -> Iterator:
+    """function over items in a process pool, in order, with a bounded number in flight
+
+    Runs inline in daemonic processes such as Celery prefork workers, which
+    may not start children.
+    """
+    if processes <= 1 or multiprocessing.current_process().daemon:
+        yield from map(function, items)
+        return
+    executor = ProcessPoolExecutor(max_workers=processes)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+class _ChunkSink:
+    """Write-only file object that hands what was written back as chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_entry(name: str, compress_type: int) -> zipfile.ZipInfo:
+    # Fixed timestamps so the same labels always give the same archive
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = compress_type
+    return info
+
+
+def export_categories() -> Dict[str, int]:
+    return dict(CategoryType.objects.values_list('category_name', 'id'))
+
+
+def stream_dataset_zip(labels, processes: Optional[int] = None) -> Iterator[bytes]:
+    """Zip archive of the crops and masks of an ImageLabel queryset, as chunks
+
+    Images are rendered in a process pool and written to the archive as
+    they finish, so nothing is staged on disk and memory is bounded by the
+    images in flight. categories.json maps class ids to category names.
+    """
+    if processes is None:
+        processes = getattr(settings, 'DATASET_EXPORT_PROCESSES', os.cpu_count() or 1)
+    categories = export_categories()
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        archive.writestr(_zip_entry('categories.json', zipfile.ZIP_DEFLATED),
+                         json.dumps({v: k for k, v in categories.items()}))
+        for entries in parallel_map(render_image_windows, export_jobs(labels, categories), processes):
+            for name, data in entries:
+                # PNG and npz payloads are already compressed
+                archive.writestr(_zip_entry(name, zipfile.ZIP_STORED), data)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def export_key(labels) -> str:
+    """Content address of the archive stream_dataset_zip() would produce for labels
+
+    Covers the label rows, the categories and the image_version() of each
+    image, so replacing an image file gives a new key.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([EXPORT_FORMAT_VERSION, sorted(export_categories().items())]).encode())
+    rows = labels.order_by('image_id', 'id').values_list(*LABEL_FIELDS, 'content_hash')
+    for image_id, group in itertools.groupby(rows.iterator(), key=lambda row: row[1]):
+        group = list(group)
+        _, _, path, name = group[0][:4]
+        digest.update(json.dumps([image_id, image_version(image_location(path, name))]).encode())
+        for row in group:
+            digest.update(json.dumps(row, default=str).encode())
+    return digest.hexdigest()
+
+
+class DatasetExportStore:
+    """Dataset archives on disk, named by export_key()
+
+    Identical exports reuse the stored file. Archives are written to a
+    temporary file and renamed when complete, so concurrent exports never
+    see or clobber each other's partial output. An export in progress
+    holds a <key>.pending claim so the same archive is only rendered once.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'DATASET_EXPORT_DIR',
+                       os.path.join(settings.MEDIA_ROOT, 'exports', 'datasets'))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.zip')
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+
+    def stream(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass chunks through, storing them under key once all were read
+
+        Nothing is stored when chunks raises, e.g. an image failed to open.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self.path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write(self, key: str, chunks: Iterable[bytes]) -> str:
+        for _ in self.stream(key, chunks):
+            pass
+        return self.path(key)
+
+    def _pending_path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pending')
+
+    def pending(self, key: str) -> Optional[str]:
+        """Task id of the export claimed for key, None if unclaimed or timed out"""
+        path = self._pending_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > getattr(settings, 'DATASET_EXPORT_TIMEOUT_SECONDS', 6 * 3600):
+                return None
+            with open(path) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def claim(self, key: str, task_id: str) -> bool:
+        """Mark key as being exported by task_id, False if another export holds it"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._pending_path(key)
+        if os.path.exists(path) and self.pending(key) is None:
+            # The claiming worker died or gave up
+            self.release(key)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(task_id)
+        return True
+
+    def release(self, key: str):
+        try:
+            os.remove(self._pending_path(key))
+        except OSError:
+            pass
+
+
+dataset_export_store = DatasetExportStore()
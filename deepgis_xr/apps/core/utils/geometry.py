@@ -0,0 +1,17 @@
+from typing import Optional
+
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+
+def label_geometry(label) -> Optional[BaseGeometry]:
+    """Shapely geometry of a TiledGISLabel, or None if it has none
+
+    Rows whose geometry could not be converted to WKB keep it in label_json.
+    """
+    if label.geometry:
+        return label.shape
+    feature = label.label_json if isinstance(label.label_json, dict) else {}
+    if feature.get('geometry'):
+        return shape(feature['geometry'])
+    return None
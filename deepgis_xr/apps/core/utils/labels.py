@@ -0,0 +1,206 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+
+from deepgis_xr.apps.core.models import CategoryLabel, CategoryType, Color, Image, ImageLabel, Labeler
+
+DEFAULT_CATEGORY_COLOR = '#FF0000'
+
+
+def parse_hex_color(value: Optional[str]) -> Tuple[int, int, int]:
+    """'#RRGGBB' to (r, g, b), falling back to DEFAULT_CATEGORY_COLOR"""
+    for candidate in (value, DEFAULT_CATEGORY_COLOR):
+        try:
+            text = str(candidate).lstrip('#')
+            if len(text) == 6:
+                return tuple(int(text[i:i + 2], 16) for i in (0, 2, 4))
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid color: {value}")
+
+
+def payload_hash(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """Canonical JSON text of a label payload and its SHA-256 hex digest"""
+    text = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return text, hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def resolve_categories(colors_by_name: Dict[str, str]) -> Dict[str, CategoryType]:
+    """CategoryTypes by name, creating missing ones and their colors in bulk
+
+    colors_by_name maps each category name to the hex color used when the
+    category has to be created. Run inside a transaction.
+    """
+    categories = {
+        category.category_name: category
+        for category in CategoryType.objects.filter(category_name__in=list(colors_by_name))
+    }
+    missing = {
+        name: parse_hex_color(color)
+        for name, color in colors_by_name.items() if name not in categories
+    }
+    if not missing:
+        return categories
+
+    rgbs = set(missing.values())
+    query = Q()
+    for red, green, blue in rgbs:
+        query |= Q(red=red, green=green, blue=blue)
+    colors = {(c.red, c.green, c.blue): c for c in Color.objects.filter(query)}
+    if len(colors) < len(rgbs):
+        Color.objects.bulk_create(
+            [Color(red=r, green=g, blue=b) for r, g, b in rgbs if (r, g, b) not in colors],
+            ignore_conflicts=True
+        )
+        colors = {(c.red, c.green, c.blue): c for c in Color.objects.filter(query)}
+
+    # Polygon by default; concurrent saves may have created some already
+    CategoryType.objects.bulk_create([
+        CategoryType(category_name=name, color=colors[rgb], label_type='P')
+        for name, rgb in missing.items()
+    ], ignore_conflicts=True)
+    categories.update(
+        (category.category_name, category)
+        for category in CategoryType.objects.filter(category_name__in=list(missing))
+    )
+    return categories
+
+
+def save_image_label(image: Image,
+                     labeler: Optional[Labeler],
+                     data: Dict[str, Any]) -> Tuple[ImageLabel, bool]:
+    """Save a labeling session as an ImageLabel and its CategoryLabels
+
+    Everything is written in one transaction. A payload identical to the
+    latest label of the same image and labeler, e.g. a client retry,
+    returns that ImageLabel; going back to an earlier revision's payload
+    saves a new one. Returns (image_label, created). Image.latest_label is
+    moved to the new label by a post_save signal.
+    """
+    text, digest = payload_hash(data)
+
+    features_by_name = {}
+    colors_by_name = {}
+    for feature in data['features']:
+        properties = feature.get('properties') or {}
+        category_name = properties.get('category')
+        if not category_name:
+            continue
+        features_by_name.setdefault(category_name, []).append(feature)
+        colors_by_name.setdefault(category_name, properties.get('color', DEFAULT_CATEGORY_COLOR))
+
+    metadata = data.get('metadata') or {}
+    with transaction.atomic():
+        # Serialises saves of the image so a concurrent retry sees the first copy. A no-op
+        # write rather than select_for_update(), which SQLite ignores: it takes the row lock
+        # on PostgreSQL and MySQL and SQLite's database write lock, before anything is read
+        Image.objects.filter(id=image.id).update(latest_label=F('latest_label'))
+        latest = ImageLabel.objects.filter(image=image, labeler=labeler).order_by('-pub_date', '-id').first()
+        if latest is not None and latest.content_hash == digest:
+            return latest, False
+
+        categories = resolve_categories(colors_by_name)
+        image_label = ImageLabel.objects.create(
+            image=image,
+            combined_label_shapes=text,
+            labeler=labeler,
+            time_taken=metadata.get('timeTaken') or None,
+            content_hash=digest
+        )
+        CategoryLabel.objects.bulk_create([
+            CategoryLabel(
+                category=categories[category_name],
+                label_shapes=json.dumps({'type': 'FeatureCollection', 'features': features}),
+                parent_label=image_label
+            )
+            for category_name, features in features_by_name.items()
+        ])
+    return image_label, True
+
+
+class LabelPayloadCache:
+    """Parsed combined_label_shapes by ImageLabel id, least recently used evicted
+
+    Saves create new ImageLabel revisions rather than editing old ones, so
+    entries only need dropping when a label is edited directly (admin).
+    Returned payloads are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[int, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'LABEL_PAYLOAD_CACHE_SIZE', 1024)
+
+    def get_many(self, label_ids: Iterable[int]) -> Dict[int, Any]:
+        """Payloads by label id, parsing the ones not cached with one query"""
+        label_ids = set(label_ids)
+        payloads = {}
+        with self._lock:
+            for label_id in label_ids:
+                if label_id in self._entries:
+                    self._entries.move_to_end(label_id)
+                    payloads[label_id] = self._entries[label_id]
+
+        missing = label_ids - payloads.keys()
+        if missing:
+            rows = ImageLabel.objects.filter(id__in=missing).values_list('id', 'combined_label_shapes')
+            for label_id, text in rows:
+                try:
+                    payloads[label_id] = json.loads(text) if text else None
+                except json.JSONDecodeError:
+                    print(f"Error decoding JSON for label {label_id}")
+                    payloads[label_id] = None
+            with self._lock:
+                for label_id in missing & payloads.keys():
+                    self._entries[label_id] = payloads[label_id]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return payloads
+
+    def discard(self, label_id: int):
+        with self._lock:
+            self._entries.pop(label_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+label_payload_cache = LabelPayloadCache()
+
+
+def latest_label_payloads(images: Iterable[Image]) -> Dict[int, Any]:
+    """Parsed latest label of each Image by image id, None for unlabeled images
+
+    Uses Image.latest_label. Images without the pointer, because they were
+    never labeled or their latest label was deleted, are looked up through
+    the (image, pub_date) index and the pointer is restored.
+    """
+    images = list(images)
+    label_ids = {image.id: image.latest_label_id for image in images if image.latest_label_id}
+
+    missing = [image.id for image in images if not image.latest_label_id]
+    if missing:
+        latest = Image.objects.filter(id__in=missing).annotate(
+            found_label_id=Subquery(
+                ImageLabel.objects.filter(image=OuterRef('pk')).order_by('-pub_date', '-id').values('id')[:1]
+            )
+        ).exclude(found_label_id=None).values_list('id', 'found_label_id')
+        for image_id, label_id in latest:
+            Image.objects.filter(id=image_id, latest_label=None).update(latest_label_id=label_id)
+            label_ids[image_id] = label_id
+
+    payloads = label_payload_cache.get_many(label_ids.values())
+    return {image.id: payloads.get(label_ids.get(image.id)) for image in images}
@@ -0,0 +1,127 @@
+import numpy as np
+from typing import Iterable, Iterator, Sequence, Tuple
+
+
+def encode_rle(masks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Run-length encode a stack of binary masks.
+
+    Masks are read in column-major order and runs alternate starting with
+    background, as in uncompressed COCO RLE. All masks are encoded in one
+    vectorized pass.
+
+    Args:
+        masks: (N, H, W) array, non-zero is foreground
+
+    Returns:
+        counts: uint32 run lengths of all masks concatenated
+        offsets: (N + 1,) int64, runs of mask i are counts[offsets[i]:offsets[i + 1]]
+    """
+    n = masks.shape[0]
+    flat = np.asarray(masks).transpose(0, 2, 1).reshape(n, -1).astype(bool)
+    length = flat.shape[1]
+    if n == 0 or length == 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(n + 1, dtype=np.int64)
+
+    # Run boundaries: start of every row, every value change, end of every row
+    change = np.zeros((n, length + 1), dtype=bool)
+    change[:, 0] = True
+    change[:, 1:length] = flat[:, 1:] != flat[:, :-1]
+    change[:, length] = True
+
+    rows, cols = np.nonzero(change)
+    same_row = rows[1:] == rows[:-1]
+    counts = np.diff(cols)[same_row]
+    per_row = np.bincount(rows[1:][same_row], minlength=n)
+
+    # Masks starting with foreground get a leading empty background run
+    leading = flat[:, 0]
+    starts = np.concatenate([[0], np.cumsum(per_row)[:-1]])
+    counts = np.insert(counts, starts[leading], 0)
+    per_row = per_row + leading
+
+    offsets = np.concatenate([[0], np.cumsum(per_row)]).astype(np.int64)
+    return counts.astype(np.uint32), offsets
+
+
+def decode_rle(counts: np.ndarray, offsets: np.ndarray, index: int, shape: Tuple[int, int]) -> np.ndarray:
+    """Decode mask `index` of an encode_rle() result into an (H, W) bool array."""
+    height, width = shape
+    runs = counts[offsets[index]:offsets[index + 1]]
+    values = (np.arange(len(runs)) % 2).astype(bool)
+    return np.repeat(values, runs).reshape(width, height).T
+
+
+def decode_rle_stack(counts: np.ndarray, offsets: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """Decode every mask of an encode_rle() result into an (N, H, W) bool array."""
+    n = len(offsets) - 1
+    masks = np.zeros((n,) + tuple(shape), dtype=bool)
+    for i in range(n):
+        masks[i] = decode_rle(counts, offsets, i, shape)
+    return masks
+
+
+def save_instance_masks(file, masks: Iterable[np.ndarray], class_ids: Sequence[int], shape: Tuple[int, int]):
+    """Save instance masks as run-length encoded planes in a compressed .npz
+
+    Masks are encoded one (H, W) plane at a time, so a generator reusing
+    a single buffer never holds the whole stack. The file has exactly one
+    plane per instance and is read back with load_instance_masks().
+
+    Args:
+        file: path or binary file object
+        masks: iterable of (H, W) arrays, non-zero is foreground
+        class_ids: category id of each mask
+        shape: (H, W) of the masks
+    """
+    counts, lengths = [], []
+    for mask in masks:
+        mask_counts, _ = encode_rle(np.asarray(mask)[None])
+        counts.append(mask_counts)
+        lengths.append(len(mask_counts))
+    class_ids = np.asarray(class_ids, dtype=np.int64)
+    if len(class_ids) != len(counts):
+        raise ValueError(f"{len(counts)} masks but {len(class_ids)} class ids")
+
+    np.savez_compressed(
+        file,
+        mask_counts=np.concatenate(counts) if counts else np.zeros(0, dtype=np.uint32),
+        mask_offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        mask_shape=np.array(shape, dtype=np.int64),
+        class_ids=class_ids
+    )
+
+
+class InstanceMasks:
+    """Instance masks of a save_instance_masks() file, decoded on access
+
+    Indexing returns one (H, W) bool mask, to_array() the (N, H, W) stack.
+    """
+
+    def __init__(self, counts: np.ndarray, offsets: np.ndarray, shape: Tuple[int, int], class_ids: np.ndarray):
+        self.counts = counts
+        self.offsets = offsets
+        self.shape = tuple(int(v) for v in shape)
+        self.class_ids = class_ids
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return decode_rle(self.counts, self.offsets, index % len(self), self.shape)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_array(self) -> np.ndarray:
+        return decode_rle_stack(self.counts, self.offsets, self.shape)
+
+
+def load_instance_masks(file) -> InstanceMasks:
+    """Read a save_instance_masks() file; only run lengths are loaded"""
+    with np.load(file) as data:
+        return InstanceMasks(
+            data['mask_counts'], data['mask_offsets'], tuple(data['mask_shape']), data['class_ids']
+        )
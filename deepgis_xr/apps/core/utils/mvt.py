@@ -0,0 +1,187 @@
+import struct
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# Mapbox Vector Tile 2.1 geometry types and commands
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return (values << 1) ^ (values >> 63)
+
+
+def _command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+def _value(value: Any) -> bytes:
+    """Encode a property value as a vector_tile.Value message"""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _key(5, 0) + _varint(value)
+        return _key(6, 0) + _varint(int(_zigzag(np.array([value], dtype=np.int64))[0]))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+
+class _GeometryEncoder:
+    """Quantizes shapely geometries to the tile grid and emits command integers
+
+    The cursor position is carried across all parts of a feature, as
+    geometry parameters are deltas from the previous point.
+    """
+
+    def __init__(self, bounds: Sequence[float], extent: int):
+        minx, miny, maxx, maxy = bounds
+        self.origin = np.array([minx, maxy])
+        self.scale = np.array([extent / (maxx - minx), -extent / (maxy - miny)])
+        self.cursor = np.zeros(2, dtype=np.int64)
+        self.commands: List[int] = []
+
+    def _quantize(self, coords) -> np.ndarray:
+        points = np.round((np.asarray(coords, dtype=np.float64)[:, :2] - self.origin) * self.scale).astype(np.int64)
+        # Drop repeated points after snapping to the grid
+        if len(points) > 1:
+            keep = np.ones(len(points), dtype=bool)
+            keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+            points = points[keep]
+        return points
+
+    def _emit(self, points: np.ndarray, close: bool):
+        deltas = np.diff(np.vstack([self.cursor, points]), axis=0)
+        params = _zigzag(deltas).ravel().tolist()
+        self.commands.append(_command(CMD_MOVE_TO, 1))
+        self.commands.extend(params[:2])
+        if len(points) > 1:
+            self.commands.append(_command(CMD_LINE_TO, len(points) - 1))
+            self.commands.extend(params[2:])
+        if close:
+            self.commands.append(_command(CMD_CLOSE_PATH, 1))
+        self.cursor = points[-1]
+
+    def points(self, coords):
+        points = np.unique(self._quantize(coords), axis=0)
+        deltas = np.diff(np.vstack([self.cursor, points]), axis=0)
+        self.commands.append(_command(CMD_MOVE_TO, len(points)))
+        self.commands.extend(_zigzag(deltas).ravel().tolist())
+        self.cursor = points[-1]
+
+    def line(self, coords):
+        points = self._quantize(coords)
+        if len(points) >= 2:
+            self._emit(points, close=False)
+
+    def ring(self, coords, exterior: bool) -> bool:
+        points = self._quantize(coords)
+        if len(points) > 1 and np.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        if len(points) < 3:
+            return False
+        # Shoelace area in y-down tile coordinates: exterior positive, holes negative
+        x, y = points[:, 0], points[:, 1]
+        area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+        if area == 0:
+            return False
+        if (area > 0) != exterior:
+            points = points[::-1]
+        self._emit(points, close=True)
+        return True
+
+
+def encode_geometry(geometry, bounds: Sequence[float], extent: int):
+    """(geometry type, command integers) of a shapely geometry, or (None, []) if it vanishes"""
+    encoder = _GeometryEncoder(bounds, extent)
+    kind = geometry.geom_type
+    if kind in ('Point', 'MultiPoint'):
+        coords = [geometry.coords[0]] if kind == 'Point' else [p.coords[0] for p in geometry.geoms]
+        encoder.points(coords)
+        return GEOM_POINT, encoder.commands
+    if kind in ('LineString', 'MultiLineString'):
+        for line in ([geometry] if kind == 'LineString' else geometry.geoms):
+            encoder.line(line.coords)
+        return (GEOM_LINESTRING, encoder.commands) if encoder.commands else (None, [])
+    if kind in ('Polygon', 'MultiPolygon'):
+        for polygon in ([geometry] if kind == 'Polygon' else geometry.geoms):
+            if encoder.ring(polygon.exterior.coords, exterior=True):
+                for interior in polygon.interiors:
+                    encoder.ring(interior.coords, exterior=False)
+        return (GEOM_POLYGON, encoder.commands) if encoder.commands else (None, [])
+    return None, []
+
+
+def encode_tile(layer_name: str,
+                features: Iterable[Dict[str, Any]],
+                bounds: Sequence[float],
+                extent: int = 4096) -> bytes:
+    """Encode one layer of features as a Mapbox Vector Tile
+
+    Each feature is a dict with a shapely 'geometry' in the same CRS as
+    bounds (minx, miny, maxx, maxy), 'properties' and an optional integer
+    'id'. Geometries are expected to be clipped to the (buffered) tile.
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Any, int] = {}
+    encoded_features = []
+    for feature in features:
+        geom_type, commands = encode_geometry(feature['geometry'], bounds, extent)
+        if geom_type is None:
+            continue
+
+        tags = []
+        for key, value in feature.get('properties', {}).items():
+            if value is None:
+                continue
+            value_key = (type(value), value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value_key, len(values)))
+
+        message = b''
+        if feature.get('id') is not None:
+            message += _key(1, 0) + _varint(int(feature['id']))
+        if tags:
+            message += _packed(2, tags)
+        message += _key(3, 0) + _varint(geom_type)
+        message += _packed(4, commands)
+        encoded_features.append(_bytes_field(2, message))
+
+    layer = _bytes_field(1, layer_name.encode('utf-8'))
+    layer += b''.join(encoded_features)
+    layer += b''.join(_bytes_field(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(_bytes_field(4, _value(value)) for _, value in values)
+    layer += _key(5, 0) + _varint(extent)
+    layer += _key(15, 0) + _varint(2)
+    return _bytes_field(3, layer)
@@ -0,0 +1,292 @@
+import math
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Label shape elements as paper.js exports them, and their attributes
+SHAPE_PATTERN = re.compile(r'<(path|polygon|polyline|circle|ellipse|rect)\b([^>]*)>', re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r'([\w:-]+)\s*=\s*"([^"]*)"')
+TRANSFORM_PATTERN = re.compile(r'(matrix|translate|scale|rotate)\s*\(([^)]*)\)')
+PATH_TOKEN_PATTERN = re.compile(r'[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+NUMBER_PATTERN = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# Longest chord, in pixels, used when flattening curves and circles
+FLATTEN_TOLERANCE = 1.0
+
+Ring = np.ndarray
+
+
+def _numbers(text: Optional[str]) -> List[float]:
+    return [float(v) for v in NUMBER_PATTERN.findall(text or '')]
+
+
+def parse_transform(text: Optional[str]) -> np.ndarray:
+    """3x3 affine matrix of an SVG transform attribute"""
+    matrix = np.eye(3)
+    for name, args in TRANSFORM_PATTERN.findall(text or ''):
+        values = _numbers(args)
+        step = np.eye(3)
+        if name == 'matrix' and len(values) == 6:
+            a, b, c, d, e, f = values
+            step = np.array([[a, c, e], [b, d, f], [0, 0, 1]])
+        elif name == 'translate' and values:
+            step[0, 2] = values[0]
+            step[1, 2] = values[1] if len(values) > 1 else 0.0
+        elif name == 'scale' and values:
+            step[0, 0] = values[0]
+            step[1, 1] = values[1] if len(values) > 1 else values[0]
+        elif name == 'rotate' and values:
+            angle = math.radians(values[0])
+            cx, cy = values[1:3] if len(values) >= 3 else (0.0, 0.0)
+            cos, sin = math.cos(angle), math.sin(angle)
+            step = np.array([
+                [cos, -sin, cx - cos * cx + sin * cy],
+                [sin, cos, cy - sin * cx - cos * cy],
+                [0, 0, 1]
+            ])
+        matrix = matrix @ step
+    return matrix
+
+
+def _bezier(points: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """Flatten a quadratic or cubic Bezier, excluding its start point"""
+    control = np.asarray(points, dtype=np.float64)
+    length = np.sum(np.hypot(*np.diff(control, axis=0).T))
+    steps = int(np.clip(math.ceil(length / FLATTEN_TOLERANCE), 2, 128))
+    t = np.linspace(0.0, 1.0, steps + 1)[1:, None]
+    if len(control) == 3:
+        p0, p1, p2 = control
+        return (1 - t) ** 2 * p0 + 2 * (1 - t) * t * p1 + t ** 2 * p2
+    p0, p1, p2, p3 = control
+    return (1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * p1 + 3 * (1 - t) * t ** 2 * p2 + t ** 3 * p3
+
+
+def path_rings(d: str) -> List[Ring]:
+    """Flattened subpaths of an SVG path d attribute
+
+    Curves are split into chords of about FLATTEN_TOLERANCE pixels.
+    Elliptical arcs are replaced by a line to their end point.
+    """
+    tokens = PATH_TOKEN_PATTERN.findall(d or '')
+    rings: List[Ring] = []
+    points: List[np.ndarray] = []
+    current = np.zeros(2)
+    start = np.zeros(2)
+    last_control = None
+    last_kind = None
+    command = None
+    i = 0
+
+    def take(count):
+        nonlocal i
+        values = [float(v) for v in tokens[i:i + count]]
+        i += count
+        return values
+
+    def finish():
+        if len(points) > 2:
+            rings.append(np.vstack(points))
+        points.clear()
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+            if command in 'Zz':
+                finish()
+                current = start.copy()
+                last_control = None
+                continue
+        elif command is None:
+            break
+
+        relative = command.islower()
+        origin = current if relative else np.zeros(2)
+        kind = command.upper()
+        arity = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7}.get(kind)
+        if arity is None or i + arity > len(tokens) or any(t.isalpha() for t in tokens[i:i + arity]):
+            break
+        values = take(arity)
+        control = None
+
+        if kind == 'M':
+            finish()
+            current = origin + values
+            start = current.copy()
+            points.append(current[None, :])
+            # Further coordinate pairs are implicit line-tos
+            command = 'l' if relative else 'L'
+        elif kind in ('L', 'A'):
+            current = origin + values[-2:]
+            points.append(current[None, :])
+        elif kind == 'H':
+            current = np.array([origin[0] + values[0], current[1]])
+            points.append(current[None, :])
+        elif kind == 'V':
+            current = np.array([current[0], origin[1] + values[0]])
+            points.append(current[None, :])
+        elif kind == 'C':
+            c1, control, end = origin + values[0:2], origin + values[2:4], origin + values[4:6]
+            points.append(_bezier([current, c1, control, end]))
+            current = end
+        elif kind == 'S':
+            c1 = 2 * current - last_control if last_kind in ('C', 'S') else current
+            control, end = origin + values[0:2], origin + values[2:4]
+            points.append(_bezier([current, c1, control, end]))
+            current = end
+        elif kind == 'Q':
+            control, end = origin + values[0:2], origin + values[2:4]
+            points.append(_bezier([current, control, end]))
+            current = end
+        elif kind == 'T':
+            control = 2 * current - last_control if last_kind in ('Q', 'T') else current
+            end = origin + values
+            points.append(_bezier([current, control, end]))
+            current = end
+        last_control = control
+        last_kind = kind
+    finish()
+    return rings
+
+
+def ellipse_ring(cx: float, cy: float, rx: float, ry: float) -> Ring:
+    """Polygon ring approximating an axis-aligned ellipse"""
+    # Enough chords to stay within about a fiftieth of a pixel of the curve,
+    # vertices pushed out so chords cross it rather than all lying inside
+    steps = max(32, int(math.ceil(math.pi * math.sqrt(20 * max(rx, ry)))))
+    scale = 2 / (1 + math.cos(math.pi / steps))
+    angles = np.linspace(0.0, 2 * math.pi, steps, endpoint=False)
+    return np.column_stack([cx + scale * rx * np.cos(angles), cy + scale * ry * np.sin(angles)])
+
+
+def shape_rings(tag: str, attributes: dict) -> List[Ring]:
+    """Rings, in pixel coordinates, of one SVG shape element"""
+    tag = tag.lower()
+
+    def number(name):
+        return (_numbers(attributes.get(name)) or [0.0])[0]
+
+    if tag == 'path':
+        rings = path_rings(attributes.get('d', ''))
+    elif tag in ('polygon', 'polyline'):
+        values = _numbers(attributes.get('points'))
+        coords = np.asarray(values[:len(values) // 2 * 2], dtype=np.float64).reshape(-1, 2)
+        rings = [coords] if len(coords) > 2 else []
+    elif tag == 'circle':
+        rings = [ellipse_ring(number('cx'), number('cy'), number('r'), number('r'))]
+    elif tag == 'ellipse':
+        rings = [ellipse_ring(number('cx'), number('cy'), number('rx'), number('ry'))]
+    elif tag == 'rect':
+        x, y, w, h = number('x'), number('y'), number('width'), number('height')
+        rings = [np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float64)]
+    else:
+        rings = []
+
+    transform = attributes.get('transform')
+    if transform and rings:
+        matrix = parse_transform(transform)
+        rings = [ring @ matrix[:2, :2].T + matrix[:2, 2] for ring in rings]
+    return rings
+
+
+def parse_svg_shapes(svg: str) -> List[List[Ring]]:
+    """Rings of every path, polygon, polyline, circle, ellipse and rect in an SVG string, in order"""
+    shapes = []
+    for tag, attribute_text in SHAPE_PATTERN.findall(svg or ''):
+        rings = shape_rings(tag, dict(ATTRIBUTE_PATTERN.findall(attribute_text)))
+        if rings:
+            shapes.append(rings)
+    return shapes
+
+
+def _spans(rings: Sequence[Ring], height: int, width: int):
+    """(rows, start columns, end columns) of the pixels inside rings, nonzero fill rule
+
+    A pixel is inside when its center is, which is what an aliased
+    renderer draws. All edges are intersected with all scanlines at once.
+    """
+    empty = (np.zeros(0, dtype=np.int64),) * 3
+    rings = [np.asarray(ring, dtype=np.float64) for ring in rings if len(ring) > 2]
+    if not rings or height <= 0 or width <= 0:
+        return empty
+    p0 = np.vstack(rings)
+    p1 = np.vstack([np.roll(ring, -1, axis=0) for ring in rings])
+    x0, y0, x1, y1 = p0[:, 0], p0[:, 1], p1[:, 0], p1[:, 1]
+    sloped = y0 != y1
+    x0, y0, x1, y1 = x0[sloped], y0[sloped], x1[sloped], y1[sloped]
+    direction = np.where(y1 > y0, 1, -1)
+
+    # Scanline r samples y = r + 0.5 and meets edges spanning [min y, max y)
+    first = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, height).astype(np.int64)
+    last = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, height).astype(np.int64)
+    counts = last - first
+    edges = np.repeat(np.arange(len(counts)), np.maximum(counts, 0))
+    if len(edges) == 0:
+        return empty
+    offsets = np.cumsum(np.maximum(counts, 0)) - np.maximum(counts, 0)
+    rows = first[edges] + np.arange(len(edges)) - offsets[edges]
+    t = (rows + 0.5 - y0[edges]) / (y1[edges] - y0[edges])
+    xs = x0[edges] + t * (x1[edges] - x0[edges])
+
+    order = np.lexsort((xs, rows))
+    rows, xs, winding = rows[order], xs[order], np.cumsum(direction[edges][order])
+    # Every scanline is complete, so the running winding number is 0 between rows
+    inside = (winding[:-1] != 0) & (rows[1:] == rows[:-1])
+    starts = np.clip(np.ceil(xs[:-1][inside] - 0.5), 0, width).astype(np.int64)
+    ends = np.clip(np.ceil(xs[1:][inside] - 0.5), 0, width).astype(np.int64)
+    keep = ends > starts
+    return rows[:-1][inside][keep], starts[keep], ends[keep]
+
+
+def rasterize_shape(rings: Sequence[Ring], out: np.ndarray, value=1) -> np.ndarray:
+    """Fill rings into the 2D array out with value, in place, without anti-aliasing"""
+    height, width = out.shape
+    rows, starts, ends = _spans(rings, height, width)
+    if len(rows) == 0:
+        return out
+    top = rows.min()
+    bottom = rows.max() + 1
+    edges = np.zeros((bottom - top, width + 1), dtype=np.int32)
+    np.add.at(edges, (rows - top, starts), 1)
+    np.add.at(edges, (rows - top, ends), -1)
+    band = out[top:bottom]
+    band[np.cumsum(edges[:, :width], axis=1) > 0] = value
+    return out
+
+
+def rasterize_svg(svg: str, shape: Tuple[int, int], dtype=np.int32, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Instance id mask of an SVG string: shape i of parse_svg_shapes() is burnt as i + 1
+
+    Later shapes are drawn over earlier ones. Pass out to burn into a
+    preallocated (H, W) array instead.
+    """
+    if out is None:
+        out = np.zeros(shape, dtype=dtype)
+    for index, rings in enumerate(parse_svg_shapes(svg)):
+        rasterize_shape(rings, out, index + 1)
+    return out
+
+
+def rasterize_instances(shapes: Sequence[Sequence[Ring]],
+                        shape: Tuple[int, int],
+                        values: Optional[Sequence] = None,
+                        dtype=bool) -> np.ndarray:
+    """(N, H, W) stack with one plane per shape, filled with values[i] or True"""
+    masks = np.zeros((len(shapes),) + tuple(shape), dtype=dtype)
+    for index, rings in enumerate(shapes):
+        rasterize_shape(rings, masks[index], True if values is None else values[index])
+    return masks
+
+
+def iter_instance_masks(shapes: Iterable[Sequence[Ring]], shape: Tuple[int, int]) -> Iterator[np.ndarray]:
+    """(H, W) bool mask of each shape in turn
+
+    The same buffer is refilled for every shape, so copy a mask to keep it
+    past the next iteration.
+    """
+    mask = np.zeros(shape, dtype=bool)
+    for rings in shapes:
+        mask[:] = False
+        yield rasterize_shape(rings, mask)
+
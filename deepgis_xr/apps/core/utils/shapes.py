@@ -0,0 +1,268 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from deepgis_xr.apps.core.utils.rasterize import (
+    ATTRIBUTE_PATTERN, NUMBER_PATTERN, Ring, ellipse_ring, iter_instance_masks, parse_transform, shape_rings
+)
+
+# Shape type codes
+SHAPE_POLYGON = 1
+SHAPE_CIRCLE = 2
+SHAPE_LINE = 3
+SHAPE_POINT = 4
+
+SHAPE_TYPE_NAMES = {SHAPE_POLYGON: 'polygon', SHAPE_CIRCLE: 'circle', SHAPE_LINE: 'line', SHAPE_POINT: 'point'}
+
+# Shape elements and the groups paper.js puts each category's shapes in
+SVG_TOKEN_PATTERN = re.compile(
+    r'<(/?)(g|path|polygon|polyline|circle|ellipse|rect)\b([^>]*?)(/?)>', re.IGNORECASE
+)
+
+
+class ShapeTable:
+    """Shapes of one label in flat arrays
+
+    Shape i has type types[i] and category category_names[categories[i]]
+    (-1 when it has none). Its rings are coords[ring_offsets[j]:ring_offsets[j + 1]]
+    for j in shape_offsets[i]:shape_offsets[i + 1]. Circles are one point,
+    their center, and radii[i]. Points and lines have no area.
+    """
+
+    def __init__(self, types, categories, category_names, radii, shape_offsets, ring_offsets, coords):
+        self.types = np.asarray(types, dtype=np.uint8)
+        self.categories = np.asarray(categories, dtype=np.int32)
+        self.category_names = tuple(category_names)
+        self.radii = np.asarray(radii, dtype=np.float32)
+        self.shape_offsets = np.asarray(shape_offsets, dtype=np.int64)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.coords = np.asarray(coords, dtype=np.float32).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.types, self.categories, self.radii,
+                                      self.shape_offsets, self.ring_offsets, self.coords))
+
+    def category(self, index: int) -> Optional[str]:
+        code = self.categories[index]
+        return self.category_names[code] if code >= 0 else None
+
+    def _points(self, index: int) -> List[np.ndarray]:
+        first, last = self.shape_offsets[index], self.shape_offsets[index + 1]
+        return [
+            self.coords[self.ring_offsets[j]:self.ring_offsets[j + 1]].astype(np.float64)
+            for j in range(first, last)
+        ]
+
+    def rings(self, index: int) -> List[Ring]:
+        """Rings to fill for shape index, empty for shapes without an area"""
+        kind = self.types[index]
+        if kind == SHAPE_POLYGON:
+            return self._points(index)
+        if kind == SHAPE_CIRCLE:
+            cx, cy = self._points(index)[0][0]
+            radius = float(self.radii[index])
+            return [ellipse_ring(cx, cy, radius, radius)]
+        return []
+
+    def bounds(self) -> np.ndarray:
+        """(N, 4) minx, miny, maxx, maxy of every shape, NaN for shapes without points"""
+        bounds = np.full((len(self), 4), np.nan)
+        starts = self.ring_offsets[self.shape_offsets[:-1]]
+        ends = self.ring_offsets[self.shape_offsets[1:]]
+        present = ends > starts
+        if present.any():
+            coords = self.coords.astype(np.float64)
+            bounds[present, :2] = np.minimum.reduceat(coords, starts[present])
+            # Shapes are contiguous, so each segment runs exactly to the next shape with points
+            bounds[present, 2:] = np.maximum.reduceat(coords, starts[present])
+        circles = self.types == SHAPE_CIRCLE
+        bounds[circles, :2] -= self.radii[circles, None]
+        bounds[circles, 2:] += self.radii[circles, None]
+        return bounds
+
+    def overlapping(self, bounds: Sequence[float], with_area: bool = True) -> np.ndarray:
+        """Indices of shapes whose bbox meets bounds (minx, miny, maxx, maxy)"""
+        minx, miny, maxx, maxy = bounds
+        boxes = self.bounds()
+        hits = (boxes[:, 0] <= maxx) & (boxes[:, 2] >= minx) & (boxes[:, 1] <= maxy) & (boxes[:, 3] >= miny)
+        if with_area:
+            hits &= np.isin(self.types, (SHAPE_POLYGON, SHAPE_CIRCLE))
+        return np.flatnonzero(hits)
+
+    def counts(self) -> Dict[Tuple[Optional[str], str], int]:
+        """Number of shapes by (category, type name)"""
+        if not len(self):
+            return {}
+        keys, counts = np.unique(np.stack([self.categories, self.types]), axis=1, return_counts=True)
+        return {
+            (self.category_names[code] if code >= 0 else None, SHAPE_TYPE_NAMES[kind]): int(count)
+            for (code, kind), count in zip(keys.T, counts)
+        }
+
+    def iter_masks(self, shape: Tuple[int, int], indices: Optional[Sequence[int]] = None) -> Iterator[np.ndarray]:
+        """(H, W) bool mask of each shape in indices, in a reused buffer, see iter_instance_masks()"""
+        if indices is None:
+            indices = range(len(self))
+        return iter_instance_masks((self.rings(i) for i in indices), shape)
+
+
+class _ShapeTableBuilder:
+
+    def __init__(self):
+        self.types, self.categories, self.radii = [], [], []
+        self.shape_offsets, self.ring_offsets = [0], [0]
+        self.coords = []
+        self.names: Dict[str, int] = {}
+
+    def add(self, kind: int, category: Optional[str], rings: Sequence[np.ndarray], radius: float = 0.0):
+        self.types.append(kind)
+        self.categories.append(self.names.setdefault(category, len(self.names)) if category else -1)
+        self.radii.append(radius)
+        for ring in rings:
+            self.coords.append(np.asarray(ring, dtype=np.float32).reshape(-1, 2))
+            self.ring_offsets.append(self.ring_offsets[-1] + len(self.coords[-1]))
+        self.shape_offsets.append(len(self.ring_offsets) - 1)
+
+    def build(self) -> ShapeTable:
+        coords = np.concatenate(self.coords) if self.coords else np.zeros((0, 2), dtype=np.float32)
+        return ShapeTable(self.types, self.categories, list(self.names), self.radii,
+                          self.shape_offsets, self.ring_offsets, coords)
+
+
+def _add_feature(builder: _ShapeTableBuilder, feature: dict):
+    geometry = (feature or {}).get('geometry') or {}
+    category = ((feature or {}).get('properties') or {}).get('category')
+    kind = geometry.get('type')
+    coordinates = geometry.get('coordinates') or []
+    if kind == 'Point' and len(coordinates) >= 3:
+        builder.add(SHAPE_CIRCLE, category, [coordinates[:2]], float(coordinates[2]))
+    elif kind == 'Point' and len(coordinates) == 2:
+        builder.add(SHAPE_POINT, category, [coordinates])
+    elif kind in ('Polygon', 'MultiPolygon'):
+        polygons = [coordinates] if kind == 'Polygon' else coordinates
+        rings = [[point[:2] for point in ring] for polygon in polygons for ring in polygon if len(ring) > 2]
+        builder.add(SHAPE_POLYGON, category, rings)
+    elif kind in ('LineString', 'MultiLineString'):
+        lines = [coordinates] if kind == 'LineString' else coordinates
+        builder.add(SHAPE_LINE, category, [[point[:2] for point in line] for line in lines if line])
+
+
+def _add_svg(builder: _ShapeTableBuilder, svg: str):
+    groups: List[Optional[str]] = []
+    for closing, tag, attribute_text, self_closing in SVG_TOKEN_PATTERN.findall(svg):
+        tag = tag.lower()
+        if tag == 'g':
+            if closing:
+                if groups:
+                    groups.pop()
+            elif not self_closing:
+                groups.append(dict(ATTRIBUTE_PATTERN.findall(attribute_text)).get('id'))
+            continue
+        if closing:
+            continue
+        attributes = dict(ATTRIBUTE_PATTERN.findall(attribute_text))
+        category = next((group for group in reversed(groups) if group), None)
+        if tag == 'circle':
+            matrix = parse_transform(attributes.get('transform'))
+            center = matrix[:2, :2] @ [_number(attributes, 'cx'), _number(attributes, 'cy')] + matrix[:2, 2]
+            scale = abs(np.linalg.det(matrix[:2, :2])) ** 0.5
+            builder.add(SHAPE_CIRCLE, category, [center], _number(attributes, 'r') * scale)
+        else:
+            rings = shape_rings(tag, attributes)
+            if rings:
+                builder.add(SHAPE_POLYGON, category, rings)
+
+
+def _number(attributes: dict, name: str) -> float:
+    match = NUMBER_PATTERN.search(attributes.get(name) or '')
+    return float(match.group()) if match else 0.0
+
+
+def parse_shapes(text) -> ShapeTable:
+    """Shape table of a label payload: GeoJSON (text or parsed) or SVG
+
+    GeoJSON categories come from feature properties, SVG categories from
+    the id of the innermost enclosing group.
+    """
+    builder = _ShapeTableBuilder()
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode('utf-8')
+    if isinstance(text, str) and text.lstrip().startswith('<'):
+        _add_svg(builder, text)
+        return builder.build()
+
+    payload = text
+    if isinstance(text, str):
+        try:
+            payload = json.loads(text) if text.strip() else {}
+        except ValueError:
+            payload = {}
+    if isinstance(payload, dict):
+        features = payload.get('features') if 'features' in payload else [payload]
+        for feature in features or []:
+            if isinstance(feature, dict):
+                _add_feature(builder, feature)
+    return builder.build()
+
+
+class ShapeTableCache:
+    """Parsed shape tables by label id, least recently used evicted
+
+    An entry is only returned while the label content it was parsed from
+    is unchanged: the caller passes the label's content hash, or the text
+    itself is hashed. Each process has its own cache, and the hash check
+    keeps entries correct in processes the save signals do not reach,
+    such as Celery workers.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[str, ShapeTable]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'SHAPE_TABLE_CACHE_SIZE', 1024)
+
+    def get(self, label_id: int, text, content_hash: Optional[str] = None) -> ShapeTable:
+        if content_hash is None:
+            raw = text if isinstance(text, (str, bytes)) else json.dumps(text, sort_keys=True)
+            content_hash = hashlib.sha256(raw.encode('utf-8') if isinstance(raw, str) else raw).hexdigest()
+        with self._lock:
+            entry = self._entries.get(label_id)
+            if entry and entry[0] == content_hash:
+                self._entries.move_to_end(label_id)
+                return entry[1]
+
+        table = parse_shapes(text)
+        with self._lock:
+            self._entries[label_id] = (content_hash, table)
+            self._entries.move_to_end(label_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return table
+
+    def discard(self, label_id: int):
+        with self._lock:
+            self._entries.pop(label_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+shape_table_cache = ShapeTableCache()
+# CategoryLabel payloads, kept apart since their ids overlap ImageLabel ids
+category_shape_table_cache = ShapeTableCache()
@@ -0,0 +1,235 @@
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from rtree import index
+
+from deepgis_xr.apps.core.models import TiledGISLabel
+
+Bounds = Tuple[float, float, float, float]  # (minx, miny, maxx, maxy)
+
+# Rows fetched per round trip while building the index
+BUILD_CHUNK_SIZE = 10000
+
+# Candidate ids per `id IN (...)` query, below SQLite's host parameter limit
+ID_CHUNK_SIZE = 900
+
+# Ids skipped below the highest indexed one may belong to transactions that
+# have not committed yet. Up to GAP_WINDOW of them under the top id are
+# rechecked on each query for GAP_SECONDS, then taken to be deleted or rolled back
+GAP_WINDOW = 10000
+GAP_SECONDS = 600
+
+
+def label_bounds(label) -> Bounds:
+    """(minx, miny, maxx, maxy) of a TiledLabel's bbox columns"""
+    return (
+        float(label.southwest_lng),
+        float(label.southwest_lat),
+        float(label.northeast_lng),
+        float(label.northeast_lat),
+    )
+
+
+class SpatialIndex:
+    """Thread-safe in-memory R-tree of integer ids and bounding boxes"""
+
+    def __init__(self, entries: Optional[Iterable[Tuple[int, Bounds]]] = None):
+        self._lock = threading.Lock()
+        self.max_id = 0
+        self._index = self._bulk_load(entries or [])
+
+    def _bulk_load(self, entries: Iterable[Tuple[int, Bounds]]) -> index.Index:
+        properties = index.Property()
+        properties.leaf_capacity = 100
+        properties.fill_factor = 0.9
+
+        def stream():
+            for item_id, bounds in entries:
+                self.max_id = max(self.max_id, item_id)
+                yield item_id, bounds, None
+
+        self.max_id = 0
+        items = stream()
+        first = next(items, None)
+        if first is None:
+            # The bulk loader rejects empty streams
+            return index.Index(properties=properties)
+        # Sort-tile-recursive bulk loading is much faster than repeated inserts
+        return index.Index(itertools.chain([first], items), properties=properties)
+
+    def rebuild(self, entries: Iterable[Tuple[int, Bounds]]):
+        new_index = self._bulk_load(entries)
+        with self._lock:
+            self._index = new_index
+
+    def insert(self, item_id: int, bounds: Bounds):
+        with self._lock:
+            self._index.insert(item_id, bounds)
+            self.max_id = max(self.max_id, item_id)
+
+    def delete(self, item_id: int, bounds: Bounds):
+        with self._lock:
+            self._index.delete(item_id, bounds)
+
+    def intersection(self, bounds: Bounds) -> List[int]:
+        with self._lock:
+            return list(self._index.intersection(bounds))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._index.get_size()
+
+
+class LabelSpatialIndex(SpatialIndex):
+    """R-tree sidecar for the bbox columns of a TiledLabel model
+
+    Built lazily from the database on first query. Saves and deletes in this
+    process keep it in sync through model signals (see core.signals); rows
+    written elsewhere, including bulk_create, are picked up before each query
+    by loading ids above the highest one indexed, and ids skipped below it
+    are rechecked for a while in case their transaction commits late.
+    Changes to existing rows
+    bump a version counter shared by every process through a file under
+    SPATIAL_INDEX_VERSION_DIR, and an index behind the counter is rebuilt
+    before its next query. Candidates are always re-checked against the
+    database. Rows moved by QuerySet.update() send no signals and are only
+    found after reset().
+    """
+
+    def __init__(self, model, version_dir: Optional[str] = None):
+        self.model = model
+        self._version_dir = version_dir
+        self._built = False
+        self._version = 0
+        # Skipped id -> when it was first missed, signal inserts update it from other threads
+        self._gaps: Dict[int, float] = {}
+        self._gaps_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        super().__init__()
+
+    @property
+    def version_path(self) -> str:
+        directory = self._version_dir or getattr(settings, 'SPATIAL_INDEX_VERSION_DIR',
+                                                 os.path.join(settings.MEDIA_ROOT, 'cache', 'spatial'))
+        return os.path.join(directory, f'{self.model._meta.label_lower}.version')
+
+    def shared_version(self) -> int:
+        """Changes recorded by any process, one byte is appended per change"""
+        try:
+            return os.stat(self.version_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def bump_version(self):
+        """Record a change to an existing row so other processes rebuild
+
+        Call once the change is committed. This index stays current when no
+        other process bumped the counter since it was last read.
+        """
+        path = self.version_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._build_lock:
+            # O_APPEND writes are atomic, so concurrent bumps are all counted
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, b'.')
+                version = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if self._built and version == self._version + 1:
+                self._version = version
+
+    def _rows(self, queryset) -> Iterable[Tuple[int, Bounds]]:
+        columns = ('id', 'southwest_lng', 'southwest_lat', 'northeast_lng', 'northeast_lat')
+        for pk, minx, miny, maxx, maxy in queryset.values_list(*columns).iterator(chunk_size=BUILD_CHUNK_SIZE):
+            yield pk, (float(minx), float(miny), float(maxx), float(maxy))
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def _track_gaps(self, pk: int):
+        """Remember ids skipped between the highest indexed id and pk"""
+        now = time.monotonic()
+        with self._gaps_lock:
+            for gap in range(max(self.max_id + 1, pk - GAP_WINDOW), pk):
+                self._gaps[gap] = now
+            self._gaps.pop(pk, None)
+            if len(self._gaps) > 2 * GAP_WINDOW:
+                # Long runs of deleted rows, only the top of the id range can still commit
+                self._gaps = {gap: seen for gap, seen in self._gaps.items() if gap >= pk - GAP_WINDOW}
+
+    def _tracked(self, rows: Iterable[Tuple[int, Bounds]]) -> Iterator[Tuple[int, Bounds]]:
+        for pk, bounds in rows:
+            self._track_gaps(pk)
+            yield pk, bounds
+
+    def insert(self, item_id: int, bounds: Bounds):
+        self._track_gaps(item_id)
+        super().insert(item_id, bounds)
+
+    def ensure_current(self):
+        """Build the index on first use or after another process changed rows, then load rows added since"""
+        with self._build_lock:
+            version = self.shared_version()
+            if not self._built or version != self._version:
+                self._gaps = {}
+                self.rebuild(self._tracked(self._rows(self.model.objects.order_by('id'))))
+                self._built = True
+                self._version = version
+                return
+
+            # Rows committed after a higher id was indexed
+            now = time.monotonic()
+            with self._gaps_lock:
+                self._gaps = {
+                    gap: seen for gap, seen in self._gaps.items()
+                    if now - seen < GAP_SECONDS and gap >= self.max_id - GAP_WINDOW
+                }
+                gaps = sorted(self._gaps)
+            for start in range(0, len(gaps), ID_CHUNK_SIZE):
+                for pk, bounds in self._rows(self.model.objects.filter(id__in=gaps[start:start + ID_CHUNK_SIZE])):
+                    self.insert(pk, bounds)
+
+            for pk, bounds in self._rows(self.model.objects.filter(id__gt=self.max_id).order_by('id')):
+                self.insert(pk, bounds)
+
+    def reset(self):
+        """Drop the index, it is rebuilt on the next query"""
+        with self._build_lock:
+            self._built = False
+            self._gaps = {}
+            self.rebuild([])
+
+    def candidates(self, bounds: Sequence[float]) -> List[int]:
+        """Ids of rows whose bbox intersects bounds"""
+        self.ensure_current()
+        return self.intersection(tuple(bounds))
+
+
+tiled_label_index = LabelSpatialIndex(TiledGISLabel)
+
+
+def iter_labels_in_bounds(bounds: Sequence[float], queryset=None) -> Iterator[TiledGISLabel]:
+    """TiledGISLabels whose bbox intersects bounds, in id order
+
+    Candidates come from the R-tree and are confirmed against the bbox
+    columns; queryset can add filters, ordering is replaced.
+    """
+    minx, miny, maxx, maxy = bounds
+    if queryset is None:
+        queryset = TiledGISLabel.objects.all()
+    queryset = queryset.filter(
+        southwest_lng__lte=maxx,
+        northeast_lng__gte=minx,
+        southwest_lat__lte=maxy,
+        northeast_lat__gte=miny
+    ).order_by('id')
+
+    candidates = sorted(tiled_label_index.candidates(bounds))
+    for start in range(0, len(candidates), ID_CHUNK_SIZE):
+        yield from queryset.filter(id__in=candidates[start:start + ID_CHUNK_SIZE])
@@ -0,0 +1,194 @@
+import math
+import os
+import shutil
+import tempfile
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from shapely.geometry import box
+from shapely.ops import transform
+
+from deepgis_xr.apps.core.models import TiledGISLabel
+from deepgis_xr.apps.core.utils.geometry import label_geometry
+from deepgis_xr.apps.core.utils.mvt import encode_tile
+from deepgis_xr.apps.core.utils.spatial import iter_labels_in_bounds
+
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+MAX_LATITUDE = 85.0511287798066
+
+# Tile grid resolution and the margin, in grid units, kept around each tile
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+LABEL_LAYER = 'labels'
+
+
+def lnglat_to_mercator(lng, lat) -> Tuple[np.ndarray, np.ndarray]:
+    """EPSG:4326 to EPSG:3857, vectorized"""
+    lng = np.asarray(lng, dtype=np.float64)
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    x = lng * ORIGIN_SHIFT / 180.0
+    y = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def mercator_to_lnglat(x, y) -> Tuple[np.ndarray, np.ndarray]:
+    """EPSG:3857 to EPSG:4326, vectorized"""
+    lng = np.asarray(x, dtype=np.float64) * 180.0 / ORIGIN_SHIFT
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y, dtype=np.float64) / EARTH_RADIUS)) - np.pi / 2)
+    return lng, lat
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Web Mercator bounds of an XYZ tile"""
+    span = 2 * ORIGIN_SHIFT / 2 ** z
+    minx = -ORIGIN_SHIFT + x * span
+    maxy = ORIGIN_SHIFT - y * span
+    return minx, maxy - span, minx + span, maxy
+
+
+def tiles_for_bounds(bounds: Sequence[float], z: int, buffer: int = TILE_BUFFER) -> Tuple[range, range]:
+    """x and y ranges of the zoom z tiles whose buffered extent meets lon/lat bounds"""
+    (minx, maxx), (miny, maxy) = lnglat_to_mercator([bounds[0], bounds[2]], [bounds[1], bounds[3]])
+    count = 2 ** z
+    span = 2 * ORIGIN_SHIFT / count
+    margin = span * buffer / TILE_EXTENT
+    x0 = int(np.clip((minx - margin + ORIGIN_SHIFT) // span, 0, count - 1))
+    x1 = int(np.clip((maxx + margin + ORIGIN_SHIFT) // span, 0, count - 1))
+    y0 = int(np.clip((ORIGIN_SHIFT - maxy - margin) // span, 0, count - 1))
+    y1 = int(np.clip((ORIGIN_SHIFT - miny + margin) // span, 0, count - 1))
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _polygonal_or_linear(geometry):
+    """Drop stray points that clipping can leave in a GeometryCollection"""
+    if geometry.geom_type != 'GeometryCollection':
+        return geometry
+    parts = [part for part in geometry.geoms if part.geom_type not in ('Point', 'MultiPoint')]
+    return max(parts, key=lambda part: part.area or part.length) if parts else None
+
+
+def render_label_tile(z: int, x: int, y: int, simplify_pixels: Optional[float] = None) -> bytes:
+    """Encode the TiledGISLabels of an XYZ tile as a Mapbox Vector Tile
+
+    Label geometries are lon/lat. They are projected to Web Mercator,
+    skipped when smaller than a tile grid cell, simplified to
+    simplify_pixels grid cells and clipped to the buffered tile.
+    """
+    if simplify_pixels is None:
+        simplify_pixels = getattr(settings, 'LABEL_TILE_SIMPLIFY_PIXELS', 1.0)
+    bounds = tile_bounds(z, x, y)
+    pixel = (bounds[2] - bounds[0]) / TILE_EXTENT
+    margin = pixel * TILE_BUFFER
+    clip = box(bounds[0] - margin, bounds[1] - margin, bounds[2] + margin, bounds[3] + margin)
+    (minx, maxx), (miny, maxy) = mercator_to_lnglat(
+        [clip.bounds[0], clip.bounds[2]], [clip.bounds[1], clip.bounds[3]]
+    )
+
+    features = []
+    queryset = TiledGISLabel.objects.select_related('category')
+    for label in iter_labels_in_bounds([float(minx), float(miny), float(maxx), float(maxy)], queryset):
+        try:
+            geometry = label_geometry(label)
+        except Exception:
+            continue
+        if geometry is None or geometry.is_empty:
+            continue
+
+        geometry = transform(lnglat_to_mercator, geometry)
+        gminx, gminy, gmaxx, gmaxy = geometry.bounds
+        if geometry.geom_type not in ('Point', 'MultiPoint') and gmaxx - gminx < pixel and gmaxy - gminy < pixel:
+            # Below one grid cell at this zoom
+            continue
+        if simplify_pixels:
+            geometry = geometry.simplify(pixel * simplify_pixels, preserve_topology=True)
+        if not clip.contains(geometry):
+            geometry = _polygonal_or_linear(geometry.intersection(clip))
+        if geometry is None or geometry.is_empty:
+            continue
+
+        properties = {"id": label.id}
+        if label.category:
+            properties["category"] = label.category.category_name
+        if label.parent_raster_id:
+            properties["raster_id"] = label.parent_raster_id
+        features.append({"id": label.id, "geometry": geometry, "properties": properties})
+
+    return encode_tile(LABEL_LAYER, features, bounds, TILE_EXTENT)
+
+
+class LabelTileCache:
+    """Disk cache of rendered label tiles, laid out as z/x/y.pbf
+
+    Saving or deleting a label only removes the tiles its bbox touches.
+    At zoom levels where that would be more than max_invalidate tiles the
+    whole zoom level is dropped instead.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'LABEL_TILE_CACHE_DIR',
+                       os.path.join(settings.MEDIA_ROOT, 'cache', 'tiles', 'labels'))
+
+    @property
+    def max_zoom(self) -> int:
+        return getattr(settings, 'LABEL_TILE_MAX_ZOOM', 22)
+
+    @property
+    def max_invalidate(self) -> int:
+        return getattr(settings, 'LABEL_TILE_INVALIDATE_MAX_TILES', 256)
+
+    def _path(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.directory, str(z), str(x), f'{y}.pbf')
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            with open(self._path(z, x, y), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        path = self._path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial tile
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def invalidate_bounds(self, bounds_list: Iterable[Sequence[float]]):
+        """Remove cached tiles touched by any of the lon/lat bounds"""
+        bounds_list = list(bounds_list)
+        if not bounds_list or not os.path.isdir(self.directory):
+            return
+        for z in range(self.max_zoom + 1):
+            tiles = set()
+            for bounds in bounds_list:
+                xs, ys = tiles_for_bounds(bounds, z)
+                if len(tiles) + len(xs) * len(ys) > self.max_invalidate:
+                    tiles = None
+                    break
+                tiles.update((x, y) for x in xs for y in ys)
+
+            if tiles is None:
+                shutil.rmtree(os.path.join(self.directory, str(z)), ignore_errors=True)
+                continue
+            for x, y in tiles:
+                try:
+                    os.remove(self._path(z, x, y))
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+label_tile_cache = LabelTileCache()
@@ -1,8 +1,12 @@
+import math
 import torch
 import numpy as np
 import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window
 from torchvision import transforms
-from typing import List, Union, Tuple
+from typing import List, Optional, Union, Tuple
 
 def preprocess_image(
     image: Union[np.ndarray, torch.Tensor],
@@ -70,6 +74,146 @@ def load_raster(
         meta = src.meta
     return image, transform, meta
 
+def decimated_shape(
+    width: float,
+    height: float,
+    max_size: Optional[int] = None,
+    pixel_budget: Optional[int] = None
+) -> Tuple[int, int]:
+    """Output (height, width) that fits max_size on the long side and pixel_budget in area."""
+    scale = 1.0
+    if max_size:
+        scale = max(scale, max(width, height) / max_size)
+    if pixel_budget:
+        scale = max(scale, math.sqrt(width * height / pixel_budget))
+    return max(1, int(round(height / scale))), max(1, int(round(width / scale)))
+
+def plan_read(
+    src: rasterio.io.DatasetReader,
+    bounds: List[float],
+    max_size: Optional[int] = None,
+    pixel_budget: Optional[int] = None
+) -> Tuple[Window, Tuple[int, int], rasterio.transform.Affine]:
+    """Pixel window, output (height, width) and transform for reading bounds.
+
+    The window is snapped to whole pixels. Reads meant to be shared by
+    different requests over the same area should use plan_grid().
+    """
+    window = src.window(*bounds).round_offsets().round_lengths(op='ceil')
+    out_height, out_width = decimated_shape(window.width, window.height, max_size, pixel_budget)
+    transform = src.window_transform(window) * Affine.scale(
+        window.width / out_width,
+        window.height / out_height
+    )
+    return window, (out_height, out_width), transform
+
+def grid_level(
+    width: float,
+    height: float,
+    max_size: Optional[int] = None,
+    pixel_budget: Optional[int] = None
+) -> int:
+    """Power-of-two decimation level at which a pixel window fits max_size and pixel_budget."""
+    out_height, out_width = decimated_shape(width, height, max_size, pixel_budget)
+    scale = max(width / out_width, height / out_height)
+    return max(0, math.ceil(math.log2(scale) - 1e-9))
+
+def plan_grid(
+    src: rasterio.io.DatasetReader,
+    bounds: List[float],
+    cell_size: int,
+    overlap: int = 0,
+    max_size: Optional[int] = None,
+    pixel_budget: Optional[int] = None
+) -> Tuple[int, Tuple[float, float, float, float], List[Tuple[int, int, Window, Tuple[int, int], rasterio.transform.Affine]]]:
+    """Fixed grid cells covering bounds, so repeated requests resolve to the same reads.
+
+    Cells are cell_size pixels square at a power-of-two decimation level,
+    anchored at the raster origin and stepping by cell_size - overlap, so
+    pans and repeats over an area at a similar zoom share cells. Returns
+    the level, the requested area (x0, y0, x1, y1) in grid pixels of that
+    level and each cell as (column, row, window, out_shape, transform).
+    Cells at the raster edge are clipped to it.
+    """
+    window = src.window(*bounds)
+    level = grid_level(window.width, window.height, max_size, pixel_budget)
+    factor = 2 ** level
+    stride = (cell_size - overlap) * factor
+    span = cell_size * factor
+    
+    col0, row0 = max(0.0, window.col_off), max(0.0, window.row_off)
+    col1 = min(float(src.width), window.col_off + window.width)
+    row1 = min(float(src.height), window.row_off + window.height)
+    area = (col0 / factor, row0 / factor, col1 / factor, row1 / factor)
+    if col1 <= col0 or row1 <= row0:
+        return level, area, []
+    
+    cells = []
+    # Every pixel lies in the cell whose stride it falls in, the overlap only adds context
+    for row in range(int(row0 // stride), int(math.ceil(row1 / stride))):
+        for column in range(int(col0 // stride), int(math.ceil(col1 / stride))):
+            x, y = column * stride, row * stride
+            cell = Window(x, y, min(span, src.width - x), min(span, src.height - y))
+            out_shape = (max(1, math.ceil(cell.height / factor)), max(1, math.ceil(cell.width / factor)))
+            transform = src.window_transform(cell) * Affine.scale(
+                cell.width / out_shape[1],
+                cell.height / out_shape[0]
+            )
+            cells.append((column, row, cell, out_shape, transform))
+    return level, area, cells
+
+def read_bounds(
+    src: rasterio.io.DatasetReader,
+    bounds: List[float],
+    max_size: Optional[int] = None,
+    pixel_budget: Optional[int] = None
+) -> Tuple[np.ndarray, rasterio.transform.Affine]:
+    """Read geographic bounds at no more resolution than needed.
+
+    Wide windows are read decimated through out_shape, which lets GDAL serve
+    them from the closest raster overview instead of decoding every
+    full-resolution block. Returns the image and the transform of the
+    pixels actually read.
+    """
+    window, out_shape, transform = plan_read(src, bounds, max_size, pixel_budget)
+    return read_window(src, window, out_shape), transform
+
+def read_window(
+    src: rasterio.io.DatasetReader,
+    window: Window,
+    out_shape: Tuple[int, int]
+) -> np.ndarray:
+    """Read a pixel window resampled to out_shape (height, width)."""
+    return src.read(
+        window=window,
+        out_shape=(src.count,) + tuple(out_shape),
+        resampling=Resampling.average
+    )
+
+def read_tile(
+    src: rasterio.io.DatasetReader,
+    window: Window,
+    out_shape: Tuple[int, int],
+    x: int,
+    y: int,
+    width: int,
+    height: int
+) -> np.ndarray:
+    """Read one (x, y, width, height) block of the out_shape grid plan_read() laid over window.
+
+    Lets callers read a large planned window tile by tile, each tile
+    resampled exactly as the same pixels of the whole read would be.
+    """
+    scale_x = window.width / out_shape[1]
+    scale_y = window.height / out_shape[0]
+    tile_window = Window(
+        window.col_off + x * scale_x,
+        window.row_off + y * scale_y,
+        width * scale_x,
+        height * scale_y
+    )
+    return read_window(src, tile_window, (height, width))
+
 def save_predictions(
     predictions: np.ndarray,
     transform: rasterio.transform.Affine,
@@ -86,6 +230,31 @@ def save_predictions(
     with rasterio.open(output_path, 'w', **metadata) as dst:
         dst.write(predictions.astype('uint8'), 1)
 
+def tile_boxes(
+    height: int,
+    width: int,
+    tile_size: int = 256,
+    overlap: int = 32
+) -> List[Tuple[int, int, int, int]]:
+    """(x0, y0, x1, y1) of overlapping tiles covering an image, row by row."""
+    boxes = []
+    seen = set()
+    
+    for y in range(0, height, tile_size - overlap):
+        for x in range(0, width, tile_size - overlap):
+            x1 = min(x + tile_size, width)
+            y1 = min(y + tile_size, height)
+            x0 = max(0, x1 - tile_size)
+            y0 = max(0, y1 - tile_size)
+            
+            # Edge tiles are shifted back inside the image and can repeat
+            if (x0, y0) in seen:
+                continue
+            seen.add((x0, y0))
+            boxes.append((x0, y0, x1, y1))
+    
+    return boxes
+
 def create_tiles(
     image: np.ndarray,
     tile_size: int = 256,
@@ -97,16 +266,10 @@ def create_tiles(
     
     height, width = image.shape[1:] if len(image.shape) > 2 else image.shape
     
-    for y in range(0, height, tile_size - overlap):
-        for x in range(0, width, tile_size - overlap):
-            x1 = min(x + tile_size, width)
-            y1 = min(y + tile_size, height)
-            x0 = max(0, x1 - tile_size)
-            y0 = max(0, y1 - tile_size)
-            
-            tile = image[:, y0:y1, x0:x1] if len(image.shape) > 2 else image[y0:y1, x0:x1]
-            tiles.append(tile)
-            positions.append((x0, y0))
+    for x0, y0, x1, y1 in tile_boxes(height, width, tile_size, overlap):
+        tile = image[:, y0:y1, x0:x1] if len(image.shape) > 2 else image[y0:y1, x0:x1]
+        tiles.append(tile)
+        positions.append((x0, y0))
     
     return tiles, positions
 
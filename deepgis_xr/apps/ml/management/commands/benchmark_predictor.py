@@ -0,0 +1,233 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+import torch
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from rasterio.transform import from_origin
+from torchvision.models.detection import maskrcnn_resnet50_fpn
+
+from deepgis_xr.apps.api.v1.views.prediction import predict_tile
+from deepgis_xr.apps.core.models import CategoryType, RasterImage
+from deepgis_xr.apps.ml.services.cache import prediction_cache
+from deepgis_xr.apps.ml.services.profiling import stage_timer
+from deepgis_xr.apps.ml.services.registry import registry
+
+STAGES = ['raster_read', 'preprocess', 'forward', 'postprocess', 'geojson', 'cache']
+
+
+def write_synthetic_geotiff(path: str, width: int, height: int, bands: int, seed: int = 0,
+                            pixel_size: float = 0.5):
+    """Tiled, deflate-compressed uint8 GeoTIFF of random noise in Web Mercator"""
+    rng = np.random.default_rng(seed)
+    profile = {
+        'driver': 'GTiff',
+        'width': width,
+        'height': height,
+        'count': bands,
+        'dtype': 'uint8',
+        'crs': 'EPSG:3857',
+        'transform': from_origin(0, height * pixel_size, pixel_size, pixel_size),
+        'tiled': True,
+        'blockxsize': 256,
+        'blockysize': 256,
+        'compress': 'deflate',
+    }
+    with rasterio.open(path, 'w', **profile) as dst:
+        for _, window in dst.block_windows(1):
+            block = rng.integers(0, 256, (bands, window.height, window.width), dtype=np.uint8)
+            dst.write(block, window=window)
+    return path
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark predict_tile end to end on synthetic GeoTIFFs with randomly initialised weights'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=4096, help='Synthetic raster width in pixels')
+        parser.add_argument('--height', type=int, default=4096, help='Synthetic raster height in pixels')
+        parser.add_argument('--bands', type=int, default=3, help='Synthetic raster band count')
+        parser.add_argument('--window', type=int, default=512,
+                            help='Side length in raster pixels of each requested tile')
+        parser.add_argument('--requests', type=int, default=20, help='Number of timed requests')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests before measuring')
+        parser.add_argument('--classes', type=int, default=4,
+                            help='Categories to create when the database has none')
+        parser.add_argument('--backend', type=str, default=None,
+                            help='Override PREDICTOR_BACKEND (eager, optimized or onnx)')
+        parser.add_argument('--confidence-threshold', type=float, default=0.0,
+                            help='Threshold sent with each request; 0 keeps postprocessing busy')
+        parser.add_argument('--use-cache', action='store_true',
+                            help='Let repeated windows hit the prediction cache')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and windows')
+        parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this path')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        if options['window'] > min(options['width'], options['height']):
+            raise CommandError('--window must fit inside the synthetic raster')
+        torch.manual_seed(options['seed'])
+
+        with tempfile.TemporaryDirectory(prefix='deepgis-benchmark-') as workdir:
+            overrides = {'PREDICTION_CACHE_DIR': os.path.join(workdir, 'cache')}
+            if options['backend']:
+                overrides['PREDICTOR_BACKEND'] = options['backend']
+            with override_settings(**overrides), transaction.atomic():
+                try:
+                    results = self._run(workdir, options)
+                finally:
+                    # Benchmark rows never outlive the run
+                    transaction.set_rollback(True)
+                    registry.invalidate()
+
+        self._report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def _run(self, workdir, options):
+        if not CategoryType.objects.exists():
+            CategoryType.objects.bulk_create([
+                CategoryType(category_name=f'benchmark-{i}') for i in range(options['classes'])
+            ])
+        num_classes = CategoryType.objects.count() + 1  # +1 for background
+
+        # Random weights with the trained model's layout, no download needed
+        model_path = os.path.join(workdir, 'model.pth')
+        torch.save(maskrcnn_resnet50_fpn(pretrained=False, pretrained_backbone=False,
+                                         num_classes=num_classes).state_dict(), model_path)
+
+        raster_path = write_synthetic_geotiff(
+            os.path.join(workdir, 'synthetic.tif'),
+            options['width'], options['height'], options['bands'], options['seed']
+        )
+        raster = RasterImage.objects.create(
+            name=f'benchmark-{os.path.basename(workdir)}', path=raster_path,
+            attribution='synthetic', min_zoom=0, max_zoom=22
+        )
+
+        with rasterio.open(raster_path) as src:
+            transform = src.transform
+        rng = np.random.default_rng(options['seed'])
+        factory = RequestFactory()
+        user = User(username='benchmark')
+        window = options['window']
+
+        def request_tile():
+            col = int(rng.integers(0, options['width'] - window + 1))
+            row = int(rng.integers(0, options['height'] - window + 1))
+            minx, maxy = transform * (col, row)
+            maxx, miny = transform * (col + window, row + window)
+            request = factory.post('/api/v1/predict/tile/', data=json.dumps({
+                'raster_id': raster.id,
+                'bounds': [minx, miny, maxx, maxy],
+                'model_path': model_path,
+                'confidence_threshold': options['confidence_threshold'],
+            }), content_type='application/json')
+            request.user = user
+            if not options['use_cache']:
+                prediction_cache.clear()
+
+            start = time.perf_counter()
+            response = predict_tile(request)
+            latency = time.perf_counter() - start
+
+            body = json.loads(response.content)
+            if response.status_code != 200:
+                raise CommandError(f'predict_tile failed: {body.get("message")}')
+            return latency, len(body['predictions']['features'])
+
+        self.stdout.write(f'Loading model and running {options["warmup"]} warm-up requests')
+        for _ in range(options['warmup']):
+            request_tile()
+
+        latencies, detections = [], []
+        stage_timer.start()
+        try:
+            for _ in range(options['requests']):
+                latency, count = request_tile()
+                latencies.append(latency)
+                detections.append(count)
+        finally:
+            stage_timer.stop()
+
+        ms = np.asarray(latencies) * 1000
+        stages = stage_timer.summary()
+        total_ms = float(ms.sum())
+        for name, stats in stages.items():
+            stats['share'] = stats['total_ms'] / total_ms if total_ms else 0.0
+        unaccounted = total_ms - sum(stats['total_ms'] for stats in stages.values())
+
+        return {
+            'revision': git_revision(),
+            'environment': {
+                'python': platform.python_version(),
+                'torch': torch.__version__,
+                'threads': torch.get_num_threads(),
+                'backend': registry.predictor_class.__name__,
+            },
+            'config': {key: options[key] for key in (
+                'width', 'height', 'bands', 'window', 'requests', 'warmup',
+                'confidence_threshold', 'use_cache', 'seed'
+            )},
+            'latency_ms': {
+                'mean': float(ms.mean()),
+                'min': float(ms.min()),
+                'p50': float(np.percentile(ms, 50)),
+                'p95': float(np.percentile(ms, 95)),
+                'p99': float(np.percentile(ms, 99)),
+                'max': float(ms.max()),
+            },
+            # Requests are sequential, so throughput is the inverse of mean latency
+            'throughput_rps': len(latencies) / sum(latencies) if latencies else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+            'mean_detections': float(np.mean(detections)),
+            'stages': {name: stages[name] for name in STAGES if name in stages},
+            'other_ms': max(unaccounted, 0.0),
+        }
+
+    def _report(self, results):
+        latency = results['latency_ms']
+        self.stdout.write(self.style.SUCCESS(
+            f'{results["config"]["requests"]} requests on {results["environment"]["backend"]}'
+        ))
+        self.stdout.write(
+            f'latency: p50 {latency["p50"]:.1f} ms, p95 {latency["p95"]:.1f} ms, '
+            f'p99 {latency["p99"]:.1f} ms, mean {latency["mean"]:.1f} ms'
+        )
+        self.stdout.write(
+            f'throughput: {results["throughput_rps"]:.2f} req/s, '
+            f'peak RSS {results["peak_rss_mb"]:.0f} MB, '
+            f'{results["mean_detections"]:.1f} detections/request'
+        )
+        for name, stats in results['stages'].items():
+            self.stdout.write(
+                f'  {name:<12} {stats["mean_ms"]:9.1f} ms/call {stats["share"] * 100:5.1f}%'
+            )
+        self.stdout.write(f'  {"other":<12} {results["other_ms"]:9.1f} ms total')
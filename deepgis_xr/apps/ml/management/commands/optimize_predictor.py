@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from deepgis_xr.apps.core.models import CategoryType
+from deepgis_xr.apps.ml.services.optimization import compare_models, export_onnx, export_optimized
+from deepgis_xr.apps.ml.services.predictor import (
+    MaskRCNNPredictor, OnnxMaskRCNNPredictor, OptimizedMaskRCNNPredictor,
+    onnx_artifact_path, optimized_artifact_path, stale_artifacts
+)
+
+
+class Command(BaseCommand):
+    help = ('Export a TorchScript (int8-quantized) or ONNX predictor for CPU inference '
+            'and compare it to the eager model')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-path', type=str, default=None,
+                            help='Trained weights (model.pth); pretrained weights if omitted')
+        parser.add_argument('--format', choices=['torchscript', 'onnx'], default='torchscript',
+                            help='Artifact for the optimized or the onnx backend (default: torchscript)')
+        parser.add_argument('--output', type=str, default=None,
+                            help='Artifact path (default: next to the weights as '
+                                 '<weights>.<digest>.optimized.pt or <weights>.<digest>.onnx)')
+        parser.add_argument('--no-quantize', action='store_true',
+                            help='Only script the model, keep float linear layers (torchscript only)')
+        parser.add_argument('--samples', type=int, default=10,
+                            help='Number of images for the latency/accuracy report, 0 to skip it')
+        parser.add_argument('--size', type=int, default=512,
+                            help='Side length of the report images in pixels')
+        parser.add_argument('--confidence-threshold', type=float, default=0.5,
+                            help='Confidence threshold used in the report')
+        parser.add_argument('--report', type=str, default=None,
+                            help='Also write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        model_path = options['model_path']
+        onnx = options['format'] == 'onnx'
+        default_output = onnx_artifact_path(model_path) if onnx else optimized_artifact_path(model_path)
+        output = options['output'] or default_output
+        num_classes = CategoryType.objects.count() + 1  # +1 for background
+
+        self.stdout.write(f'Exporting {options["format"]} model to {output}')
+        try:
+            if onnx:
+                export_onnx(model_path, output, num_classes, size=options['size'])
+            else:
+                export_optimized(model_path, output, num_classes, quantize=not options['no_quantize'])
+        except Exception as e:
+            raise CommandError(f'Export failed: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Saved {output}'))
+        if output == default_output:
+            for path in stale_artifacts(model_path):
+                os.remove(path)
+                self.stdout.write(f'Removed {path}, built from earlier weights')
+
+        if options['samples'] <= 0:
+            return
+        if output != default_output:
+            self.stdout.write(self.style.WARNING('Skipping the report, the backends only load artifacts from the default path'))
+            return
+
+        eager = MaskRCNNPredictor(model_path=model_path, num_classes=num_classes)
+        candidate_class = OnnxMaskRCNNPredictor if onnx else OptimizedMaskRCNNPredictor
+        optimized = candidate_class(model_path=model_path, num_classes=num_classes)
+
+        # Synthetic imagery keeps the report reproducible across machines
+        rng = np.random.default_rng(0)
+        size = options['size']
+        images = [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(options['samples'])]
+
+        report = compare_models(eager, optimized, images, options['confidence_threshold'])
+        latency, accuracy = report['latency'], report['accuracy']
+        for name in ('reference', 'candidate'):
+            label = 'eager' if name == 'reference' else options['format']
+            stats = latency[name]
+            self.stdout.write(
+                f'{label:>9}: mean {stats["mean_ms"]:.1f} ms, '
+                f'p50 {stats["p50_ms"]:.1f} ms, p95 {stats["p95_ms"]:.1f} ms, '
+                f'{accuracy[name + "_detections"]} detections'
+            )
+        self.stdout.write(f'  speedup: {latency["speedup"]:.2f}x')
+        self.stdout.write(f'   recall: {accuracy["recall"]:.3f} of eager detections reproduced')
+        if accuracy['mean_box_iou'] is not None:
+            self.stdout.write(
+                f' box IoU: {accuracy["mean_box_iou"]:.3f} mean, '
+                f'score delta {accuracy["mean_score_delta"]:.4f} mean'
+            )
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["report"]}'))
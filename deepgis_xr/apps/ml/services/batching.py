@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from deepgis_xr.apps.ml.services.predictor import BasePredictor
+
+_SHUTDOWN = object()
+
+
+class BatchingExecutor:
+    """Micro-batching front end for a loaded predictor
+
+    Concurrent predict() calls are queued and a single worker thread drains
+    them into batches of at most max_batch_size images, waiting no longer
+    than max_wait_ms after the first queued request. Each batch is one
+    forward pass through predictor.predict_batch() and every caller receives
+    its own result (or the exception raised by the batch).
+    """
+
+    def __init__(self, predictor: BasePredictor, max_batch_size: int = 8, max_wait_ms: float = 10):
+        self.predictor = predictor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: Optional['queue.Queue'] = None
+        self._lock = threading.Lock()
+
+    def submit(self, image: np.ndarray, confidence_threshold: Optional[float] = None) -> Future:
+        """Queue an image and return a future for its predictions"""
+        future = Future()
+        if self.max_batch_size == 1:
+            # Nothing to batch with, skip the queue hop
+            try:
+                future.set_result(self.predictor.predict(image, confidence_threshold))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with self._lock:
+            if self._queue is None:
+                # Each worker owns its queue so a shutdown never strands requests
+                self._queue = queue.Queue()
+                threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name='prediction-batcher',
+                    daemon=True
+                ).start()
+            self._queue.put((image, confidence_threshold, future))
+        return future
+
+    def predict(self, image: np.ndarray, confidence_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Blocking predict with the same signature as BasePredictor.predict"""
+        return self.submit(image, confidence_threshold).result()
+
+    def shutdown(self):
+        """Stop the worker thread once queued requests are served"""
+        with self._lock:
+            if self._queue is not None:
+                self._queue.put(_SHUTDOWN)
+                self._queue = None
+
+    def _collect(self, requests: 'queue.Queue', first: Tuple) -> Tuple[List[Tuple], bool]:
+        """Gather requests queued within max_wait of the first one"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is _SHUTDOWN:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, requests: 'queue.Queue'):
+        while True:
+            item = requests.get()
+            if item is _SHUTDOWN:
+                return
+            batch, stop = self._collect(requests, item)
+            futures = [future for _, _, future in batch]
+            try:
+                results = self.predictor.predict_batch(
+                    [image for image, _, _ in batch],
+                    [threshold for _, threshold, _ in batch]
+                )
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            if stop:
+                return
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+from django.conf import settings
+
+from deepgis_xr.apps.core.utils.masks import decode_rle_stack, encode_rle
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+
+def filter_predictions(predictions: Dict[str, Any], confidence_threshold: float) -> Dict[str, Any]:
+    """Keep detections scoring at least confidence_threshold"""
+    keep = np.asarray(predictions["scores"]) >= confidence_threshold
+    return {key: value[keep] for key, value in predictions.items()}
+
+
+class PredictionCache:
+    """Disk-backed cache of raw model outputs
+
+    Entries hold every detection the model returned (boxes, scores, labels
+    and RLE-compressed binary masks) so any confidence threshold can be
+    applied with filter_predictions() without re-running the network. Files
+    are evicted least recently used first once the directory grows past
+    max_bytes.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'PREDICTION_CACHE_DIR',
+                       os.path.join(settings.MEDIA_ROOT, 'cache', 'predictions'))
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'PREDICTION_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Stable key for JSON-serialisable parts"""
+        return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Cached predictions for key, or None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                masks = decode_rle_stack(data['mask_counts'], data['mask_offsets'], tuple(data['mask_shape']))
+                predictions = {
+                    "pred_boxes": data['pred_boxes'],
+                    "scores": data['scores'],
+                    "pred_classes": data['pred_classes'],
+                    "pred_masks": masks.astype(np.uint8)
+                }
+            # Mark as recently used for eviction
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return predictions
+
+    def put(self, key: str, predictions: Dict[str, Any], mask_threshold: float = 0.5):
+        """Store unfiltered predictions under key"""
+        masks = np.asarray(predictions["pred_masks"])
+        counts, offsets = encode_rle(masks >= mask_threshold)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(
+                f,
+                pred_boxes=np.asarray(predictions["pred_boxes"], dtype=np.float32),
+                scores=np.asarray(predictions["scores"], dtype=np.float32),
+                pred_classes=np.asarray(predictions["pred_classes"], dtype=np.int64),
+                mask_counts=counts,
+                mask_offsets=offsets,
+                mask_shape=np.array(masks.shape[-2:], dtype=np.int64)
+            )
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.directory) if e.name.endswith('.npz')]
+            except FileNotFoundError:
+                return
+            stats = []
+            for entry in entries:
+                try:
+                    stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+            total = sum(size for _, size, _ in stats)
+            for _, size, path in sorted(stats):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.npz'):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+
+prediction_cache = PredictionCache()
@@ -0,0 +1,147 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from shapely.geometry import shape
+
+from deepgis_xr.apps.core.models import CategoryType, Labeler, RasterImage, TiledGISLabel
+from deepgis_xr.apps.core.utils.tiles import label_tile_cache
+
+# Nesting depth of the coordinate arrays of each GeoJSON geometry type
+GEOMETRY_DEPTHS = {
+    'Point': 1,
+    'MultiPoint': 2,
+    'LineString': 2,
+    'MultiLineString': 3,
+    'Polygon': 3,
+    'MultiPolygon': 4,
+}
+
+
+def _vertices(geometry: Dict[str, Any]) -> np.ndarray:
+    """Every (x, y) vertex of a GeoJSON geometry as an (N, 2) array"""
+    depth = GEOMETRY_DEPTHS.get(geometry.get('type'))
+    if depth is None:
+        raise ValueError(f"Unsupported geometry type: {geometry.get('type')}")
+    coordinates = geometry['coordinates']
+    for _ in range(depth - 2):
+        coordinates = [part for parts in coordinates for part in parts]
+    if not coordinates:
+        raise ValueError("Empty geometry")
+    vertices = np.asarray(coordinates, dtype=np.float64)
+    vertices = vertices.reshape(-1, vertices.shape[-1])
+    if vertices.shape[1] < 2:
+        raise ValueError("Coordinates need at least x and y")
+    return vertices[:, :2]
+
+
+def prepare_features(features: List[Dict[str, Any]],
+                     categories: Dict[str, CategoryType]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Validate GeoJSON features and compute their bboxes
+
+    Returns the valid features as dicts of TiledGISLabel field values, in
+    input order and tagged with their input index, and an error entry for
+    every feature that was rejected. Bboxes and coordinate checks run over
+    the vertices of all features at once.
+    """
+    errors = []
+    parsed = []   # (index, feature, category, wkb, vertices)
+    for index, feature in enumerate(features):
+        try:
+            category_name = feature['properties']['category']
+            if category_name not in categories:
+                raise ValueError(f"Unknown category: {category_name}")
+            geometry = feature['geometry']
+            vertices = _vertices(geometry)
+            polygon = shape(geometry)
+            if not polygon.is_valid:
+                raise ValueError("Invalid geometry")
+        except Exception as e:
+            message = f"Missing field: {e}" if isinstance(e, KeyError) else str(e)
+            errors.append({"index": index, "message": message})
+            continue
+        parsed.append((index, feature, categories[category_name], polygon.wkb, vertices))
+
+    if not parsed:
+        return [], errors
+
+    # One pass over every vertex: finiteness and per-feature bounds
+    counts = np.array([len(vertices) for *_, vertices in parsed])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    vertices = np.concatenate([vertices for *_, vertices in parsed])
+    finite = np.logical_and.reduceat(np.isfinite(vertices).all(axis=1), starts)
+    mins = np.minimum.reduceat(vertices, starts)
+    maxs = np.maximum.reduceat(vertices, starts)
+
+    rows = []
+    for (index, feature, category, geometry, _), ok, (minx, miny), (maxx, maxy) in zip(parsed, finite, mins, maxs):
+        if not ok:
+            errors.append({"index": index, "message": "Non-finite coordinates"})
+            continue
+        rows.append({
+            "index": index,
+            "category": category,
+            # The geometry and bbox live in their own columns
+            "label_json": {key: value for key, value in feature.items() if key not in ('geometry', 'bbox')},
+            "geometry": geometry,
+            "northeast_lat": float(maxy),
+            "northeast_lng": float(maxx),
+            "southwest_lat": float(miny),
+            "southwest_lng": float(minx),
+        })
+    errors.sort(key=lambda error: error["index"])
+    return rows, errors
+
+
+def save_tiled_labels(features: List[Dict[str, Any]],
+                      raster: RasterImage,
+                      labeler: Labeler,
+                      batch_size: Optional[int] = None) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """Bulk insert GeoJSON features as TiledGISLabels in a single transaction
+
+    Categories are looked up once for the whole request. Invalid features
+    are reported as errors and skipped; the rest are written with
+    bulk_create in batches of batch_size. Returns the created ids in input
+    order and the per-feature errors.
+    """
+    batch_size = batch_size or getattr(settings, 'LABEL_BULK_BATCH_SIZE', 500)
+    names = {
+        feature.get('properties', {}).get('category')
+        for feature in features if isinstance(feature, dict) and isinstance(feature.get('properties'), dict)
+    }
+    categories = {
+        category.category_name: category
+        for category in CategoryType.objects.filter(category_name__in=[n for n in names if n])
+    }
+
+    rows, errors = prepare_features(features, categories)
+    labels = [
+        TiledGISLabel(
+            parent_raster=raster,
+            labeler=labeler,
+            **{key: value for key, value in row.items() if key != 'index'}
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        created = TiledGISLabel.objects.bulk_create(labels, batch_size=batch_size)
+        ids = [label.pk for label in created]
+        if created and ids[0] is None:
+            # Backends without RETURNING (SQLite on Django 3.2): our rows are the
+            # newest ones for this raster and labeler while the write lock is held
+            ids = list(
+                TiledGISLabel.objects
+                .filter(parent_raster=raster, labeler=labeler)
+                .order_by('-id')
+                .values_list('id', flat=True)[:len(created)]
+            )[::-1]
+
+        # bulk_create sends no signals, clear the label tiles ourselves
+        touched = [
+            (row["southwest_lng"], row["southwest_lat"], row["northeast_lng"], row["northeast_lat"])
+            for row in rows
+        ]
+        transaction.on_commit(lambda: label_tile_cache.invalidate_bounds(touched))
+    return ids, errors
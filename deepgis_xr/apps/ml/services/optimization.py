@@ -0,0 +1,138 @@
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+from deepgis_xr.apps.ml.services.predictor import ONNX_OUTPUT_NAMES, BasePredictor, build_maskrcnn
+from deepgis_xr.apps.ml.services.region import box_iou
+
+
+def export_optimized(model_path: Optional[str],
+                     output_path: str,
+                     num_classes: int,
+                     quantize: bool = True) -> str:
+    """Script a trained Mask R-CNN for CPU inference and save it to output_path
+
+    With quantize the nn.Linear layers (box head and predictor) are converted
+    to dynamic int8; convolutions stay in float.
+    """
+    model = build_maskrcnn(num_classes, model_path, torch.device('cpu'))
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    scripted = torch.jit.script(model)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    scripted.save(output_path)
+    return output_path
+
+
+def export_onnx(model_path: Optional[str],
+                output_path: str,
+                num_classes: int,
+                size: int = 512,
+                opset_version: int = 11) -> str:
+    """Export a trained Mask R-CNN to an ONNX graph taking one (3, H, W) float image
+
+    Height and width are dynamic; size only sets the tracing example.
+    """
+    model = build_maskrcnn(num_classes, model_path, torch.device('cpu'))
+    example = torch.rand(3, size, size)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    torch.onnx.export(
+        model,
+        ([example],),
+        output_path,
+        opset_version=opset_version,
+        do_constant_folding=True,
+        input_names=['image'],
+        output_names=ONNX_OUTPUT_NAMES,
+        dynamic_axes={
+            'image': {1: 'height', 2: 'width'},
+            'boxes': {0: 'detections'},
+            'labels': {0: 'detections'},
+            'scores': {0: 'detections'},
+            'masks': {0: 'detections', 2: 'height', 3: 'width'},
+        }
+    )
+    return output_path
+
+
+def _latency_stats(seconds: List[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+    }
+
+
+def _match(reference: Dict[str, Any], candidate: Dict[str, Any], iou_threshold: float):
+    """Greedy one-to-one matching of candidate detections to reference ones"""
+    matches = []
+    used = np.zeros(len(candidate["pred_boxes"]), dtype=bool)
+    if not len(used):
+        return matches
+    for i in np.argsort(-reference["scores"], kind='stable'):
+        same_class = candidate["pred_classes"] == reference["pred_classes"][i]
+        ious = box_iou(reference["pred_boxes"][i], candidate["pred_boxes"])
+        ious[used | ~same_class] = 0
+        j = int(np.argmax(ious))
+        if ious[j] >= iou_threshold:
+            used[j] = True
+            matches.append((i, j, float(ious[j])))
+    return matches
+
+
+def compare_models(reference: BasePredictor,
+                   candidate: BasePredictor,
+                   images: List[np.ndarray],
+                   confidence_threshold: float = 0.5,
+                   iou_threshold: float = 0.5,
+                   warmup: int = 1) -> Dict[str, Any]:
+    """Side-by-side latency and agreement report for two predictors
+
+    Accuracy is measured against the reference model's own detections:
+    recall is the fraction of reference detections the candidate reproduces
+    (same class, box IoU >= iou_threshold).
+    """
+    for image in images[:warmup]:
+        reference.predict(image, confidence_threshold)
+        candidate.predict(image, confidence_threshold)
+
+    timings = {"reference": [], "candidate": []}
+    counts = {"reference": 0, "candidate": 0}
+    matched, ious, score_deltas = 0, [], []
+    for image in images:
+        outputs = {}
+        for name, predictor in (("reference", reference), ("candidate", candidate)):
+            start = time.perf_counter()
+            outputs[name] = predictor.predict(image, confidence_threshold)
+            timings[name].append(time.perf_counter() - start)
+            counts[name] += len(outputs[name]["scores"])
+
+        for i, j, iou in _match(outputs["reference"], outputs["candidate"], iou_threshold):
+            matched += 1
+            ious.append(iou)
+            score_deltas.append(abs(float(outputs["reference"]["scores"][i]) -
+                                    float(outputs["candidate"]["scores"][j])))
+
+    reference_latency = _latency_stats(timings["reference"])
+    candidate_latency = _latency_stats(timings["candidate"])
+    return {
+        "samples": len(images),
+        "latency": {
+            "reference": reference_latency,
+            "candidate": candidate_latency,
+            "speedup": reference_latency["mean_ms"] / max(candidate_latency["mean_ms"], 1e-9),
+        },
+        "accuracy": {
+            "reference_detections": counts["reference"],
+            "candidate_detections": counts["candidate"],
+            "recall": matched / counts["reference"] if counts["reference"] else 1.0,
+            "mean_box_iou": float(np.mean(ious)) if ious else None,
+            "mean_score_delta": float(np.mean(score_deltas)) if score_deltas else None,
+        }
+    }
@@ -0,0 +1,100 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from rasterio import features
+from rasterio.transform import Affine
+from shapely.geometry import shape
+
+
+def _box_window(box: np.ndarray, height: int, width: int):
+    """Integer pixel window covering a float [x0, y0, x1, y1] box"""
+    x0 = int(np.clip(np.floor(box[0]), 0, width))
+    y0 = int(np.clip(np.floor(box[1]), 0, height))
+    x1 = int(np.clip(np.ceil(box[2]), 0, width))
+    y1 = int(np.clip(np.ceil(box[3]), 0, height))
+    return x0, y0, x1, y1
+
+
+def masks_to_features(boxes: np.ndarray,
+                      masks: np.ndarray,
+                      scores: np.ndarray,
+                      category_names: Sequence[str],
+                      transform: Affine,
+                      mask_threshold: float = 0.5,
+                      simplify_tolerance: Optional[float] = 1.0) -> List[Dict[str, Any]]:
+    """Vectorize instance masks into GeoJSON features
+
+    All masks are thresholded in one operation and each detection is traced
+    with rasterio.features.shapes inside its own box only. Polygons are
+    simplified in pixel units, so the ground tolerance follows the read
+    resolution (coarser when zoomed out). Pixel coordinates of every ring are
+    then mapped through the affine transform as a single NumPy operation.
+
+    Returns one Polygon or MultiPolygon feature per detection with a bbox.
+    """
+    if len(masks) == 0:
+        return []
+
+    binary = np.asarray(masks) >= mask_threshold
+    height, width = binary.shape[-2:]
+
+    rings = []        # pixel coordinate arrays, in order
+    detections = []   # (detection index, [[ring indices of polygon], ...])
+    for i, box in enumerate(np.asarray(boxes)):
+        x0, y0, x1, y1 = _box_window(box, height, width)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        window = binary[i, y0:y1, x0:x1]
+        if not window.any():
+            continue
+
+        polygons = []
+        for geometry, _ in features.shapes(
+                window.astype(np.uint8),
+                mask=window,
+                connectivity=8,
+                transform=Affine.translation(x0, y0)):
+            polygon = shape(geometry)
+            if simplify_tolerance:
+                polygon = polygon.simplify(simplify_tolerance, preserve_topology=True)
+            if polygon.is_empty:
+                continue
+            ring_ids = []
+            for ring in [polygon.exterior, *polygon.interiors]:
+                ring_ids.append(len(rings))
+                rings.append(np.asarray(ring.coords, dtype=np.float64))
+            polygons.append(ring_ids)
+        if polygons:
+            detections.append((i, polygons))
+
+    if not rings:
+        return []
+
+    # Pixel (col, row) -> geographic (x, y) for every vertex at once
+    pixels = np.concatenate(rings)
+    a, b, c, d, e, f = transform[:6]
+    geo = np.empty_like(pixels)
+    geo[:, 0] = a * pixels[:, 0] + b * pixels[:, 1] + c
+    geo[:, 1] = d * pixels[:, 0] + e * pixels[:, 1] + f
+    geo_rings = np.split(geo, np.cumsum([len(ring) for ring in rings])[:-1])
+
+    result = []
+    for i, polygons in detections:
+        coordinates = [[geo_rings[r].tolist() for r in ring_ids] for ring_ids in polygons]
+        vertices = np.concatenate([geo_rings[r] for ring_ids in polygons for r in ring_ids])
+        minx, miny = vertices.min(axis=0)
+        maxx, maxy = vertices.max(axis=0)
+        if len(coordinates) == 1:
+            geometry = {"type": "Polygon", "coordinates": coordinates[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": coordinates}
+        result.append({
+            "type": "Feature",
+            "bbox": [float(minx), float(miny), float(maxx), float(maxy)],
+            "geometry": geometry,
+            "properties": {
+                "category": category_names[i],
+                "confidence": float(scores[i])
+            }
+        })
+    return result
@@ -1,101 +1,347 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+import glob
+import hashlib
+import logging
+import re
 import torch
 import numpy as np
 import os
+from django.conf import settings
 from torchvision.models.detection import maskrcnn_resnet50_fpn
 from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
+from torchvision.models.detection.mask_rcnn import MaskRCNNPredictor as MaskRCNNHead
 from torchvision.transforms import functional as F
-from shapely.geometry import Polygon
-from shapely.geometry import mapping
-from skimage import measure
 
+from deepgis_xr.apps.core.exceptions import ModelNotFoundError
 from deepgis_xr.apps.core.models import CategoryType
+from deepgis_xr.apps.ml.services.polygonize import masks_to_features
+from deepgis_xr.apps.ml.services.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+# Output order of graphs written by export_onnx()
+ONNX_OUTPUT_NAMES = ['boxes', 'labels', 'scores', 'masks']
+
+# settings.ONNX_GRAPH_OPTIMIZATION_LEVEL -> onnxruntime.GraphOptimizationLevel
+ONNX_OPTIMIZATION_LEVELS = {
+    'disable': lambda ort: ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': lambda ort: ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': lambda ort: ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': lambda ort: ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def build_maskrcnn(num_classes: int,
+                   model_path: Optional[str] = None,
+                   device: Optional[torch.device] = None) -> torch.nn.Module:
+    """Mask R-CNN with heads sized like DeepGISTrainer's, loading trained weights if present"""
+    device = device or torch.device('cpu')
+    # Trained weights replace everything, so only download ImageNet/COCO weights without them
+    has_weights = bool(model_path and os.path.exists(model_path))
+    model = maskrcnn_resnet50_fpn(pretrained=not has_weights, pretrained_backbone=not has_weights)
+    
+    # Modify the classifier to match our number of classes
+    in_features = model.roi_heads.box_predictor.cls_score.in_features
+    model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
+    
+    # Load custom weights if available
+    if has_weights:
+        # Trained checkpoints also carry a mask head sized for our classes
+        in_features_mask = model.roi_heads.mask_predictor.conv5_mask.in_channels
+        model.roi_heads.mask_predictor = MaskRCNNHead(in_features_mask, 256, num_classes)
+        model.load_state_dict(torch.load(model_path, map_location=device))
+    
+    model.to(device)
+    model.eval()
+    return model
+
+
+def model_fingerprint(model_path: Optional[str]) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """Identify a weights file by path, modification time and size"""
+    if not model_path or not os.path.exists(model_path):
+        return model_path or None, None, None
+    stat = os.stat(model_path)
+    return os.path.abspath(model_path), stat.st_mtime_ns, stat.st_size
+
+
+_digests: Dict[Tuple[Optional[str], Optional[int], Optional[int]], str] = {}
+
+
+def weights_digest(model_path: Optional[str]) -> str:
+    """Content hash of a weights file, memoised per path/mtime/size"""
+    fingerprint = model_fingerprint(model_path)
+    if fingerprint[1] is None:
+        return 'pretrained'
+    digest = _digests.get(fingerprint)
+    if digest is None:
+        sha1 = hashlib.sha1()
+        with open(fingerprint[0], 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        digest = _digests[fingerprint] = sha1.hexdigest()
+    return digest
+
+
+def _artifact_path(model_path: Optional[str], extension: str) -> str:
+    # Named after the weights' content so an artifact of replaced weights is never loaded
+    if not model_path or not os.path.exists(model_path):
+        return os.path.join(settings.MEDIA_ROOT, 'models', f'pretrained{extension}')
+    return f"{os.path.splitext(model_path)[0]}.{weights_digest(model_path)[:16]}{extension}"
+
+
+def optimized_artifact_path(model_path: Optional[str]) -> str:
+    """Where the TorchScript artifact for a weights file is stored"""
+    return _artifact_path(model_path, '.optimized.pt')
+
+
+def onnx_artifact_path(model_path: Optional[str]) -> str:
+    """Where the ONNX graph for a weights file is stored"""
+    return _artifact_path(model_path, '.onnx')
+
+
+def stale_artifacts(model_path: Optional[str]) -> List[str]:
+    """Artifacts next to a weights file that were built from earlier weights"""
+    if not model_path or not os.path.exists(model_path):
+        return []
+    current = {optimized_artifact_path(model_path), onnx_artifact_path(model_path)}
+    stem = os.path.splitext(model_path)[0]
+    pattern = re.compile(re.escape(stem) + r'(\.[0-9a-f]{16})?\.(optimized\.pt|onnx)$')
+    return sorted(
+        path for path in glob.glob(glob.escape(stem) + '.*')
+        if pattern.match(path) and path not in current
+    )
+
+
+def pin_threads():
+    """Apply the per-worker intra/inter-op thread counts from settings"""
+    intra_op = getattr(settings, 'INFERENCE_INTRA_OP_THREADS', 0)
+    inter_op = getattr(settings, 'INFERENCE_INTER_OP_THREADS', 0)
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Only allowed before the first parallel region runs in this process
+            logger.warning("Inter-op thread count already fixed for this process")
 
 class BasePredictor:
     """Base class for all predictors"""
     
-    def __init__(self, model_path: Optional[str] = None, confidence_threshold: float = 0.5):
+    # Inference backend that produced results, part of prediction cache keys
+    backend = 'eager'
+    
+    def __init__(self,
+                 model_path: Optional[str] = None,
+                 confidence_threshold: float = 0.5,
+                 num_classes: Optional[int] = None):
         self.model_path = model_path
         self.confidence_threshold = confidence_threshold
-        self.model = self._load_model()
+        self.num_classes = num_classes or len(CategoryType.objects.all()) + 1  # +1 for background
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = self._load_model()
         
     def _load_model(self):
         """Load the ML model - to be implemented by subclasses"""
         raise NotImplementedError
         
-    def predict(self, image: np.ndarray) -> Dict[str, Any]:
+    def predict(self, image: np.ndarray, confidence_threshold: Optional[float] = None) -> Dict[str, Any]:
         """Run prediction on image - to be implemented by subclasses"""
         raise NotImplementedError
+    
+    def predict_batch(self,
+                      images: List[np.ndarray],
+                      confidence_thresholds: Optional[List[Optional[float]]] = None) -> List[Dict[str, Any]]:
+        """Run prediction on several images, one result per image"""
+        if confidence_thresholds is None:
+            confidence_thresholds = [None] * len(images)
+        return [self.predict(image, threshold) for image, threshold in zip(images, confidence_thresholds)]
+    
+    def predictions_to_geojson(self,
+                               predictions: Dict[str, Any],
+                               transform: Any,
+                               categories: List[CategoryType],
+                               simplify_tolerance: Optional[float] = 1.0) -> Dict[str, Any]:
+        """Convert predictions to GeoJSON format
+
+        simplify_tolerance is in pixels of the image that was predicted on.
+        """
+        categories = list(categories)
+        # Subtract 1 as class 0 is background
+        category_names = [
+            categories[int(label) - 1].category_name
+            for label in predictions["pred_classes"]
+        ]
+        features = masks_to_features(
+            predictions["pred_boxes"],
+            predictions["pred_masks"],
+            predictions["scores"],
+            category_names,
+            transform,
+            simplify_tolerance=simplify_tolerance
+        )
+        return {
+            "type": "FeatureCollection",
+            "features": features
+        }
+    
+    def memory_footprint(self) -> int:
+        """Approximate number of bytes held by the loaded model"""
+        if not isinstance(self.model, torch.nn.Module):
+            return 0
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
 
 
 class MaskRCNNPredictor(BasePredictor):
     """Mask R-CNN implementation using torchvision"""
     
     def _load_model(self):
-        num_classes = len(CategoryType.objects.all()) + 1  # +1 for background
-        model = maskrcnn_resnet50_fpn(pretrained=True)
+        return build_maskrcnn(self.num_classes, self.model_path, self.device)
+    
+    def _forward(self, image_tensors: List[torch.Tensor]) -> List[Dict[str, torch.Tensor]]:
+        with torch.no_grad():
+            return self.model(image_tensors)
+    
+    @staticmethod
+    def _to_hwc(image: np.ndarray) -> np.ndarray:
+        """Convert band-first raster reads (C, H, W) to the RGB (H, W, C) layout to_tensor expects"""
+        if image.ndim == 2:
+            image = image[None]
+        if image.ndim == 3 and image.shape[0] < min(image.shape[1:]):
+            if image.shape[0] < 3:
+                # Repeat the last band of single/dual band rasters
+                image = np.concatenate([image, np.repeat(image[-1:], 3 - image.shape[0], axis=0)])
+            image = np.moveaxis(image[:3], 0, -1)
+        return np.ascontiguousarray(image)
+    
+    def predict(self, image: np.ndarray, confidence_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Run inference on an image"""
+        return self.predict_batch([image], [confidence_threshold])[0]
+    
+    def predict_batch(self,
+                      images: List[np.ndarray],
+                      confidence_thresholds: Optional[List[Optional[float]]] = None) -> List[Dict[str, Any]]:
+        """Run inference on several images in a single forward pass"""
+        if confidence_thresholds is None:
+            confidence_thresholds = [None] * len(images)
         
-        # Modify the classifier to match our number of classes
-        in_features = model.roi_heads.box_predictor.cls_score.in_features
-        model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
+        # Convert numpy arrays to tensors
+        with stage('preprocess'):
+            image_tensors = [F.to_tensor(self._to_hwc(image)).to(self.device) for image in images]
         
-        # Load custom weights if available
-        if self.model_path and os.path.exists(self.model_path):
-            model.load_state_dict(torch.load(self.model_path, map_location=self.device))
+        with stage('forward'):
+            outputs = self._forward(image_tensors)
         
-        model.to(self.device)
+        results = []
+        with stage('postprocess'):
+            for predictions, threshold in zip(outputs, confidence_thresholds):
+                if threshold is None:
+                    threshold = self.confidence_threshold
+                
+                # Filter predictions based on confidence threshold
+                mask = predictions['scores'] >= threshold
+                
+                results.append({
+                    "pred_boxes": predictions['boxes'][mask].cpu().numpy(),
+                    "scores": predictions['scores'][mask].cpu().numpy(),
+                    "pred_classes": predictions['labels'][mask].cpu().numpy(),
+                    "pred_masks": predictions['masks'][mask].squeeze(1).cpu().numpy()
+                })
+        return results
+
+
+class OptimizedMaskRCNNPredictor(MaskRCNNPredictor):
+    """CPU-optimized Mask R-CNN: TorchScript with int8 dynamic quantization
+    
+    Loads the artifact written by the optimize_predictor management command
+    and pins the process' thread pools. Falls back to the eager model when
+    no artifact has been generated for the weights yet.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        pin_threads()
+        super().__init__(*args, **kwargs)
+    
+    def _load_model(self):
+        # Quantized kernels only run on CPU
+        self.device = torch.device('cpu')
+        artifact_path = optimized_artifact_path(self.model_path)
+        if not os.path.exists(artifact_path):
+            logger.warning(
+                "No optimized artifact at %s, using the eager model. "
+                "Run 'manage.py optimize_predictor' to generate it.", artifact_path
+            )
+            return super()._load_model()
+        model = torch.jit.load(artifact_path, map_location=self.device)
         model.eval()
+        self.backend = 'optimized'
         return model
     
-    def predict(self, image: np.ndarray) -> Dict[str, Any]:
-        """Run inference on an image"""
-        # Convert numpy array to tensor
-        image_tensor = F.to_tensor(image).to(self.device)
-        
+    def memory_footprint(self) -> int:
+        # Packed quantized weights are not registered as parameters
+        artifact_path = optimized_artifact_path(self.model_path)
+        if isinstance(self.model, torch.jit.ScriptModule) and os.path.exists(artifact_path):
+            return max(super().memory_footprint(), os.path.getsize(artifact_path))
+        return super().memory_footprint()
+    
+    def _forward(self, image_tensors: List[torch.Tensor]) -> List[Dict[str, torch.Tensor]]:
         with torch.no_grad():
-            predictions = self.model([image_tensor])[0]
-        
-        # Filter predictions based on confidence threshold
-        mask = predictions['scores'] >= self.confidence_threshold
-        
-        return {
-            "pred_boxes": predictions['boxes'][mask].cpu().numpy(),
-            "scores": predictions['scores'][mask].cpu().numpy(),
-            "pred_classes": predictions['labels'][mask].cpu().numpy(),
-            "pred_masks": predictions['masks'][mask].squeeze(1).cpu().numpy()
-        }
+            outputs = self.model(image_tensors)
+        # Scripted detection models return (losses, detections)
+        if isinstance(outputs, tuple):
+            outputs = outputs[1]
+        return outputs
+
+
+class OnnxMaskRCNNPredictor(MaskRCNNPredictor):
+    """Mask R-CNN exported to ONNX and run with onnxruntime's CPU execution provider
+    
+    Loads the graph written by 'manage.py optimize_predictor --format onnx'.
+    Results have the same keys as MaskRCNNPredictor so callers and
+    predictions_to_geojson are unchanged.
+    """
+    
+    backend = 'onnx'
     
-    def predictions_to_geojson(self, 
-                             predictions: Dict[str, Any],
-                             transform: Any,
-                             categories: List[CategoryType]) -> Dict[str, Any]:
-        """Convert predictions to GeoJSON format"""
-        features = []
+    def _load_model(self):
+        import onnxruntime as ort
         
-        for i in range(len(predictions["pred_boxes"])):
-            mask = predictions["pred_masks"][i]
-            score = predictions["scores"][i]
-            category_idx = predictions["pred_classes"][i] - 1  # Subtract 1 as class 0 is background
-            
-            # Convert binary mask to polygon
-            contours = measure.find_contours(mask, 0.5)
-            for contour in contours:
-                # Convert to geographic coordinates
-                coords = transform * contour
-                polygon = Polygon(coords)
-                
-                feature = {
-                    "type": "Feature",
-                    "geometry": mapping(polygon),
-                    "properties": {
-                        "category": categories[category_idx].category_name,
-                        "confidence": float(score)
-                    }
-                }
-                features.append(feature)
+        self.device = torch.device('cpu')
+        artifact_path = onnx_artifact_path(self.model_path)
+        if not os.path.exists(artifact_path):
+            raise ModelNotFoundError(
+                f"No ONNX model at {artifact_path}. "
+                "Run 'manage.py optimize_predictor --format onnx' to generate it."
+            )
         
-        return {
-            "type": "FeatureCollection",
-            "features": features
-        } 
\ No newline at end of file
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = getattr(settings, 'INFERENCE_INTRA_OP_THREADS', 0)
+        options.inter_op_num_threads = getattr(settings, 'INFERENCE_INTER_OP_THREADS', 0)
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        level = getattr(settings, 'ONNX_GRAPH_OPTIMIZATION_LEVEL', 'all')
+        options.graph_optimization_level = ONNX_OPTIMIZATION_LEVELS[level](ort)
+        
+        session = ort.InferenceSession(artifact_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        return session
+    
+    def memory_footprint(self) -> int:
+        # Initializers are loaded into the session, the graph file is a fair estimate
+        artifact_path = onnx_artifact_path(self.model_path)
+        return os.path.getsize(artifact_path) if os.path.exists(artifact_path) else 0
+    
+    def _forward(self, image_tensors: List[torch.Tensor]) -> List[Dict[str, torch.Tensor]]:
+        # The exported graph takes a single (C, H, W) image
+        outputs = []
+        for tensor in image_tensors:
+            boxes, labels, scores, masks = self.model.run(
+                ONNX_OUTPUT_NAMES, {self.input_name: tensor.numpy()}
+            )
+            outputs.append({
+                'boxes': torch.from_numpy(boxes),
+                'labels': torch.from_numpy(labels),
+                'scores': torch.from_numpy(scores),
+                'masks': torch.from_numpy(masks)
+            })
+        return outputs
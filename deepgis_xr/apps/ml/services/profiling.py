@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+
+import numpy as np
+
+
+class StageTimer:
+    """Process-wide wall clock timings of named inference stages
+
+    The prediction path wraps its stages in stage(); recording is off by
+    default so production requests only pay for a flag check. Timings are
+    collected across threads, which includes the BatchingExecutor worker.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._durations: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._durations[name].append(elapsed)
+
+    def start(self):
+        self.reset()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._durations = defaultdict(list)
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds spent per stage since the last reset"""
+        with self._lock:
+            return {name: sum(values) for name, values in self._durations.items()}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage call count, total, mean and percentiles in milliseconds"""
+        with self._lock:
+            durations = {name: np.asarray(values) * 1000 for name, values in self._durations.items()}
+        return {
+            name: {
+                "calls": int(len(ms)),
+                "total_ms": float(ms.sum()),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+            }
+            for name, ms in durations.items() if len(ms)
+        }
+
+
+stage_timer = StageTimer()
+stage = stage_timer.stage
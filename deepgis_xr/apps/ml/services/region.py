@@ -0,0 +1,188 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from rasterio.transform import Affine
+
+from deepgis_xr.apps.core.models import CategoryType
+from deepgis_xr.apps.core.utils.utils import tile_boxes
+from deepgis_xr.apps.ml.services.predictor import BasePredictor
+from deepgis_xr.apps.ml.services.profiling import stage
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU of one [x0, y0, x1, y1] box against an (N, 4) array of boxes"""
+    ix0 = np.maximum(box[0], boxes[:, 0])
+    iy0 = np.maximum(box[1], boxes[:, 1])
+    ix1 = np.minimum(box[2], boxes[:, 2])
+    iy1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(ix1 - ix0, 0, None) * np.clip(iy1 - iy0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+class SeamMerger:
+    """Greedy box/mask NMS over detections from overlapping tiles
+
+    Detections are kept in region pixel coordinates with their binary mask
+    cropped to the box. A new detection is suppressed when it overlaps an
+    already accepted detection of the same class by more than iou_threshold
+    in mask IoU. Accepted detections are bucketed in a grid of cell_size
+    cells, so a new one is only compared with those near it. Tiles are
+    merged in the order they finish so accepted features can be streamed
+    straight away, and forget_above() drops detections no later tile can
+    reach.
+    """
+
+    def __init__(self, iou_threshold: float = 0.5, mask_threshold: float = 0.5, cell_size: int = 256):
+        self.iou_threshold = iou_threshold
+        self.mask_threshold = mask_threshold
+        self.cell_size = cell_size
+        # Grid row -> grid column -> ids of detections touching that cell
+        self.rows: Dict[int, Dict[int, List[int]]] = {}
+        # id -> (box, class, cropped mask, last grid row)
+        self.detections: Dict[int, Tuple[np.ndarray, int, np.ndarray, int]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.detections)
+
+    def _cells(self, box: np.ndarray) -> Iterator[Tuple[int, int]]:
+        cx0, cy0, cx1, cy1 = (np.asarray(box) // self.cell_size).astype(int)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                yield cy, cx
+
+    def _crop(self, mask: np.ndarray, box: np.ndarray, x0: int, y0: int) -> np.ndarray:
+        bx0, by0, bx1, by1 = np.round(box).astype(int)
+        return mask[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0] >= self.mask_threshold
+
+    def _mask_iou(self, box_a, mask_a, box_b, mask_b) -> float:
+        a = np.round(box_a).astype(int)
+        b = np.round(box_b).astype(int)
+        ix0, iy0 = max(a[0], b[0]), max(a[1], b[1])
+        ix1, iy1 = min(a[2], b[2]), min(a[3], b[3])
+        if ix1 <= ix0 or iy1 <= iy0:
+            return 0.0
+        inter = np.count_nonzero(
+            mask_a[iy0 - a[1]:iy1 - a[1], ix0 - a[0]:ix1 - a[0]] &
+            mask_b[iy0 - b[1]:iy1 - b[1], ix0 - b[0]:ix1 - b[0]]
+        )
+        union = np.count_nonzero(mask_a) + np.count_nonzero(mask_b) - inter
+        return inter / union if union else 0.0
+
+    def _neighbours(self, box: np.ndarray) -> set:
+        return {
+            detection_id
+            for cy, cx in self._cells(box)
+            for detection_id in self.rows.get(cy, {}).get(cx, ())
+        }
+
+    def add(self, predictions: Dict[str, Any], x0: int, y0: int) -> np.ndarray:
+        """Merge one tile's predictions, returning the indices that survive"""
+        boxes = np.asarray(predictions["pred_boxes"], dtype=np.float32) + [x0, y0, x0, y0]
+        order = np.argsort(-np.asarray(predictions["scores"]), kind='stable')
+        keep = []
+        for i in order:
+            box, cls = boxes[i], int(predictions["pred_classes"][i])
+            mask = self._crop(predictions["pred_masks"][i], box, x0, y0)
+
+            if any(
+                self.detections[j][1] == cls and
+                self._mask_iou(box, mask, self.detections[j][0], self.detections[j][2]) > self.iou_threshold
+                for j in self._neighbours(box)
+            ):
+                continue
+
+            keep.append(i)
+            detection_id = self._next_id
+            self._next_id += 1
+            cells = list(self._cells(box))
+            self.detections[detection_id] = (box, cls, mask, cells[-1][0])
+            for cy, cx in cells:
+                self.rows.setdefault(cy, {}).setdefault(cx, []).append(detection_id)
+        return np.array(sorted(keep), dtype=np.int64)
+
+    def forget_above(self, y: float):
+        """Drop detections that end in grid rows above y
+
+        Only valid once every tile still to come starts at or below y.
+        """
+        first_row = int(y // self.cell_size)
+        for row in [row for row in self.rows if row < first_row]:
+            del self.rows[row]
+        for detection_id in [i for i, d in self.detections.items() if d[3] < first_row]:
+            del self.detections[detection_id]
+
+
+def iter_region_features(predictor: BasePredictor,
+                         read_tile: Callable[[int, int, int, int], np.ndarray],
+                         shape: Tuple[int, int],
+                         transform: Affine,
+                         categories: List[CategoryType],
+                         confidence_threshold: Optional[float] = None,
+                         tile_size: int = 512,
+                         overlap: int = 64,
+                         batch_size: int = 4,
+                         iou_threshold: float = 0.5) -> Iterator[Tuple[int, int, List[Dict[str, Any]]]]:
+    """Sliding-window prediction over a large (height, width) image
+
+    The image is cut into overlapping chips laid out by tile_boxes, each
+    chip is read with read_tile(x, y, width, height) only when its batch
+    runs, chips are run through predictor.predict_batch in groups of
+    batch_size and the merged GeoJSON features of each group are yielded
+    as soon as it finishes, together with the number of tiles done and the
+    total tile count. transform maps image pixels to coordinates.
+    """
+    height, width = shape
+    boxes = tile_boxes(height, width, tile_size, overlap)
+    merger = SeamMerger(iou_threshold, cell_size=tile_size)
+
+    for start in range(0, len(boxes), batch_size):
+        batch = boxes[start:start + batch_size]
+        with stage('raster_read'):
+            chips = [read_tile(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in batch]
+        outputs = predictor.predict_batch(chips, [confidence_threshold] * len(chips))
+
+        features = []
+        for predictions, (x0, y0, _, _) in zip(outputs, batch):
+            keep = merger.add(predictions, x0, y0)
+            kept = {key: value[keep] for key, value in predictions.items()}
+            geojson = predictor.predictions_to_geojson(
+                kept,
+                transform * Affine.translation(x0, y0),
+                categories
+            )
+            features.extend(geojson["features"])
+
+        # Tiles come row by row, so no later tile reaches above the next one's top
+        if start + batch_size < len(boxes):
+            merger.forget_above(boxes[start + batch_size][1])
+        yield start + len(batch), len(boxes), features
+
+
+def merge_grid_features(predictor: BasePredictor,
+                        cells: List[Tuple[Dict[str, Any], int, int, Affine]],
+                        categories: List[CategoryType],
+                        area: Tuple[float, float, float, float],
+                        cell_size: int = 512,
+                        iou_threshold: float = 0.5) -> List[Dict[str, Any]]:
+    """GeoJSON features of predictions made per cell of an overlapping grid
+
+    cells are (predictions, x, y, transform) with x, y the cell origin in
+    grid pixels and transform mapping cell pixels to coordinates.
+    Detections repeated in cell overlaps are merged with SeamMerger, and
+    only those centred in area (x0, y0, x1, y1, grid pixels) are kept.
+    """
+    merger = SeamMerger(iou_threshold, cell_size=cell_size)
+    x0, y0, x1, y1 = area
+    features = []
+    for predictions, x, y, transform in cells:
+        keep = merger.add(predictions, x, y)
+        boxes = np.asarray(predictions["pred_boxes"], dtype=np.float32)[keep].reshape(-1, 4)
+        centre_x = (boxes[:, 0] + boxes[:, 2]) / 2 + x
+        centre_y = (boxes[:, 1] + boxes[:, 3]) / 2 + y
+        keep = keep[(centre_x >= x0) & (centre_x < x1) & (centre_y >= y0) & (centre_y < y1)]
+        kept = {key: value[keep] for key, value in predictions.items()}
+        features.extend(predictor.predictions_to_geojson(kept, transform, categories)["features"])
+    return features
@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple, Type
+
+from django.conf import settings
+
+from deepgis_xr.apps.core.models import CategoryType
+from deepgis_xr.apps.ml.services.batching import BatchingExecutor
+from deepgis_xr.apps.ml.services.predictor import (
+    BasePredictor, MaskRCNNPredictor, OnnxMaskRCNNPredictor, OptimizedMaskRCNNPredictor,
+    model_fingerprint, weights_digest
+)
+
+# (absolute model path, mtime in ns, file size, number of classes)
+RegistryKey = Tuple[Optional[str], Optional[int], Optional[int], int]
+
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3
+
+# Values accepted by settings.PREDICTOR_BACKEND
+BACKENDS: Dict[str, Type[BasePredictor]] = {
+    'eager': MaskRCNNPredictor,
+    'optimized': OptimizedMaskRCNNPredictor,
+    'onnx': OnnxMaskRCNNPredictor,
+}
+
+
+class PredictorRegistry:
+    """Process-wide LRU cache of loaded predictors
+
+    Predictors are keyed by weights path, weights fingerprint and category
+    count, so retrained or replaced weights are picked up on the next lookup.
+    Entries are evicted least recently used first once the summed model size
+    exceeds the memory budget. Loading is serialised per key, concurrent first
+    requests for the same model wait for a single load.
+    """
+
+    def __init__(self,
+                 predictor_class: Optional[Type[BasePredictor]] = None,
+                 memory_budget: Optional[int] = None):
+        self._predictor_class = predictor_class
+        self._memory_budget = memory_budget
+        self._entries: 'OrderedDict[RegistryKey, Tuple[BasePredictor, int]]' = OrderedDict()
+        self._executors: Dict[RegistryKey, BatchingExecutor] = {}
+        self._load_locks: Dict[RegistryKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def predictor_class(self) -> Type[BasePredictor]:
+        if self._predictor_class is not None:
+            return self._predictor_class
+        return BACKENDS[getattr(settings, 'PREDICTOR_BACKEND', 'eager')]
+
+    @property
+    def memory_budget(self) -> int:
+        if self._memory_budget is not None:
+            return self._memory_budget
+        return getattr(settings, 'PREDICTOR_CACHE_MEMORY_BUDGET', DEFAULT_MEMORY_BUDGET)
+
+    @property
+    def memory_used(self) -> int:
+        with self._lock:
+            return sum(nbytes for _, nbytes in self._entries.values())
+
+    def make_key(self, model_path: Optional[str] = None, num_classes: Optional[int] = None) -> RegistryKey:
+        if num_classes is None:
+            num_classes = CategoryType.objects.count() + 1  # +1 for background
+        return model_fingerprint(model_path) + (num_classes,)
+
+    def get(self, model_path: Optional[str] = None, num_classes: Optional[int] = None) -> BasePredictor:
+        """Return a loaded predictor, loading it on first use"""
+        return self._get(self.make_key(model_path, num_classes), model_path)
+
+    def get_executor(self, model_path: Optional[str] = None, num_classes: Optional[int] = None) -> BatchingExecutor:
+        """Return the micro-batching executor in front of a cached predictor"""
+        key = self.make_key(model_path, num_classes)
+        predictor = self._get(key, model_path)
+        with self._lock:
+            executor = self._executors.get(key)
+            if executor is None or executor.predictor is not predictor:
+                executor = BatchingExecutor(
+                    predictor,
+                    max_batch_size=getattr(settings, 'PREDICTION_BATCH_MAX_SIZE', 8),
+                    max_wait_ms=getattr(settings, 'PREDICTION_BATCH_MAX_WAIT_MS', 10)
+                )
+                self._executors[key] = executor
+            return executor
+
+    def _get(self, key: RegistryKey, model_path: Optional[str]) -> BasePredictor:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another request may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+
+            predictor = self.predictor_class(model_path=model_path, num_classes=key[3])
+            nbytes = predictor.memory_footprint()
+
+            with self._lock:
+                self._entries[key] = (predictor, nbytes)
+                self._load_locks.pop(key, None)
+                self._evict()
+
+        return predictor
+
+    def _evict(self):
+        """Drop least recently used entries until within budget, keeping the newest"""
+        used = sum(nbytes for _, nbytes in self._entries.values())
+        while used > self.memory_budget and len(self._entries) > 1:
+            key, (_, nbytes) = self._entries.popitem(last=False)
+            self._drop_executor(key)
+            used -= nbytes
+
+    def _drop_executor(self, key: RegistryKey):
+        executor = self._executors.pop(key, None)
+        if executor is not None:
+            executor.shutdown()
+
+    def invalidate(self, model_path: Optional[str] = None):
+        """Drop cached predictors for a weights path, or everything if no path is given"""
+        with self._lock:
+            if model_path is None:
+                keys = list(self._entries)
+            else:
+                path = os.path.abspath(model_path)
+                keys = [k for k in self._entries if k[0] == path]
+            for key in keys:
+                del self._entries[key]
+                self._drop_executor(key)
+
+    def warm_up(self, model_paths: Optional[Iterable[Optional[str]]] = None):
+        """Load predictors ahead of the first request
+
+        Defaults to settings.PREDICTOR_WARMUP_MODELS. Call from worker start
+        hooks (Celery worker_process_init, gunicorn post_worker_init).
+        """
+        if model_paths is None:
+            model_paths = getattr(settings, 'PREDICTOR_WARMUP_MODELS', [])
+        for model_path in model_paths:
+            self.get(model_path or None)
+
+
+registry = PredictorRegistry()
+
+
+def get_predictor(model_path: Optional[str] = None) -> BasePredictor:
+    """Shortcut for the process-wide registry"""
+    return registry.get(model_path)
+
+
+def get_executor(model_path: Optional[str] = None) -> BatchingExecutor:
+    """Shortcut for the process-wide registry's batching executor"""
+    return registry.get_executor(model_path)
@@ -70,7 +70,7 @@ class DeepGISTrainer:
                     ]
                 ], dtype=torch.float32),
                 'labels': torch.tensor([label.category.id], dtype=torch.int64),
-                'masks': torch.tensor(label.label_json["geometry"]["coordinates"], dtype=torch.uint8)
+                'masks': torch.tensor(label.geojson["coordinates"], dtype=torch.uint8)
             }
             
             dataset.append((image, target))
@@ -0,0 +1,53 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.ml.services.batching import BatchingExecutor
+
+
+class RecordingPredictor:
+    """Predictor stand-in that echoes its inputs and records batch sizes"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, image, confidence_threshold=None):
+        return self.predict_batch([image], [confidence_threshold])[0]
+
+    def predict_batch(self, images, confidence_thresholds=None):
+        self.batch_sizes.append(len(images))
+        return [{'image': image, 'threshold': t} for image, t in zip(images, confidence_thresholds)]
+
+
+class BatchingExecutorTests(SimpleTestCase):
+    """Test micro-batching of concurrent predictions"""
+
+    def test_concurrent_requests_are_batched(self):
+        """Test queued requests share a forward pass and get their own result"""
+        predictor = RecordingPredictor()
+        executor = BatchingExecutor(predictor, max_batch_size=4, max_wait_ms=200)
+        results = {}
+
+        def run(i):
+            results[i] = executor.predict(i, confidence_threshold=i / 10)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        executor.shutdown()
+
+        self.assertEqual(sum(predictor.batch_sizes), 4)
+        self.assertLess(len(predictor.batch_sizes), 4)
+        for i in range(4):
+            self.assertEqual(results[i], {'image': i, 'threshold': i / 10})
+
+    def test_batch_errors_reach_every_caller(self):
+        """Test an exception in the batch is raised for each request"""
+        predictor = RecordingPredictor()
+        predictor.predict_batch = lambda images, thresholds: 1 / 0
+        executor = BatchingExecutor(predictor, max_batch_size=2, max_wait_ms=1)
+        with self.assertRaises(ZeroDivisionError):
+            executor.predict(0)
+        executor.shutdown()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.ml.services.cache import PredictionCache, filter_predictions
+
+
+def make_predictions(n=3, size=16):
+    masks = np.zeros((n, size, size), dtype=np.float32)
+    for i in range(n):
+        masks[i, i:i + 4, i:i + 5] = 0.8
+    return {
+        "pred_boxes": np.arange(n * 4, dtype=np.float32).reshape(n, 4),
+        "scores": np.linspace(0.9, 0.1, n).astype(np.float32),
+        "pred_classes": np.arange(1, n + 1),
+        "pred_masks": masks,
+    }
+
+
+class PredictionCacheTests(SimpleTestCase):
+    """Test the disk-backed prediction cache"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = PredictionCache(directory=self.directory, max_bytes=10 ** 6)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Test cached outputs decode to the stored detections"""
+        predictions = make_predictions()
+        key = self.cache.make_key(1, [0, 0, 16, 16], 'pretrained')
+        self.cache.put(key, predictions)
+
+        cached = self.cache.get(key)
+        np.testing.assert_array_equal(cached["pred_boxes"], predictions["pred_boxes"])
+        np.testing.assert_array_equal(cached["pred_classes"], predictions["pred_classes"])
+        np.testing.assert_array_equal(cached["pred_masks"], predictions["pred_masks"] >= 0.5)
+
+    def test_threshold_refilters_cached_scores(self):
+        """Test a new confidence threshold only filters the cached entry"""
+        key = self.cache.make_key('tile')
+        self.cache.put(key, make_predictions())
+        filtered = filter_predictions(self.cache.get(key), 0.5)
+        self.assertEqual(len(filtered["scores"]), 2)
+        self.assertEqual(len(filtered["pred_masks"]), 2)
+
+    def test_missing_key(self):
+        """Test unknown keys miss"""
+        self.assertIsNone(self.cache.get(self.cache.make_key('unknown')))
+
+    def test_size_based_eviction(self):
+        """Test the least recently used entry is evicted past the size limit"""
+        self.cache.put('first', make_predictions())
+        entry_size = os.path.getsize(os.path.join(self.directory, 'first.npz'))
+        self.cache = PredictionCache(directory=self.directory, max_bytes=int(entry_size * 1.5))
+        os.utime(os.path.join(self.directory, 'first.npz'), (0, 0))
+        self.cache.put('second', make_predictions())
+        self.assertIsNone(self.cache.get('first'))
+        self.assertIsNotNone(self.cache.get('second'))
@@ -0,0 +1,38 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.ml.services.optimization import compare_models
+
+
+class FixedPredictor:
+    """Predictor stand-in returning the same detections for every image"""
+
+    def __init__(self, boxes, scores, classes):
+        self.output = {
+            "pred_boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+            "scores": np.array(scores, dtype=np.float32),
+            "pred_classes": np.array(classes, dtype=np.int64),
+            "pred_masks": np.zeros((len(scores), 8, 8), dtype=np.uint8),
+        }
+
+    def predict(self, image, confidence_threshold=None):
+        return self.output
+
+
+class CompareModelsTests(SimpleTestCase):
+    """Test the eager vs optimized comparison report"""
+
+    def test_agreement_metrics(self):
+        """Test matching requires the same class and enough box overlap"""
+        reference = FixedPredictor([(0, 0, 10, 10), (20, 20, 30, 30)], [0.9, 0.8], [1, 1])
+        candidate = FixedPredictor([(0, 0, 10, 11), (20, 20, 30, 30)], [0.85, 0.8], [1, 2])
+        report = compare_models(reference, candidate, [None] * 3, warmup=0)
+
+        accuracy = report["accuracy"]
+        self.assertEqual(report["samples"], 3)
+        self.assertEqual(accuracy["reference_detections"], 6)
+        self.assertEqual(accuracy["candidate_detections"], 6)
+        self.assertAlmostEqual(accuracy["recall"], 0.5)
+        self.assertAlmostEqual(accuracy["mean_box_iou"], 100 / 110, places=5)
+        self.assertAlmostEqual(accuracy["mean_score_delta"], 0.05, places=5)
+        self.assertGreater(report["latency"]["speedup"], 0)
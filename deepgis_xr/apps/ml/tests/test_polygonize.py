@@ -0,0 +1,46 @@
+import numpy as np
+from django.test import SimpleTestCase
+from rasterio.transform import Affine
+
+from deepgis_xr.apps.ml.services.polygonize import masks_to_features
+
+
+class MasksToFeaturesTests(SimpleTestCase):
+    """Test mask vectorization into GeoJSON"""
+
+    def setUp(self):
+        # 10 units per pixel, origin at (1000, 2000), north up
+        self.transform = Affine(10, 0, 1000, 0, -10, 2000)
+
+    def test_square_mask_maps_columns_to_x(self):
+        """Test a rectangular mask becomes one polygon in map coordinates"""
+        masks = np.zeros((1, 20, 30), dtype=np.float32)
+        masks[0, 2:6, 10:20] = 0.9
+        features = masks_to_features(
+            np.array([[10, 2, 20, 6]]), masks, np.array([0.8]), ['tree'], self.transform
+        )
+        self.assertEqual(len(features), 1)
+        feature = features[0]
+        self.assertEqual(feature['geometry']['type'], 'Polygon')
+        self.assertEqual(feature['bbox'], [1100.0, 1940.0, 1200.0, 1980.0])
+        self.assertEqual(feature['properties'], {'category': 'tree', 'confidence': 0.8})
+
+    def test_disjoint_parts_become_multipolygon(self):
+        """Test a detection with two blobs is kept as one feature"""
+        masks = np.zeros((1, 20, 30), dtype=np.float32)
+        masks[0, 2:4, 2:4] = 1
+        masks[0, 10:12, 10:12] = 1
+        features = masks_to_features(
+            np.array([[0, 0, 30, 20]]), masks, np.array([0.5]), ['rock'], self.transform
+        )
+        self.assertEqual(features[0]['geometry']['type'], 'MultiPolygon')
+        self.assertEqual(len(features[0]['geometry']['coordinates']), 2)
+
+    def test_mask_outside_box_is_ignored(self):
+        """Test only pixels inside the detection box are traced"""
+        masks = np.zeros((1, 20, 30), dtype=np.float32)
+        masks[0, 15:18, 25:28] = 1
+        features = masks_to_features(
+            np.array([[0, 0, 10, 10]]), masks, np.array([0.5]), ['rock'], self.transform
+        )
+        self.assertEqual(features, [])
@@ -0,0 +1,125 @@
+import os
+import tempfile
+
+import numpy as np
+import torch
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.ml.services.predictor import (
+    ONNX_OUTPUT_NAMES, MaskRCNNPredictor, OnnxMaskRCNNPredictor, OptimizedMaskRCNNPredictor,
+    onnx_artifact_path, optimized_artifact_path, stale_artifacts
+)
+
+
+class ArtifactPathTests(SimpleTestCase):
+    """Test optimized and ONNX artifacts follow the weights they were built from"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp.name, 'model.pth')
+        with open(self.model_path, 'wb') as f:
+            f.write(b'first weights')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_retrained_weights_do_not_reuse_artifacts(self):
+        """Test rewriting model.pth moves both artifact paths, leaving old artifacts stale"""
+        optimized = optimized_artifact_path(self.model_path)
+        onnx = onnx_artifact_path(self.model_path)
+        for path in (optimized, onnx):
+            open(path, 'wb').close()
+
+        with open(self.model_path, 'wb') as f:
+            f.write(b'retrained weights')
+
+        self.assertNotEqual(optimized_artifact_path(self.model_path), optimized)
+        self.assertNotEqual(onnx_artifact_path(self.model_path), onnx)
+        self.assertFalse(os.path.exists(optimized_artifact_path(self.model_path)))
+        self.assertEqual(stale_artifacts(self.model_path), sorted([optimized, onnx]))
+
+    def test_stale_artifacts_skip_other_weights(self):
+        """Test artifacts of weights sharing a name prefix are left alone"""
+        other = os.path.join(self.tmp.name, 'model.v2.pth')
+        with open(other, 'wb') as f:
+            f.write(b'other weights')
+        open(onnx_artifact_path(other), 'wb').close()
+        self.assertEqual(stale_artifacts(self.model_path), [])
+
+    def test_backend_follows_loaded_artifact(self):
+        """Test the optimized predictor only reports its backend when the artifact is loaded"""
+        self.assertEqual(MaskRCNNPredictor.backend, 'eager')
+        self.assertEqual(OnnxMaskRCNNPredictor.backend, 'onnx')
+
+        torch.jit.script(torch.nn.Identity()).save(optimized_artifact_path(self.model_path))
+        predictor = OptimizedMaskRCNNPredictor.__new__(OptimizedMaskRCNNPredictor)
+        predictor.model_path = self.model_path
+        predictor._load_model()
+        self.assertEqual(predictor.backend, 'optimized')
+
+
+class FakeInferenceSession:
+    """onnxruntime.InferenceSession stand-in recording its inputs"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.calls = []
+
+    def run(self, output_names, feeds):
+        self.calls.append((output_names, feeds))
+        return self.outputs[len(self.calls) - 1]
+
+
+class OnnxForwardTests(SimpleTestCase):
+    """Test graph outputs are mapped to the torchvision detection layout"""
+
+    def test_forward_maps_outputs_per_image(self):
+        """Test each image runs the graph once and outputs are keyed by name"""
+        first = [
+            np.array([[0, 0, 4, 4]], dtype=np.float32),
+            np.array([2], dtype=np.int64),
+            np.array([0.9], dtype=np.float32),
+            np.ones((1, 1, 8, 8), dtype=np.float32),
+        ]
+        second = [
+            np.zeros((0, 4), dtype=np.float32),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+            np.zeros((0, 1, 8, 8), dtype=np.float32),
+        ]
+        predictor = OnnxMaskRCNNPredictor.__new__(OnnxMaskRCNNPredictor)
+        predictor.model = FakeInferenceSession([first, second])
+        predictor.input_name = 'image'
+        predictor.device = torch.device('cpu')
+        predictor.confidence_threshold = 0.5
+
+        images = [torch.zeros(3, 8, 8), torch.ones(3, 8, 8)]
+        outputs = predictor._forward(images)
+
+        self.assertEqual(len(predictor.model.calls), 2)
+        for (names, feeds), image in zip(predictor.model.calls, images):
+            self.assertEqual(names, ONNX_OUTPUT_NAMES)
+            np.testing.assert_array_equal(feeds['image'], image.numpy())
+        self.assertEqual(outputs[0]['boxes'].tolist(), [[0, 0, 4, 4]])
+        self.assertEqual(outputs[0]['labels'].tolist(), [2])
+        self.assertEqual(tuple(outputs[0]['masks'].shape), (1, 1, 8, 8))
+        self.assertEqual(len(outputs[1]['scores']), 0)
+
+    def test_predict_batch_layout(self):
+        """Test ONNX results have MaskRCNNPredictor's keys with masks squeezed to (N, H, W)"""
+        outputs = [
+            np.array([[0, 0, 4, 4], [1, 1, 2, 2]], dtype=np.float32),
+            np.array([1, 2], dtype=np.int64),
+            np.array([0.9, 0.2], dtype=np.float32),
+            np.ones((2, 1, 8, 8), dtype=np.float32),
+        ]
+        predictor = OnnxMaskRCNNPredictor.__new__(OnnxMaskRCNNPredictor)
+        predictor.model = FakeInferenceSession([outputs])
+        predictor.input_name = 'image'
+        predictor.device = torch.device('cpu')
+        predictor.confidence_threshold = 0.5
+
+        result = predictor.predict(np.zeros((8, 8, 3), dtype=np.uint8))
+        self.assertEqual(result['pred_classes'].tolist(), [1])
+        self.assertEqual(result['pred_masks'].shape, (1, 8, 8))
+        self.assertEqual(result['pred_boxes'].shape, (1, 4))
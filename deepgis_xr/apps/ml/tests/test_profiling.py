@@ -0,0 +1,38 @@
+from django.test import SimpleTestCase
+
+from deepgis_xr.apps.ml.services.profiling import StageTimer
+
+
+class StageTimerTests(SimpleTestCase):
+    """Test per-stage timing of the prediction path"""
+
+    def test_records_only_while_enabled(self):
+        """Test stages are timed between start() and stop() only"""
+        timer = StageTimer()
+        with timer.stage('forward'):
+            pass
+        self.assertEqual(timer.summary(), {})
+
+        timer.start()
+        for _ in range(3):
+            with timer.stage('forward'):
+                pass
+        with timer.stage('geojson'):
+            pass
+        timer.stop()
+        with timer.stage('forward'):
+            pass
+
+        summary = timer.summary()
+        self.assertEqual(summary['forward']['calls'], 3)
+        self.assertEqual(summary['geojson']['calls'], 1)
+        self.assertEqual(set(timer.totals()), {'forward', 'geojson'})
+
+    def test_exceptions_are_still_timed(self):
+        """Test a failing stage is recorded and the exception propagates"""
+        timer = StageTimer()
+        timer.start()
+        with self.assertRaises(ValueError):
+            with timer.stage('raster_read'):
+                raise ValueError
+        self.assertEqual(timer.summary()['raster_read']['calls'], 1)
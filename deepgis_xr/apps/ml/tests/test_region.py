@@ -0,0 +1,97 @@
+import numpy as np
+from django.test import SimpleTestCase
+from rasterio.transform import Affine
+
+from deepgis_xr.apps.ml.services.region import SeamMerger, iter_region_features, merge_grid_features
+
+
+def make_predictions(boxes, size=256):
+    """Build predictor output with filled box masks on a size x size chip"""
+    masks = np.zeros((len(boxes), size, size), dtype=np.float32)
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        masks[i, y0:y1, x0:x1] = 1
+    return {
+        "pred_boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        "scores": np.linspace(0.9, 0.5, len(boxes)),
+        "pred_classes": np.ones(len(boxes), dtype=np.int64),
+        "pred_masks": masks,
+    }
+
+
+class SeamMergerTests(SimpleTestCase):
+    """Test NMS of detections across tile seams"""
+
+    def test_duplicate_across_seam_is_suppressed(self):
+        """Test the same object seen by two overlapping tiles is kept once"""
+        merger = SeamMerger(iou_threshold=0.5)
+        first = merger.add(make_predictions([(200, 10, 240, 50)]), 0, 0)
+        second = merger.add(make_predictions([(0, 10, 40, 50)]), 200, 0)
+        self.assertEqual(list(first), [0])
+        self.assertEqual(list(second), [])
+
+    def test_distinct_objects_are_kept(self):
+        """Test non-overlapping detections all survive"""
+        merger = SeamMerger(iou_threshold=0.5)
+        merger.add(make_predictions([(10, 10, 40, 40)]), 0, 0)
+        keep = merger.add(make_predictions([(100, 100, 140, 140), (10, 10, 40, 40)]), 200, 0)
+        self.assertEqual(list(keep), [0, 1])
+
+    def test_detections_above_finished_rows_are_dropped(self):
+        """Test forget_above releases detections no later tile can overlap"""
+        merger = SeamMerger(iou_threshold=0.5, cell_size=256)
+        merger.add(make_predictions([(10, 10, 40, 40), (10, 240, 40, 290)], size=512), 0, 0)
+        merger.forget_above(256)
+        self.assertEqual(len(merger), 1)
+
+        # The detection crossing into the next row still suppresses its duplicate there
+        keep = merger.add(make_predictions([(10, 0, 40, 34)]), 0, 256)
+        self.assertEqual(list(keep), [])
+
+
+class StubPredictor:
+    """Predictor returning one box per chip and recording batch sizes"""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, images, confidence_thresholds=None):
+        self.batches.append(len(images))
+        return [make_predictions([(10, 10, 20, 20)], size=image.shape[-1]) for image in images]
+
+    def predictions_to_geojson(self, predictions, transform, categories):
+        return {"features": [{"origin": transform * (0, 0)} for _ in predictions["scores"]]}
+
+
+class RegionFeaturesTests(SimpleTestCase):
+    """Test sliding-window prediction reads tiles lazily"""
+
+    def test_tiles_are_read_per_batch(self):
+        """Test each batch only reads its own tiles"""
+        reads = []
+        predictor = StubPredictor()
+
+        def read_tile(x, y, width, height):
+            reads.append((x, y))
+            return np.zeros((3, height, width), dtype=np.uint8)
+
+        progress = []
+        for done, total, features in iter_region_features(
+                predictor, read_tile, (512, 512), Affine.identity(), [],
+                tile_size=256, overlap=0, batch_size=2):
+            progress.append((done, total, len(reads), len(features)))
+
+        self.assertEqual(progress, [(2, 4, 2, 2), (4, 4, 4, 2)])
+        self.assertEqual(reads, [(0, 0), (256, 0), (0, 256), (256, 256)])
+
+
+class GridFeaturesTests(SimpleTestCase):
+    """Test merging predictions of overlapping grid cells"""
+
+    def test_overlap_duplicates_and_context_are_dropped(self):
+        """Test a detection seen by two cells is kept once and context outside the area is dropped"""
+        cells = [
+            (make_predictions([(200, 10, 240, 50), (10, 10, 40, 40)]), 0, 0, Affine.translation(0, 0)),
+            (make_predictions([(0, 10, 40, 50)]), 200, 0, Affine.translation(200, 0)),
+        ]
+        features = merge_grid_features(StubPredictor(), cells, [], (100, 0, 456, 256), cell_size=256)
+        self.assertEqual([feature["origin"] for feature in features], [(0.0, 0.0)])
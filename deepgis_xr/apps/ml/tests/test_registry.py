@@ -0,0 +1,61 @@
+import threading
+
+from django.test import TestCase
+
+from deepgis_xr.apps.ml.services.predictor import BasePredictor
+from deepgis_xr.apps.ml.services.registry import PredictorRegistry
+
+
+class StubPredictor(BasePredictor):
+    """Predictor that counts loads instead of building a network"""
+    loads = 0
+
+    def _load_model(self):
+        StubPredictor.loads += 1
+        return object()
+
+    def memory_footprint(self) -> int:
+        return 100
+
+
+class PredictorRegistryTests(TestCase):
+    """Test the process-wide predictor cache"""
+
+    def setUp(self):
+        StubPredictor.loads = 0
+        self.registry = PredictorRegistry(predictor_class=StubPredictor, memory_budget=250)
+
+    def test_predictor_is_reused(self):
+        """Test repeated lookups share one loaded model"""
+        first = self.registry.get(num_classes=3)
+        second = self.registry.get(num_classes=3)
+        self.assertIs(first, second)
+        self.assertEqual(StubPredictor.loads, 1)
+
+    def test_category_count_is_part_of_key(self):
+        """Test a different class count loads a separate model"""
+        self.registry.get(num_classes=3)
+        self.registry.get(num_classes=4)
+        self.assertEqual(StubPredictor.loads, 2)
+
+    def test_lru_eviction(self):
+        """Test least recently used models are evicted over budget"""
+        first = self.registry.get(num_classes=2)
+        self.registry.get(num_classes=3)
+        self.registry.get(num_classes=2)
+        self.registry.get(num_classes=4)
+        self.assertEqual(self.registry.memory_used, 200)
+        self.assertIs(self.registry.get(num_classes=2), first)
+        self.assertEqual(StubPredictor.loads, 3)
+
+    def test_concurrent_first_requests_load_once(self):
+        """Test concurrent lookups for a new key wait for a single load"""
+        threads = [
+            threading.Thread(target=self.registry.get, kwargs={'num_classes': 5})
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(StubPredictor.loads, 1)
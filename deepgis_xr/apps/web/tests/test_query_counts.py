@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from shapely.geometry import box
+
+from deepgis_xr.apps.core.models import (
+    CategoryType, Color, Image, ImageSourceType, ImageWindow, TiledGISLabel
+)
+from deepgis_xr.apps.core.utils.labels import label_payload_cache, save_image_label
+from deepgis_xr.apps.core.utils.spatial import tiled_label_index
+
+User = get_user_model()
+
+# Fixture scale: large enough that a per-row query would blow every budget
+IMAGES = 200
+LABELED_IMAGES = 50
+TILED_LABELS = 300
+
+# Wall-clock bound per request at fixture scale, only checked when LATENCY_TESTS=1
+# since shared CI machines make timings unreliable
+MAX_SECONDS = 0.5
+CHECK_LATENCY = os.environ.get('LATENCY_TESTS') == '1'
+
+
+def features(count, categories):
+    return [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [i, i]},
+            'properties': {'category': categories[i % len(categories)]}
+        }
+        for i in range(count)
+    ]
+
+
+class QueryBudgetTests(TestCase):
+    """Upper bounds on queries and latency per endpoint, to catch N+1 regressions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Load the URLconf and views outside the timed blocks
+        reverse('get_new_image')
+        cls.user = User.objects.create_user(username='testuser', password='testpass')
+        ImageWindow.objects.create(x=0, y=0, width=1920, height=1080)
+        source = ImageSourceType.objects.create(description='test')
+        cls.categories = [
+            CategoryType.objects.create(
+                category_name=name, label_type='P',
+                color=Color.objects.create(red=i * 50, green=0, blue=0)
+            )
+            for i, name in enumerate(['Buildings', 'Roads', 'Water Bodies'])
+        ]
+        Image.objects.bulk_create([
+            Image(name=f'{i}.jpg', path='example.com/images', description='', source=source)
+            for i in range(IMAGES)
+        ])
+        images = list(Image.objects.order_by('id'))
+        Image.categories.through.objects.bulk_create([
+            Image.categories.through(image_id=image.id, categorytype_id=category.id)
+            for image in images for category in cls.categories
+        ])
+        names = [category.category_name for category in cls.categories]
+        for image in images[:LABELED_IMAGES]:
+            save_image_label(image, None, {'features': features(20, names), 'metadata': {'image': image.name}})
+        cls.images = images
+
+        labels = []
+        for i in range(TILED_LABELS):
+            label = TiledGISLabel(label_json={'type': 'Feature', 'properties': {}}, category=cls.categories[0])
+            label.shape = box(i * 0.001, 0, i * 0.001 + 0.0005, 0.0005)
+            labels.append(label)
+        TiledGISLabel.objects.bulk_create(labels)
+
+    def setUp(self):
+        self.tile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tile_dir, ignore_errors=True)
+        label_payload_cache.clear()
+        tiled_label_index.reset()
+        self.addCleanup(tiled_label_index.reset)
+        self.client.login(username='testuser', password='testpass')
+
+    @contextmanager
+    def assertBudget(self, max_queries, max_seconds=MAX_SECONDS):
+        """Fail if the block runs more than max_queries queries, or with CHECK_LATENCY takes longer than max_seconds"""
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        self.assertLessEqual(
+            len(queries), max_queries,
+            '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        if CHECK_LATENCY:
+            self.assertLess(elapsed, max_seconds)
+
+    def test_get_new_image(self):
+        """Test each navigation click costs a fixed number of queries"""
+        for direction in ['next', 'next', 'prev', 'next']:
+            with self.assertBudget(10):
+                response = self.client.get(reverse('get_new_image'), {'direction': direction})
+            self.assertTrue(response.json()['success'])
+        self.assertEqual(response.json()['navigation']['total_images'], IMAGES)
+
+    def test_set_current_image(self):
+        """Test an image shown from the prefetch queue becomes the session position"""
+        # One existence check, the rest is loading and saving the session
+        with self.assertBudget(5):
+            response = self.client.post(reverse('set_current_image'), {'image_id': self.images[5].id})
+        self.assertTrue(response.json()['success'])
+        response = self.client.get(reverse('get_new_image'), {'direction': 'next'})
+        self.assertEqual(response.json()['image_id'], self.images[6].id)
+
+    def test_get_image_bundle(self):
+        """Test a bundle costs the same whatever its size"""
+        with self.assertBudget(10):
+            response = self.client.get(reverse('get_image_bundle'), {'after': self.images[0].id, 'count': 20})
+        images = response.json()['images']
+        self.assertEqual(len(images), 20)
+        self.assertIsNotNone(images[0]['existing_labels'])
+
+    def test_get_all_images(self):
+        """Test pages and streams are read in a few keyset queries"""
+        with self.assertBudget(3):
+            response = self.client.get(reverse('get_all_images'), {'limit': 50})
+        self.assertEqual(len(response.json()['images']), 50)
+
+        with self.assertBudget(5):
+            response = self.client.get(reverse('get_all_images'), {'format': 'ndjson', 'limit': 100})
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), IMAGES)
+
+    def test_save_labels(self):
+        """Test saving a large session does not query per feature"""
+        names = [category.category_name for category in self.categories] + ['New']
+        data = {
+            'features': features(2000, names),
+            'metadata': {'image': self.images[-1].name, 'timeTaken': 5}
+        }
+        with self.assertBudget(21, max_seconds=1.0):
+            response = self.client.post(reverse('save_labels'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'success')
+
+    def test_label_tile(self):
+        """Test rendering a tile fetches its labels in one query per id chunk"""
+        with override_settings(LABEL_TILE_CACHE_DIR=self.tile_dir):
+            with self.assertBudget(5):
+                response = self.client.get(reverse('label_tile', args=[10, 512, 511]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_labels_in_bbox(self):
+        """Test viewport queries do not query per label"""
+        with self.assertBudget(8):
+            response = self.client.get(reverse('labels_in_bbox'), {'bbox': '0,0,1,1'})
+        self.assertEqual(len(response.json()['labels']['features']), TILED_LABELS)
@@ -16,6 +16,8 @@ urlpatterns = [
     # Webclient API endpoints
     path('webclient/getCategoryInfo', views.get_category_info, name='get_category_info'),
     path('webclient/getNewImage', views.get_new_image, name='get_new_image'),
+    path('webclient/getImageBundle', views.get_image_bundle, name='get_image_bundle'),
+    path('webclient/setCurrentImage', views.set_current_image, name='set_current_image'),
     path('webclient/getAllImages', views.get_all_images, name='get_all_images'),
     path('webclient/saveLabel', views.save_label, name='save_label'),
     path('webclient/createCategory', views.create_category, name='create_category'),
@@ -25,6 +27,10 @@ urlpatterns = [
     # Map label endpoints
     path('webclient/save-labels', views.save_labels, name='save_labels'),
     path('webclient/export-shapefile', views.export_shapefile, name='export_shapefile'),
+    path('webclient/export-dataset', views.export_dataset, name='export_dataset'),
+    
+    # Stored labels as vector tiles
+    path('tiles/labels/<int:z>/<int:x>/<int:y>.pbf', views.label_tile, name='label_tile'),
     
     # Grid detection endpoint
     path('webclient/detect-grid', views.detect_grid, name='detect_grid'),
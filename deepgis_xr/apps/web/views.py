@@ -1,4 +1,4 @@
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.template import loader
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -20,9 +20,17 @@ import base64
 import math
 import time
 import hashlib
+import itertools
+import uuid
+from typing import Optional
+from celery import shared_task
 from django.conf import settings
+from django.db.models import Count, F, Max, Prefetch, Q
 
 from deepgis_xr.apps.core.models import Image, CategoryType, ImageLabel, RasterImage, Labeler, CategoryLabel
+from deepgis_xr.apps.core.utils.export import dataset_export_store, export_key, stream_dataset_zip
+from deepgis_xr.apps.core.utils.labels import latest_label_payloads, save_image_label
+from deepgis_xr.apps.core.utils.tiles import label_tile_cache, render_label_tile
 
 
 class BaseView(LoginRequiredMixin, TemplateView):
@@ -139,126 +147,139 @@ def get_category_info(request):
     }
     return JsonResponse(categories)
 
+def _category_style(cat):
+    """(hex color, drawing shape) of a CategoryType"""
+    if cat.color:
+        r, g, b = cat.color.red, cat.color.green, cat.color.blue
+        color = f'#{r:02x}{g:02x}{b:02x}'
+    else:
+        color = '#FF0000'  # Default red
+    
+    # Map label_type to shape
+    shape = {'C': 'circle', 'R': 'rectangle', 'P': 'bezier'}.get(cat.label_type, 'circle')
+    return color, shape
+
+
+def _image_data(image, existing_labels):
+    """Frontend description of an Image whose categories are prefetched"""
+    image_name = image.name
+    path = image.path
+    
+    # Ensure the path is a valid image URL, not just a directory
+    # If the path doesn't contain a file extension, it might be a directory
+    if not path.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')):
+        # Check if the path ends with a slash, remove it if it does
+        if path.endswith('/'):
+            path = path[:-1]
+        
+        # Append the image name as the filename if it has an extension
+        if image_name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')):
+            path = f"{path}/{image_name}"
+        else:
+            # Default to a .jpg extension if no extension in the name
+            path = f"{path}/{image_name}.jpg"
+    
+    # Ensure the URL has http/https prefix
+    if not path.startswith(('http://', 'https://')):
+        path = f"https://{path}" if not path.startswith('//') else f"https:{path}"
+    
+    image_categories = list(image.categories.all())
+    if image_categories:
+        categories = [cat.category_name for cat in image_categories]
+        colors, shapes = (list(values) for values in zip(*map(_category_style, image_categories)))
+    else:
+        # Default categories if none are associated with the image
+        categories = ['Buildings', 'Roads', 'Vegetation', 'Water Bodies']
+        shapes = ['circle', 'circle', 'circle', 'circle']
+        colors = ['#FF0000', '#00FF00', '#00AA00', '#0000FF']
+    
+    return {
+        'image_id': image.id,
+        'image_name': image_name,
+        'image_path': path,
+        'categories': categories,
+        'shapes': shapes,
+        'colors': colors,
+        'width': getattr(image, 'width', 996),
+        'height': getattr(image, 'height', 996),
+        'existing_labels': existing_labels
+    }
+
+
+def _navigation(current_index, total_images):
+    return {
+        'has_prev': current_index > 0,
+        'has_next': current_index < total_images - 1,
+        'current_index': current_index + 1,
+        'total_images': total_images
+    }
+
+
+def _navigate_image(current_image_id, direction):
+    """Image after or before current_image_id in id order
+
+    next wraps from the last image to the first, prev stays on the first
+    image. Each step is a single indexed keyset query rather than a table scan.
+    """
+    images = Image.objects.prefetch_related(
+        Prefetch('categories', queryset=CategoryType.objects.select_related('color'))
+    )
+    
+    if current_image_id is None:
+        # Start from the beginning, or from the last image going backwards
+        return images.order_by('-id' if direction == 'prev' else 'id').first()
+    
+    if direction == 'next':
+        image = images.filter(id__gt=current_image_id).order_by('id').first()
+        # Start from beginning if at end
+        return image or images.order_by('id').first()
+    if direction == 'prev':
+        image = images.filter(id__lt=current_image_id).order_by('-id').first()
+        if image:
+            return image
+    # Stay on the current image, which may have been deleted meanwhile
+    return images.filter(id=current_image_id).first() or images.order_by('id').first()
+
+
 @csrf_exempt
 def get_new_image(request):
     """Get an image from the database for labeling, with support for navigation"""
-    import random
-    from deepgis_xr.apps.core.models import Image, CategoryType
+    from deepgis_xr.apps.core.models import Image
     
     # Check if requesting a specific navigation direction
     direction = request.GET.get('direction', 'next')
     
-    # Get all images from the database
-    all_images = list(Image.objects.all())
-    
-    # If no images in database, return error response
-    if not all_images:
-        return JsonResponse({
-            'success': False,
-            'message': 'No images available in the database'
-        })
-    
-    # Get the current image ID from session if it exists
-    current_image_id = request.session.get('current_image_id', None)
+    # Get the current image ID from the client, or from session if it exists
+    current_image_id = request.GET.get('current_image_id') or request.session.get('current_image_id', None)
     
     try:
-        # Find the current image in the list
-        current_index = -1
         if current_image_id is not None:
-            for i, img in enumerate(all_images):
-                if img.id == current_image_id:
-                    current_index = i
-                    break
+            current_image_id = int(current_image_id)
+        image = _navigate_image(current_image_id, direction)
         
-        # Handle navigation based on direction
-        if direction == 'prev' and current_index > 0:
-            # Go to previous image
-            current_index -= 1
-        elif direction == 'next' and current_index < len(all_images) - 1:
-            # Go to next image
-            current_index += 1
-        elif direction == 'next' and (current_index == -1 or current_index == len(all_images) - 1):
-            # Start from beginning if at end or no current image
-            current_index = 0
-        elif direction == 'prev' and (current_index == -1):
-            # Start from last image if no current image and going backwards
-            current_index = len(all_images) - 1
+        # If no images in database, return error response
+        if image is None:
+            return JsonResponse({
+                'success': False,
+                'message': 'No images available in the database'
+            })
         
-        # Get the image at the current index
-        image = all_images[current_index]
+        # Position of the image and total count in one query
+        counts = Image.objects.aggregate(
+            total=Count('id'),
+            before=Count('id', filter=Q(id__lt=image.id))
+        )
+        current_index = counts['before']
+        total_images = counts['total']
         
         # Save the current image ID in session
         request.session['current_image_id'] = image.id
         
-        # Prepare image data for frontend
-        image_name = image.name
-        path = image.path
-        
-        # Ensure the path is a valid image URL, not just a directory
-        # If the path doesn't contain a file extension, it might be a directory
-        if not path.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')):
-            # Check if the path ends with a slash, remove it if it does
-            if path.endswith('/'):
-                path = path[:-1]
-            
-            # Append the image name as the filename if it has an extension
-            if image_name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')):
-                path = f"{path}/{image_name}"
-            else:
-                # Default to a .jpg extension if no extension in the name
-                path = f"{path}/{image_name}.jpg"
-        
-        # Ensure the URL has http/https prefix
-        if not path.startswith(('http://', 'https://')):
-            path = f"https://{path}" if not path.startswith('//') else f"https:{path}"
-        
-        # Process categories
-        if image.categories.exists():
-            categories = [cat.category_name for cat in image.categories.all()]
-            colors = []
-            shapes = []
-            for cat in image.categories.all():
-                if cat.color:
-                    r, g, b = cat.color.red, cat.color.green, cat.color.blue
-                    colors.append(f'#{r:02x}{g:02x}{b:02x}')
-                else:
-                    colors.append('#FF0000')  # Default red
-                
-                # Map label_type to shape
-                if cat.label_type == 'C':
-                    shapes.append('circle')
-                elif cat.label_type == 'R':
-                    shapes.append('rectangle')
-                elif cat.label_type == 'P':
-                    shapes.append('bezier')
-                else:
-                    shapes.append('circle')  # Default to circle
-        else:
-            # Default categories if none are associated with the image
-            categories = ['Buildings', 'Roads', 'Vegetation', 'Water Bodies']
-            shapes = ['circle', 'circle', 'circle', 'circle']
-            colors = ['#FF0000', '#00FF00', '#00AA00', '#0000FF']
-        
-        # Get existing labels for this image
-        existing_labels = get_image_labels(image.id)
-        
         # Return the image data
         return JsonResponse({
             'success': True,
-            'image_name': image_name,
-            'image_path': path,
-            'categories': categories,
-            'shapes': shapes,
-            'colors': colors,
-            'width': getattr(image, 'width', 996),
-            'height': getattr(image, 'height', 996),
-            'navigation': {
-                'has_prev': current_index > 0,
-                'has_next': current_index < len(all_images) - 1,
-                'current_index': current_index + 1,
-                'total_images': len(all_images)
-            },
-            'existing_labels': existing_labels
+            **_image_data(image, get_image_labels(image)),
+            'navigation': _navigation(current_index, total_images)
         })
         
     except Exception as e:
@@ -270,32 +291,112 @@ def get_new_image(request):
             'message': f'Error loading image: {str(e)}'
         }, status=500)
 
-def get_image_labels(image_id):
-    """Get existing labels for an image"""
-    from deepgis_xr.apps.core.models import ImageLabel
+def _image_sequence(current_image_id, direction, count):
+    """Up to count images in the order repeated get_new_image calls visit them
+
+    next wraps around to the beginning. prev stops at the first image, so
+    the sequence is shorter than count there.
+    """
+    images = Image.objects.prefetch_related(
+        Prefetch('categories', queryset=CategoryType.objects.select_related('color'))
+    )
+    
+    if current_image_id is None:
+        return list(images.order_by('-id' if direction == 'prev' else 'id')[:count])
+    if direction == 'prev':
+        # Going backwards stops at the first image
+        return list(images.filter(id__lt=current_image_id).order_by('-id')[:count])
+    
+    sequence = list(images.filter(id__gt=current_image_id).order_by('id')[:count])
+    if len(sequence) < count:
+        # Wrap around to the beginning, as far as the current image
+        sequence += list(images.filter(id__lte=current_image_id).order_by('id')[:count - len(sequence)])
+    return sequence
+
+
+@csrf_exempt
+def set_current_image(request):
+    """Store the image the labeling page shows as the session position
+
+    The page shows prefetched images without calling get_new_image, this
+    keeps the session in step so a reload resumes at the right image.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    try:
+        image_id = int(request.POST.get('image_id', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'image_id must be an integer'}, status=400)
+    if not Image.objects.filter(id=image_id).exists():
+        return JsonResponse({'success': False, 'message': 'Image not found'}, status=404)
+    request.session['current_image_id'] = image_id
+    return JsonResponse({'success': True})
+
+
+@csrf_exempt
+def get_image_bundle(request):
+    """The next images to label, with their categories and latest labels
+
+    Lets the labeling page prefetch in the background. Query parameters:
+    after (image id, defaults to the session's current image), direction
+    (next or prev) and count. The session position is not changed. The
+    response carries an ETag and honors If-None-Match.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    
+    try:
+        direction = request.GET.get('direction', 'next')
+        max_count = getattr(settings, 'IMAGE_BUNDLE_MAX_SIZE', 20)
+        count = min(int(request.GET.get('count', 5)), max_count)
+        if count < 1:
+            raise ValueError('count must be positive')
+        after = request.GET.get('after') or request.session.get('current_image_id')
+        after = int(after) if after is not None else None
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
     try:
-        # Find the most recent label for this image
-        labels = ImageLabel.objects.filter(image_id=image_id).order_by('-pub_date')
+        sequence = _image_sequence(after, direction, count)
         
-        if not labels.exists():
-            return None
+        # Latest labels, parsed payloads are cached
+        existing_labels = latest_label_payloads(sequence)
+        # Positions and total in one query
+        counts = Image.objects.aggregate(
+            total=Count('id'),
+            **{f'before_{i}': Count('id', filter=Q(id__lt=image.id)) for i, image in enumerate(sequence)}
+        )
         
-        # Get the most recent label
-        latest_label = labels.first()
+        images = []
+        for i, image in enumerate(sequence):
+            images.append({
+                **_image_data(image, existing_labels[image.id]),
+                'navigation': _navigation(counts[f'before_{i}'], counts['total'])
+            })
         
-        # The combined_label_shapes field contains the GeoJSON data
-        if latest_label.combined_label_shapes:
-            try:
-                import json
-                # Parse the JSON data
-                label_data = json.loads(latest_label.combined_label_shapes)
-                return label_data
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON for label {latest_label.id}")
-                return None
+        palette = []
+        for cat in CategoryType.objects.select_related('color').order_by('category_name'):
+            color, shape = _category_style(cat)
+            palette.append({'name': cat.category_name, 'color': color, 'shape': shape})
         
-        return None
+        body = json.dumps({'success': True, 'images': images, 'palette': palette}).encode('utf-8')
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    # Labels change as the session goes on, always revalidate
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def get_image_labels(image):
+    """Get existing labels for an image, parsed once and cached"""
+    try:
+        return latest_label_payloads([image])[image.id]
     except Exception as e:
         print(f"Error retrieving image labels: {str(e)}")
         return None
@@ -377,86 +478,14 @@ def save_labels(request):
                 from deepgis_xr.apps.core.models import Labeler
                 labeler, _ = Labeler.objects.get_or_create(user=request.user)
             
-            # Create the parent ImageLabel record
-            image_label = ImageLabel(
-                image=image,
-                combined_label_shapes=json.dumps(data),
-                labeler=labeler
-            )
-            
-            # Add time taken if available
-            if data['metadata'].get('timeTaken'):
-                image_label.time_taken = data['metadata']['timeTaken']
-            
-            # Save the parent label
-            image_label.save()
-            
-            # Process grid metrics if available
-            if data['metadata'].get('gridMetrics'):
-                # Store grid metrics in the database if needed
-                # This could be in a separate model or as part of the ImageLabel
-                pass
-            
-            # Create CategoryLabel records for each category
-            categories_by_name = {}
-            for feature in data['features']:
-                category_name = feature['properties'].get('category')
-                if not category_name:
-                    continue
-                
-                # Get or create the category
-                if category_name not in categories_by_name:
-                    try:
-                        category = CategoryType.objects.get(category_name=category_name)
-                    except CategoryType.DoesNotExist:
-                        # Create a new category if it doesn't exist
-                        color_hex = feature['properties'].get('color', '#FF0000')
-                        # Convert hex to RGB
-                        color_hex = color_hex.lstrip('#')
-                        rgb = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-                        
-                        # Get or create the Color object
-                        from deepgis_xr.apps.core.models import Color
-                        color, _ = Color.objects.get_or_create(
-                            red=rgb[0], 
-                            green=rgb[1], 
-                            blue=rgb[2]
-                        )
-                        
-                        # Create the category
-                        category = CategoryType.objects.create(
-                            category_name=category_name,
-                            color=color,
-                            label_type='P'  # Polygon by default
-                        )
-                    
-                    categories_by_name[category_name] = {
-                        'category': category,
-                        'features': []
-                    }
-                
-                # Add the feature to the category's feature list
-                categories_by_name[category_name]['features'].append(feature)
-            
-            # Create a CategoryLabel for each category
-            for category_name, data in categories_by_name.items():
-                # Create feature collection for this category
-                feature_collection = {
-                    'type': 'FeatureCollection',
-                    'features': data['features']
-                }
-                
-                # Create the CategoryLabel
-                CategoryLabel.objects.create(
-                    category=data['category'],
-                    label_shapes=json.dumps(feature_collection),
-                    parent_label=image_label
-                )
+            # One transaction for the whole session; retried payloads return the first save
+            image_label, created = save_image_label(image, labeler, data)
             
             return JsonResponse({
                 'status': 'success', 
-                'message': 'Labels saved successfully',
-                'label_id': image_label.id
+                'message': 'Labels saved successfully' if created else 'Labels already saved',
+                'label_id': image_label.id,
+                'duplicate': not created
             })
             
         except Exception as e:
@@ -515,6 +544,104 @@ def export_shapefile(request):
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
 
+def _export_labels(labeler: Optional[str] = None, latest: bool = False):
+    labels = ImageLabel.objects.all()
+    if labeler:
+        labels = labels.filter(labeler__user__username=labeler)
+    if latest:
+        labels = labels.filter(image__latest_label=F('id'))
+    return labels
+
+
+@shared_task(bind=True)
+def export_dataset_task(self, key: str, labeler: Optional[str] = None, latest: bool = False) -> str:
+    """Celery task rendering a dataset archive into dataset_export_store
+
+    Stored under the key of the labels as they are now, which differs from
+    key if labels changed since the export was requested. A failed export
+    keeps its claim on key until export_dataset has reported the failure.
+    """
+    labels = _export_labels(labeler, latest)
+    path = dataset_export_store.write(export_key(labels), stream_dataset_zip(labels))
+    dataset_export_store.release(key)
+    return path
+
+
+@login_required
+def export_dataset(request):
+    """Crops and instance masks of saved labels as a zip archive
+
+    Optional filters: labeler (username) and latest=1 for only the latest
+    label of each image. Archives are stored by content, so repeating an
+    export whose labels did not change serves the stored file. Archives
+    not stored yet are rendered by a Celery task, one per archive however
+    many requests ask for it; until it finishes the response is 202 with
+    the task id, and the client repeats the request.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    
+    labeler = request.GET.get('labeler') or None
+    latest = request.GET.get('latest') == '1'
+    try:
+        key = export_key(_export_labels(labeler, latest))
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    
+    etag = '"%s"' % key
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+    
+    path = dataset_export_store.get(key)
+    if path:
+        response = FileResponse(open(path, 'rb'), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="dataset-{key[:12]}.zip"'
+        response['ETag'] = etag
+        return response
+    
+    task_id = dataset_export_store.pending(key)
+    if task_id is not None:
+        task = export_dataset_task.AsyncResult(task_id)
+        if task.state == 'FAILURE':
+            dataset_export_store.release(key)
+            return JsonResponse({'status': 'error', 'message': str(task.info)}, status=500)
+    else:
+        task_id = str(uuid.uuid4())
+        if dataset_export_store.claim(key, task_id):
+            export_dataset_task.apply_async(args=[key, labeler, latest], task_id=task_id)
+        else:
+            # Another request claimed it first
+            task_id = dataset_export_store.pending(key)
+    
+    return JsonResponse({'status': 'pending', 'task_id': task_id}, status=202)
+
+def label_tile(request, z, x, y):
+    """Stored labels as a Mapbox Vector Tile, rendered once and cached on disk"""
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    if not 0 <= z <= label_tile_cache.max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return JsonResponse({'status': 'error', 'message': 'Tile out of range'}, status=404)
+    
+    try:
+        data = label_tile_cache.get(z, x, y)
+        if data is None:
+            data = render_label_tile(z, x, y)
+            label_tile_cache.put(z, x, y, data)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(data, content_type='application/vnd.mapbox-vector-tile')
+    # Tiles change whenever labels are saved, always revalidate
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 @csrf_exempt
 def get_raster_info(request):
     """Get information about available raster layers."""
@@ -608,28 +735,72 @@ def get_tileserver_layers(request):
             'message': str(e)
         }, status=500)
 
+IMAGE_LIST_FIELDS = ('id', 'name', 'path', 'width', 'height', 'description')
+
+
+def _image_list_entry(row):
+    row['path'] = row['path'] if row['path'].startswith(('http://', 'https://')) else row['path'] + '/'
+    return row
+
+
+def _iter_image_rows(after, chunk_size):
+    """Image rows as dicts in id order, fetched chunk_size at a time by keyset"""
+    while True:
+        rows = list(
+            Image.objects.filter(id__gt=after).order_by('id').values(*IMAGE_LIST_FIELDS)[:chunk_size]
+        )
+        for row in rows:
+            yield _image_list_entry(row)
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1]['id']
+
+
 @csrf_exempt
 def get_all_images(request):
-    """Get all images from the database."""
+    """List images, a page at a time or streamed as NDJSON
+
+    Query parameters: cursor (id of the last image already received), limit
+    (page size) and format=ndjson to stream every image after the cursor,
+    one JSON object per line. Responses carry an ETag derived from the
+    image count, max id and max pub_date and honor If-None-Match.
+    """
     try:
-        images = Image.objects.all()
-        image_list = []
-        
-        for image in images:
-            image_data = {
-                'id': image.id,
-                'name': image.name,
-                'path': image.path if image.path.startswith(('http://', 'https://')) else image.path + '/',
-                'width': image.width,
-                'height': image.height,
-                'description': image.description
-            }
-            image_list.append(image_data)
-        
-        return JsonResponse({
-            'success': True,
-            'images': image_list
-        })
+        cursor = int(request.GET.get('cursor') or 0)
+        page_size = getattr(settings, 'IMAGE_LIST_PAGE_SIZE', 1000)
+        limit = min(int(request.GET.get('limit', page_size)), getattr(settings, 'IMAGE_LIST_MAX_PAGE_SIZE', 10000))
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        stream = request.GET.get('format') == 'ndjson'
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    
+    try:
+        # Cheap table version, one aggregate query
+        version = Image.objects.aggregate(count=Count('id'), max_id=Max('id'), max_pub_date=Max('pub_date'))
+        etag = '"%s"' % hashlib.md5(
+            f"{version['count']}:{version['max_id']}:{version['max_pub_date']}:{cursor}:{limit}:{stream}".encode()
+        ).hexdigest()
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=304)
+        elif stream:
+            response = StreamingHttpResponse(
+                (json.dumps(row) + '\n' for row in _iter_image_rows(cursor, limit)),
+                content_type='application/x-ndjson'
+            )
+        else:
+            image_list = list(itertools.islice(_iter_image_rows(cursor, limit + 1), limit + 1))
+            has_more = len(image_list) > limit
+            image_list = image_list[:limit]
+            response = JsonResponse({
+                'success': True,
+                'images': image_list,
+                # Pass back as cursor to get the next page
+                'next_cursor': image_list[-1]['id'] if has_more else None
+            })
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         print(f'Error in get_all_images: {str(e)}')
         return JsonResponse({
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deepgis_xr.settings')
@@ -11,4 +12,11 @@ app = Celery('deepgis_xr')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
-app.autodiscover_tasks() 
\ No newline at end of file
+app.autodiscover_tasks() 
+
+
+@worker_process_init.connect
+def warm_up_predictors(**kwargs):
+    """Load configured models in each worker process before it takes tasks"""
+    from deepgis_xr.apps.ml.services.registry import registry
+    registry.warm_up()
@@ -109,6 +109,70 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Inference backend: 'eager', 'optimized' (TorchScript + int8 dynamic quantization, CPU)
+# or 'onnx' (onnxruntime CPU execution provider)
+PREDICTOR_BACKEND = os.environ.get('PREDICTOR_BACKEND', 'eager')
+# onnxruntime graph optimization level: disable, basic, extended or all
+ONNX_GRAPH_OPTIMIZATION_LEVEL = os.environ.get('ONNX_GRAPH_OPTIMIZATION_LEVEL', 'all')
+# Per-worker torch thread pools, 0 keeps the torch defaults
+INFERENCE_INTRA_OP_THREADS = int(os.environ.get('INFERENCE_INTRA_OP_THREADS', 0))
+INFERENCE_INTER_OP_THREADS = int(os.environ.get('INFERENCE_INTER_OP_THREADS', 0))
+
+# Rows per INSERT when bulk saving labels
+LABEL_BULK_BATCH_SIZE = int(os.environ.get('LABEL_BULK_BATCH_SIZE', 500))
+# Most labels returned by one viewport query
+LABEL_QUERY_MAX_LIMIT = int(os.environ.get('LABEL_QUERY_MAX_LIMIT', 10000))
+
+# Parsed label payloads kept in memory per process
+LABEL_PAYLOAD_CACHE_SIZE = int(os.environ.get('LABEL_PAYLOAD_CACHE_SIZE', 1024))
+# Parsed label shape tables kept in memory per process
+SHAPE_TABLE_CACHE_SIZE = int(os.environ.get('SHAPE_TABLE_CACHE_SIZE', 1024))
+# Most images returned by one labeling prefetch bundle
+IMAGE_BUNDLE_MAX_SIZE = int(os.environ.get('IMAGE_BUNDLE_MAX_SIZE', 20))
+
+# get_all_images page size and the largest page a client may ask for
+IMAGE_LIST_PAGE_SIZE = int(os.environ.get('IMAGE_LIST_PAGE_SIZE', 1000))
+IMAGE_LIST_MAX_PAGE_SIZE = int(os.environ.get('IMAGE_LIST_MAX_PAGE_SIZE', 10000))
+
+# Dataset exports: archives stored by content hash, rendered by this many processes
+DATASET_EXPORT_DIR = os.environ.get('DATASET_EXPORT_DIR', os.path.join(MEDIA_ROOT, 'exports', 'datasets'))
+DATASET_EXPORT_PROCESSES = int(os.environ.get('DATASET_EXPORT_PROCESSES', os.cpu_count() or 1))
+# An export task that has not finished after this many seconds is assumed dead and restarted
+DATASET_EXPORT_TIMEOUT_SECONDS = int(os.environ.get('DATASET_EXPORT_TIMEOUT_SECONDS', 6 * 3600))
+# Incremental COCO exports: datasets by name, and the crops and annotations they reuse
+DATASET_COCO_DIR = os.environ.get('DATASET_COCO_DIR', os.path.join(MEDIA_ROOT, 'exports', 'coco'))
+DATASET_ARTIFACT_DIR = os.environ.get('DATASET_ARTIFACT_DIR', os.path.join(MEDIA_ROOT, 'exports', 'artifacts'))
+
+# Label vector tiles (/tiles/labels/{z}/{x}/{y}.pbf)
+LABEL_TILE_CACHE_DIR = os.environ.get('LABEL_TILE_CACHE_DIR', os.path.join(MEDIA_ROOT, 'cache', 'tiles', 'labels'))
+LABEL_TILE_MAX_ZOOM = int(os.environ.get('LABEL_TILE_MAX_ZOOM', 22))
+# Simplification tolerance in tile grid cells (4096 per tile side)
+LABEL_TILE_SIMPLIFY_PIXELS = float(os.environ.get('LABEL_TILE_SIMPLIFY_PIXELS', 1.0))
+# Above this many tiles per zoom level a saved label clears the whole level
+LABEL_TILE_INVALIDATE_MAX_TILES = int(os.environ.get('LABEL_TILE_INVALIDATE_MAX_TILES', 256))
+
+# Label R-tree: a version file shared by every process, so moves and deletes trigger rebuilds elsewhere
+SPATIAL_INDEX_VERSION_DIR = os.environ.get('SPATIAL_INDEX_VERSION_DIR', os.path.join(MEDIA_ROOT, 'cache', 'spatial'))
+
+# Predictor cache: loaded models are kept in memory up to this many bytes
+PREDICTOR_CACHE_MEMORY_BUDGET = int(os.environ.get('PREDICTOR_CACHE_MEMORY_BUDGET', 2 * 1024 ** 3))
+# Comma separated weights paths loaded when a worker process starts
+PREDICTOR_WARMUP_MODELS = [p for p in os.environ.get('PREDICTOR_WARMUP_MODELS', '').split(',') if p]
+# Micro-batching of concurrent predictions: flush after this many images or milliseconds
+PREDICTION_BATCH_MAX_SIZE = int(os.environ.get('PREDICTION_BATCH_MAX_SIZE', 8))
+PREDICTION_BATCH_MAX_WAIT_MS = float(os.environ.get('PREDICTION_BATCH_MAX_WAIT_MS', 10))
+# Raster reads: long side matched to the model input, total pixels capped per read
+PREDICTION_MAX_INPUT_SIZE = int(os.environ.get('PREDICTION_MAX_INPUT_SIZE', 1333))
+PREDICTION_READ_PIXEL_BUDGET = int(os.environ.get('PREDICTION_READ_PIXEL_BUDGET', 64 * 1024 ** 2))
+# predict_tile reads and caches fixed grid cells of this many pixels, overlapping by PREDICTION_GRID_OVERLAP
+PREDICTION_GRID_CELL_SIZE = int(os.environ.get('PREDICTION_GRID_CELL_SIZE', 512))
+PREDICTION_GRID_OVERLAP = int(os.environ.get('PREDICTION_GRID_OVERLAP', 64))
+# Disk cache of raw prediction outputs, evicted least recently used past the size limit
+PREDICTION_CACHE_DIR = os.environ.get('PREDICTION_CACHE_DIR', os.path.join(MEDIA_ROOT, 'cache', 'predictions'))
+PREDICTION_CACHE_MAX_BYTES = int(os.environ.get('PREDICTION_CACHE_MAX_BYTES', 1024 ** 3))
+# Region prediction results and their owner records are deleted after this many seconds
+REGION_PREDICTION_RETENTION_SECONDS = int(os.environ.get('REGION_PREDICTION_RETENTION_SECONDS', 7 * 24 * 3600))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only allow all origins in debug mode
 CORS_ALLOW_CREDENTIALS = True